@@ -0,0 +1,219 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import xml.etree.ElementTree as ET
+import fitz  # PyMuPDF
+
+DATA_DIR = "."
+LABELS_DIR = "labels"
+OUTPUT_FILE = "auto_labels.jsonl"
+WORKERS = os.cpu_count() or 1
+NS = {"nfe": "http://www.portalfiscal.inf.br/nfe"}
+
+# Same merge rule as NATIVE_GAP_RATIO in inference.py, so training tokens are split the way the model sees them.
+GAP_RATIO = 0.5
+
+FIELDS = [
+    "CHAVE_ACESSO", "NOME_EMITENTE", "CNPJ_EMITENTE", "NOME_DESTINATARIO", "CNPJ_DESTINATARIO",
+    "DATA_EMISSAO", "VALOR_TOTAL", "NUM_NOTA_FISCAL", "NUM_SERIE"
+]
+
+# Values such as the total or the recipient repeat across the DANFE; the labeled one is the one in the cell under
+# its caption, like the rule extractor in inference/rules.py reads it.
+ANCHORS = {
+    "CHAVE_ACESSO": r'CHAVE\s+DE\s+ACESSO',
+    "CNPJ_EMITENTE": r'CNPJ\s*/\s*CPF',
+    "NOME_DESTINATARIO": r'NOME\s*/\s*RAZ[ÃA]O\s+SOCIAL',
+    "CNPJ_DESTINATARIO": r'CNPJ\s*/\s*CPF',
+    "DATA_EMISSAO": r'DATA\s+D[AE]\s+EMISS[ÃA]O',
+    "VALOR_TOTAL": r'VALOR\s+TOTAL\s+DA\s+NOTA'
+}
+
+# The number and series are printed with their caption in the same token; training/preprocess.py strips it.
+NUMBER_PATTERN = r'(?:n[º°oª\.]|num\.|nota\s*fiscal)\s*([\d.]+)'
+SERIES_PATTERN = r'(?:s[ée]rie|ser\.)\s*(\d+)'
+
+def xml_fields(xml_path):
+    inf_nfe = ET.parse(xml_path).getroot().find(".//nfe:infNFe", NS)
+
+    def text(path):
+        node = inf_nfe.find(path, NS)
+        return (node.text or "") if node is not None else ""
+
+    def document(party):
+        return text(f"nfe:{party}/nfe:CNPJ") or text(f"nfe:{party}/nfe:CPF")
+
+    return {
+        "CHAVE_ACESSO": inf_nfe.get("Id", "")[3:],
+        "NOME_EMITENTE": text("nfe:emit/nfe:xNome"),
+        "CNPJ_EMITENTE": document("emit"),
+        "NOME_DESTINATARIO": text("nfe:dest/nfe:xNome"),
+        "CNPJ_DESTINATARIO": document("dest"),
+        "DATA_EMISSAO": text("nfe:ide/nfe:dhEmi")[:10],
+        "VALOR_TOTAL": text("nfe:total/nfe:ICMSTot/nfe:vNF"),
+        "NUM_NOTA_FISCAL": text("nfe:ide/nfe:nNF"),
+        "NUM_SERIE": text("nfe:ide/nfe:serie")
+    }
+
+def page_segments(page):
+    segments, current = [], None
+    for x0, y0, x1, y1, text, block_no, line_no, _ in page.get_text("words"):
+        key = (block_no, line_no)
+        if current and current["key"] == key and x0 - current["box"][2] <= (y1 - y0) * GAP_RATIO:
+            current["text"] += " " + text
+            current["box"] = [min(current["box"][0], x0), min(current["box"][1], y0), max(current["box"][2], x1), max(current["box"][3], y1)]
+        else:
+            if current: segments.append(current)
+            current = {"key": key, "text": text, "box": [x0, y0, x1, y1]}
+    if current: segments.append(current)
+
+    for segment in segments:
+        rect = fitz.Rect(segment["box"]) * page.rotation_matrix
+        segment["box"] = [rect.x0, rect.y0, rect.x1, rect.y1]
+    return segments
+
+def _digits(text):
+    return re.sub(r'\D', '', text)
+
+def _same_number(text, value):
+    digits = _digits(text)
+    return bool(digits) and value.isdigit() and int(digits) == int(value)
+
+def _matches(label, value, text):
+    if not value: return False
+    if label in ("CHAVE_ACESSO", "CNPJ_EMITENTE", "CNPJ_DESTINATARIO"):
+        return bool(re.fullmatch(r'[\d\s./-]+', text)) and _digits(text) == value
+    if label in ("NUM_NOTA_FISCAL", "NUM_SERIE"):
+        match = re.fullmatch(NUMBER_PATTERN if label == "NUM_NOTA_FISCAL" else SERIES_PATTERN, text, re.IGNORECASE)
+        return bool(match) and _same_number(match.group(1), value)
+    if label == "DATA_EMISSAO":
+        year, month, day = value.split("-")
+        return text == f"{day}/{month}/{year}"
+    if label == "VALOR_TOTAL":
+        formatted = f"{float(value):,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+        return text.replace("R$", "").strip() == formatted
+    return " ".join(text.split()).casefold() == " ".join(value.split()).casefold()
+
+def _anchor_distance(anchors, segment):
+    x0, y0, x1, _ = segment["box"]
+    distances = [
+        (y0 - a["box"][3]) + abs(x0 - a["box"][0])
+        for a in anchors
+        if y0 >= a["box"][1] and x1 > a["box"][0] and x0 < a["box"][2]
+    ]
+    return min(distances, default=float("inf"))
+
+def _pick(label, candidates, segments):
+    if len(candidates) == 1 or label not in ANCHORS: return candidates[0]
+    anchors = [s for s in segments if re.fullmatch(ANCHORS[label], s["text"], re.IGNORECASE)]
+    return min(candidates, key=lambda i: _anchor_distance(anchors, segments[i]))
+
+def label_document(xml_path, pdf_path):
+    fields = xml_fields(xml_path)
+    with fitz.open(pdf_path) as doc:
+        page = doc.load_page(0)
+        segments = page_segments(page)
+        width, height = page.rect.width, page.rect.height
+
+    tags = ["O"] * len(segments)
+    missing = []
+    for label in FIELDS:
+        candidates = [i for i, s in enumerate(segments) if tags[i] == "O" and _matches(label, fields[label], s["text"])]
+        if not candidates:
+            missing.append(label)
+            continue
+        tags[_pick(label, candidates, segments)] = label
+
+    return {
+        "tokens": [s["text"] for s in segments],
+        # Fractions of the page, so they hold for any render dpi and go straight into albumentations.
+        "boxes": [[s["box"][0] / width, s["box"][1] / height, s["box"][2] / width, s["box"][3] / height] for s in segments],
+        "ner_tags": tags,
+        "faltando": missing
+    }
+
+def to_record(image_path, tokens, boxes, ner_tags):
+    # Same 0-1000 scale as NFeProcessor._build_page.
+    bboxes = [[max(0, min(1000, int(v * 1000))) for v in box] for box in boxes]
+    return {"image": image_path, "tokens": tokens, "bboxes": bboxes, "ner_tags": ner_tags}
+
+def document_labels(labels, image_path, augmented_path=None, augmented_boxes=None):
+    entry = {"original": to_record(image_path, labels["tokens"], labels["boxes"], labels["ner_tags"]), "faltando": labels["faltando"]}
+    if augmented_path is not None:
+        # Tokens pushed out of the frame by the augmentation are dropped together with their tag.
+        indices = [i for i, _ in augmented_boxes]
+        entry["aumentada"] = to_record(
+            augmented_path, [labels["tokens"][i] for i in indices], [box for _, box in augmented_boxes],
+            [labels["ner_tags"][i] for i in indices]
+        )
+    return entry
+
+def _label_original(task):
+    data_dir, name = task
+    labels = label_document(
+        os.path.join(data_dir, "generated_xmls", f"{name}.xml"), os.path.join(data_dir, "generated_pdfs", f"{name}.pdf")
+    )
+    return document_labels(labels, os.path.join("generated_images", f"{name}.jpg"))
+
+def _load_or_label(task):
+    data_dir, name = task
+    labels_path = os.path.join(data_dir, LABELS_DIR, f"{name}.json")
+    try:
+        if os.path.exists(labels_path):
+            with open(labels_path, encoding="utf-8") as f:
+                return name, json.load(f), None
+        return name, _label_original(task), None
+    except Exception as e:
+        return name, None, f"{type(e).__name__}: {e}"
+
+def collect(data_dir=DATA_DIR, output_path=None, workers=WORKERS):
+    output_path = output_path or os.path.join(data_dir, OUTPUT_FILE)
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    names = sorted(
+        os.path.splitext(f)[0] for f in os.listdir(os.path.join(data_dir, "generated_xmls"))
+        if f.endswith(".xml") and os.path.exists(os.path.join(data_dir, "generated_pdfs", os.path.splitext(f)[0] + ".pdf"))
+    )
+
+    summary = {"documentos": 0, "registros": 0, "erros": 0, "sem_aumentada": 0, "faltando": {}}
+    start = time.perf_counter()
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as out, multiprocessing.Pool(workers) as pool:
+        # Labeling one page takes milliseconds; chunks keep the inter-process traffic from dominating.
+        for name, entry, error in pool.imap(_load_or_label, ((data_dir, name) for name in names), chunksize=32):
+            if error:
+                summary["erros"] += 1
+                print(f"Erro em {name}: {error}", file=sys.stderr, flush=True)
+                continue
+
+            summary["documentos"] += 1
+            summary["sem_aumentada"] += int("aumentada" not in entry)
+            for label in entry["faltando"]:
+                summary["faltando"][label] = summary["faltando"].get(label, 0) + 1
+
+            for key in ("original", "aumentada"):
+                if key not in entry: continue
+                record = entry[key]
+                if not os.path.exists(os.path.join(data_dir, record["image"])): continue
+                # Image paths are stored relative to the JSONL file, which is how training/preprocess.py resolves them.
+                record["image"] = os.path.relpath(os.path.join(os.path.abspath(data_dir), record["image"]), output_dir)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                summary["registros"] += 1
+    os.replace(temp_path, output_path)
+
+    elapsed = time.perf_counter() - start
+    summary["docs_por_min"] = round(summary["documentos"] / elapsed * 60, 1) if elapsed else 0.0
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera anotações (tokens, bboxes, ner_tags) a partir dos XMLs, sem passar pelo Label Studio")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Pasta de saída do pipeline.py")
+    parser.add_argument("--output", default=None, help=f"JSONL de saída (padrão: <data-dir>/{OUTPUT_FILE})")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    print(json.dumps(collect(args.data_dir, args.output, args.workers), ensure_ascii=False))
@@ -1,33 +1,37 @@
 import fitz  # PyMuPDF
 import os
 
-dir_pdf = "./generated_pdfs/" 
+dir_pdf = "./generated_pdfs/"
 dir_img = "./generated_images/"
+DPI = 300
 
-if not os.path.exists(dir_img):
-    os.makedirs(dir_img)
+def pdf_to_image(caminho_pdf, caminho_jpg, dpi=DPI):
+    doc = fitz.open(caminho_pdf)
+    try:
+        page = doc.load_page(0)
+        pix = page.get_pixmap(dpi=dpi)
+        pix.save(caminho_jpg, "jpeg")
+    finally:
+        doc.close()
 
-print("Iniciando conversão de PDF para Imagem...")
+if __name__ == "__main__":
+    if not os.path.exists(dir_img):
+        os.makedirs(dir_img)
 
-for nome_arquivo in os.listdir(dir_pdf):
-    if nome_arquivo.endswith(".pdf"):
-        caminho_pdf = os.path.join(dir_pdf, nome_arquivo)
+    print("Iniciando conversão de PDF para Imagem...")
 
-        try:
-            doc = fitz.open(caminho_pdf)
-            page = doc.load_page(0) 
-            
-            pix = page.get_pixmap(dpi=300)
+    for nome_arquivo in os.listdir(dir_pdf):
+        if nome_arquivo.endswith(".pdf"):
+            caminho_pdf = os.path.join(dir_pdf, nome_arquivo)
 
-            nome_jpg = nome_arquivo.replace(".pdf", ".jpg")
-            caminho_jpg = os.path.join(dir_img, nome_jpg)
+            try:
+                nome_jpg = nome_arquivo.replace(".pdf", ".jpg")
+                caminho_jpg = os.path.join(dir_img, nome_jpg)
 
-            pix.save(caminho_jpg, "jpeg")
-            print(f"Convertido: {nome_jpg}")
+                pdf_to_image(caminho_pdf, caminho_jpg)
+                print(f"Convertido: {nome_jpg}")
 
-            doc.close()
+            except Exception as e:
+                print(f"Erro ao converter {nome_arquivo}: {e}")
 
-        except Exception as e:
-            print(f"Erro ao converter {nome_arquivo}: {e}")
-
-print("Conversão concluída!")
\ No newline at end of file
+    print("Conversão concluída!")
@@ -1,16 +1,16 @@
 import os
 import random
+import argparse
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from faker import Faker
 
 OUTPUT_DIR = "./generated_xmls/"
 FILE_COUNT = 5
+SEEDED_DATES_START = datetime(2024, 1, 1)
+SEEDED_DATES_DAYS = 730
 fake = Faker('pt_BR')
 
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
-
 PRODUCTS = [
     "Parafuso Sextavado", "Computador Gamer", "Servico de Manutencao", 
     "Cimento Votoran", "Coca Cola 2L", "Mouse Sem Fio", "Consultoria TI", 
@@ -36,11 +36,30 @@ def generate_entity_doc():
         name = fake.name()
         return doc, name, "CPF"
 
-def create_master_xml(index):
+def access_key_check_digit(digits):
+    # Mod 11 with weights 2..9 repeating from the right; remainders 0 and 1 give 0.
+    weights = [2 + (i % 8) for i in range(len(digits))][::-1]
+    remainder = sum(int(d) * w for d, w in zip(digits, weights)) % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+def build_access_key(ide, issuer_doc, issued_at):
+    # cUF + AAMM + CNPJ (a CPF is left-padded to 14) + mod + serie + nNF + tpEmis + cNF + cDV.
+    digits = (
+        ide.find("cUF").text + issued_at.strftime("%y%m") + issuer_doc.zfill(14) + ide.find("mod").text
+        + ide.find("serie").text.zfill(3) + ide.find("nNF").text.zfill(9) + ide.find("tpEmis").text
+        + ide.find("cNF").text.zfill(8)
+    )
+    return digits + str(access_key_check_digit(digits))
+
+def seeded_issue_date():
+    # Seeded runs draw the issue date instead of reading the clock; the date also goes into the access key.
+    return SEEDED_DATES_START + timedelta(seconds=random.randrange(SEEDED_DATES_DAYS * 86400))
+
+def build_master_xml(issued_at=None):
     print_type = random.choice(['1', '1', '1', '2']) 
     
     nfe = ET.Element("NFe", xmlns="http://www.portalfiscal.inf.br/nfe")
-    inf_nfe = ET.SubElement(nfe, "infNFe", Id=f"NFe{fake.random_number(digits=44)}", versao="4.00")
+    inf_nfe = ET.SubElement(nfe, "infNFe", versao="4.00")
     
     ide = ET.SubElement(inf_nfe, "ide")
     ET.SubElement(ide, "cUF").text = "35"
@@ -50,7 +69,7 @@ def create_master_xml(index):
     ET.SubElement(ide, "serie").text = str(random.randint(1, 999))
     ET.SubElement(ide, "nNF").text = str(random.randint(1, 999999))
     
-    base_date = datetime.now()
+    base_date = issued_at or datetime.now()
     ET.SubElement(ide, "dhEmi").text = base_date.isoformat()
     ET.SubElement(ide, "dhSaiEnt").text = (base_date + timedelta(hours=random.randint(1, 12))).isoformat()
     
@@ -59,7 +78,7 @@ def create_master_xml(index):
     ET.SubElement(ide, "cMunFG").text = "3550308"
     ET.SubElement(ide, "tpImp").text = print_type
     ET.SubElement(ide, "tpEmis").text = "1"
-    ET.SubElement(ide, "cDV").text = "0"
+    check_digit = ET.SubElement(ide, "cDV")
     ET.SubElement(ide, "tpAmb").text = "1"
     ET.SubElement(ide, "finNFe").text = "1"
     ET.SubElement(ide, "indFinal").text = "1"
@@ -71,6 +90,9 @@ def create_master_xml(index):
     doc, name, doc_type = generate_entity_doc()
     ET.SubElement(emit, doc_type).text = doc
     ET.SubElement(emit, "xNome").text = name
+    access_key = build_access_key(ide, doc, base_date)
+    inf_nfe.set("Id", f"NFe{access_key}")
+    check_digit.text = access_key[-1]
     if doc_type == "CNPJ": ET.SubElement(emit, "xFant").text = fake.company_suffix()
     
     addr_emit = ET.SubElement(emit, "enderEmit")
@@ -181,7 +203,7 @@ def create_master_xml(index):
     
     dup = ET.SubElement(billing, "dup")
     ET.SubElement(dup, "nDup").text = "001"
-    ET.SubElement(dup, "dVenc").text = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    ET.SubElement(dup, "dVenc").text = (base_date + timedelta(days=30)).strftime("%Y-%m-%d")
     ET.SubElement(dup, "vDup").text = format_value(total_nf_val)
 
     info = ET.SubElement(inf_nfe, "infAdic")
@@ -194,21 +216,38 @@ def create_master_xml(index):
     inf_prot = ET.SubElement(prot_nfe, "infProt")
     ET.SubElement(inf_prot, "tpAmb").text = "1"
     ET.SubElement(inf_prot, "verAplic").text = "App"
-    ET.SubElement(inf_prot, "chNFe").text = f"35{fake.random_number(digits=42)}"
-    ET.SubElement(inf_prot, "dhRecbto").text = datetime.now().isoformat()
+    ET.SubElement(inf_prot, "chNFe").text = access_key
+    ET.SubElement(inf_prot, "dhRecbto").text = base_date.isoformat()
     ET.SubElement(inf_prot, "nProt").text = str(fake.random_number(digits=15))
     ET.SubElement(inf_prot, "digVal").text = "VALIDO"
     ET.SubElement(inf_prot, "cStat").text = "100"
     ET.SubElement(inf_prot, "xMotivo").text = "Autorizado o uso da NF-e"
 
-    tree = ET.ElementTree(proc_nfe)
-    filename = os.path.join(OUTPUT_DIR, f"nfe_{index}.xml")
-    tree.write(filename, encoding="utf-8", xml_declaration=True)
+    return ET.ElementTree(proc_nfe)
+
+def write_xml(tree, xml_path):
+    tree.write(xml_path, encoding="utf-8", xml_declaration=True)
+
+def create_master_xml(index, output_dir=OUTPUT_DIR, issued_at=None):
+    write_xml(build_master_xml(issued_at), os.path.join(output_dir, f"nfe_{index}.xml"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera XMLs de NF-e sintéticos")
+    parser.add_argument("--count", type=int, default=FILE_COUNT)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        Faker.seed(args.seed)
+
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
 
-for f in os.listdir(OUTPUT_DIR):
-    os.remove(os.path.join(OUTPUT_DIR, f))
+    for f in os.listdir(OUTPUT_DIR):
+        os.remove(os.path.join(OUTPUT_DIR, f))
 
-print(f"Gerando {FILE_COUNT} NFe XMLs...")
-for i in range(FILE_COUNT):
-    create_master_xml(i)
-print(f"Sucesso ! Arquivos salvos em '{OUTPUT_DIR}'")
\ No newline at end of file
+    print(f"Gerando {args.count} NFe XMLs...")
+    for i in range(args.count):
+        create_master_xml(i, issued_at=seeded_issue_date() if args.seed is not None else None)
+    print(f"Sucesso ! Arquivos salvos em '{OUTPUT_DIR}'")
\ No newline at end of file
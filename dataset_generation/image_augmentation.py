@@ -1,13 +1,13 @@
 import cv2
 import os
+import random
+import argparse
 import numpy as np
 import albumentations as A
 
 INPUT_DIR = "./generated_images/"
 OUTPUT_DIR = "./dataset_images/"
-
-if not os.path.exists(OUTPUT_DIR):
-    os.makedirs(OUTPUT_DIR)
+MIN_BOX_VISIBILITY = 0.5
 
 transform = A.Compose([
     A.ShiftScaleRotate(
@@ -24,19 +24,41 @@ transform = A.Compose([
         A.ImageCompression(quality_lower=50, quality_upper=80, p=1),
 ], p=0.3),
     A.RandomBrightnessContrast(p=0.3),
-])
+], bbox_params=A.BboxParams(format="albumentations", label_fields=["indices"], min_visibility=MIN_BOX_VISIBILITY))
 
-arquivos = [f for f in os.listdir(INPUT_DIR) if f.endswith(('.jpg', '.png', '.jpeg'))]
+def _clip_box(box):
+    return [min(max(v, 0.0), 1.0) for v in box]
 
-for arq in arquivos:
-    caminho_img = os.path.join(INPUT_DIR, arq)
+def augment_image(caminho_img, caminho_saida, boxes=()):
+    # boxes are fractions of the image (x0, y0, x1, y1); the same geometric transform is applied to them.
     image = cv2.imread(caminho_img)
+    if image is None: raise ValueError(f"Could not read image '{caminho_img}'.")
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    augmented = transform(image=image)["image"]
-    augmented = cv2.cvtColor(augmented, cv2.COLOR_RGB2BGR)
-    
-    nome_saida = f"aug_{arq}"
-    cv2.imwrite(os.path.join(OUTPUT_DIR, nome_saida), augmented)
-
-print(f"Concluído! {len(arquivos)} imagens geradas em '{OUTPUT_DIR}'")
\ No newline at end of file
+
+    augmented = transform(image=image, bboxes=[_clip_box(box) for box in boxes], indices=list(range(len(boxes))))
+    cv2.imwrite(caminho_saida, cv2.cvtColor(augmented["image"], cv2.COLOR_RGB2BGR))
+
+    # Boxes mostly pushed out of the frame are dropped; the indices say which of the input boxes survived.
+    # Label fields come back as floats on albumentations 2.x.
+    return [(int(index), [float(v) for v in box]) for index, box in zip(augmented["indices"], augmented["bboxes"])]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aplica augmentations nas imagens das DANFEs")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+        transform.set_random_seed(args.seed)
+
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    arquivos = [f for f in sorted(os.listdir(INPUT_DIR)) if f.endswith(('.jpg', '.png', '.jpeg'))]
+
+    for arq in arquivos:
+        nome_saida = f"aug_{arq}"
+        augment_image(os.path.join(INPUT_DIR, arq), os.path.join(OUTPUT_DIR, nome_saida))
+
+    print(f"Concluído! {len(arquivos)} imagens geradas em '{OUTPUT_DIR}'")
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+import cv2
+import numpy as np
+from faker import Faker
+import generator_xml
+import generator_pdf
+import convert_to_img
+import image_augmentation
+import auto_label
+
+OUTPUT_DIR = "."
+DOCUMENT_COUNT = generator_xml.FILE_COUNT
+WORKERS = os.cpu_count() or 1
+MANIFEST = "pipeline.json"
+PROGRESS_INTERVAL = 5.0
+
+# Same folders the standalone scripts use, so training, labeling and the benchmark read the output unchanged.
+FOLDERS = {
+    "xml": "generated_xmls", "pdf": "generated_pdfs", "imagem": "generated_images", "aumentada": "dataset_images",
+    "rotulos": auto_label.LABELS_DIR
+}
+
+def stage_seed(seed, index, stage):
+    # Seeded per document and stage: the output does not depend on the worker count, on the order documents
+    # finish in, or on which stages a resumed run still has to do.
+    digest = hashlib.sha256(f"{seed}:{index}:{stage}".encode()).digest()
+    return int.from_bytes(digest[:4], "big")
+
+def _seed(seed, index, stage):
+    if seed is None: return
+    value = stage_seed(seed, index, stage)
+    random.seed(value)
+    np.random.seed(value)
+    Faker.seed(value)
+    # albumentations 2.x draws from its own generator, which the two seeds above do not reach.
+    image_augmentation.transform.set_random_seed(value)
+
+def document_paths(output_dir, index):
+    name = f"nfe_{index}"
+    return {
+        "xml": os.path.join(output_dir, FOLDERS["xml"], f"{name}.xml"),
+        "pdf": os.path.join(output_dir, FOLDERS["pdf"], f"{name}.pdf"),
+        "imagem": os.path.join(output_dir, FOLDERS["imagem"], f"{name}.jpg"),
+        "aumentada": os.path.join(output_dir, FOLDERS["aumentada"], f"aug_{name}.jpg"),
+        "rotulos": os.path.join(output_dir, FOLDERS["rotulos"], f"{name}.json")
+    }
+
+def _write(paths, writer):
+    # Written under a temporary name and renamed, so an interrupted run never leaves a truncated file that
+    # would be taken as done on resume. The extension is kept for writers that infer the format from it.
+    temp_paths = [f"{root}.{os.getpid()}.tmp{ext}" for root, ext in map(os.path.splitext, paths)]
+    try:
+        writer(*temp_paths)
+        for temp_path, path in zip(temp_paths, paths):
+            os.replace(temp_path, path)
+    finally:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path): os.remove(temp_path)
+
+def generate_document(index, seed, output_dir, dpi):
+    paths = document_paths(output_dir, index)
+
+    def xml_stage(temp_path):
+        _seed(seed, index, "xml")
+        issued_at = generator_xml.seeded_issue_date() if seed is not None else None
+        generator_xml.write_xml(generator_xml.build_master_xml(issued_at), temp_path)
+
+    def augmentation_stage(temp_image, temp_labels):
+        # The labels come from the XML and the PDF words, and the augmentation moves their boxes along with
+        # the pixels, so both images are annotated without OCR or manual labeling.
+        labels = auto_label.label_document(paths["xml"], paths["pdf"])
+        _seed(seed, index, "aumentada")
+        boxes = image_augmentation.augment_image(paths["imagem"], temp_image, labels["boxes"])
+
+        entry = auto_label.document_labels(labels, relative["imagem"], relative["aumentada"], boxes)
+        with open(temp_labels, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+
+    relative = {stage: os.path.relpath(path, output_dir) for stage, path in paths.items()}
+    stages = [
+        (["xml"], xml_stage),
+        (["pdf"], lambda temp_path: generator_pdf.xml_to_pdf(paths["xml"], temp_path)),
+        (["imagem"], lambda temp_path: convert_to_img.pdf_to_image(paths["pdf"], temp_path, dpi)),
+        (["aumentada", "rotulos"], augmentation_stage)
+    ]
+
+    start = time.perf_counter()
+    done = []
+    try:
+        for outputs, writer in stages:
+            if all(os.path.exists(paths[output]) for output in outputs): continue
+            _write([paths[output] for output in outputs], writer)
+            done.extend(outputs)
+    except Exception as e:
+        return {"indice": index, "status": "erro", "etapas": done, "erro": f"{type(e).__name__}: {e}"}
+    return {"indice": index, "status": "ok" if done else "existente", "etapas": done, "tempo_s": round(time.perf_counter() - start, 3)}
+
+def _generate(task):
+    return generate_document(*task)
+
+def _init_worker():
+    # One document per process at a time: OpenCV's own thread pool would only oversubscribe the CPUs.
+    cv2.setNumThreads(1)
+
+def prepare_output(output_dir, seed, dpi, fresh=False):
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    if fresh:
+        for folder in FOLDERS.values():
+            shutil.rmtree(os.path.join(output_dir, folder), ignore_errors=True)
+        if os.path.exists(manifest_path): os.remove(manifest_path)
+
+    config = {"seed": seed, "dpi": dpi}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous != config:
+            raise ValueError(f"'{output_dir}' was generated with {previous}, not {config}. Use --fresh to start over.")
+
+    for folder in FOLDERS.values():
+        folder = os.path.join(output_dir, folder)
+        os.makedirs(folder, exist_ok=True)
+        # Leftovers from a run that was killed mid-write.
+        for filename in os.listdir(folder):
+            if ".tmp." in filename: os.remove(os.path.join(folder, filename))
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+def run_pipeline(output_dir=OUTPUT_DIR, count=DOCUMENT_COUNT, start=0, seed=None, workers=WORKERS, dpi=convert_to_img.DPI,
+                 fresh=False, progress_interval=PROGRESS_INTERVAL):
+    prepare_output(output_dir, seed, dpi, fresh)
+
+    tasks = ((index, seed, output_dir, dpi) for index in range(start, start + count))
+    summary = {"ok": 0, "existente": 0, "erro": 0}
+    began = last_report = time.perf_counter()
+
+    # Each worker takes one document through every stage, so images come out while XMLs are still being generated.
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for result in pool.imap_unordered(_generate, tasks):
+            summary[result["status"]] += 1
+            if result["status"] == "erro":
+                print(f"Erro em nfe_{result['indice']}: {result['erro']}", file=sys.stderr, flush=True)
+
+            now = time.perf_counter()
+            finished = sum(summary.values())
+            if now - last_report >= progress_interval or finished == count:
+                last_report = now
+                print(f"{finished}/{count} documentos ({summary['ok'] / (now - began):.2f} novos/s, "
+                      f"{summary['existente']} já existentes, {summary['erro']} erros)", file=sys.stderr, flush=True)
+
+    summary["tempo_s"] = round(time.perf_counter() - began, 3)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera DANFEs sintéticas (XML -> PDF -> imagem -> augmentation) em paralelo")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--count", type=int, default=DOCUMENT_COUNT)
+    parser.add_argument("--start", type=int, default=0, help="Primeiro índice (nfe_<start>), para dividir a geração entre máquinas")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--dpi", type=int, default=convert_to_img.DPI)
+    parser.add_argument("--fresh", action="store_true", help="Apaga a saída anterior em vez de retomar")
+    args = parser.parse_args()
+
+    try:
+        summary = run_pipeline(args.output_dir, args.count, args.start, args.seed, args.workers, args.dpi, args.fresh)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    print(json.dumps(summary, ensure_ascii=False))
+    if summary["erro"]: sys.exit(1)
@@ -118,10 +118,23 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+BENCHMARK_RESULTS = "benchmark_results.json"
+
 @st.cache_resource
 def load_engine():
     return NFeProcessor()
 
+def measured_latency():
+    # Only report what benchmark_e2e.py actually measured on this machine.
+    if not os.path.exists(BENCHMARK_RESULTS): return "NOT MEASURED"
+    try:
+        with open(BENCHMARK_RESULTS, encoding="utf-8") as f:
+            modes = json.load(f)["modos"]
+        total = (modes.get("padrao") or next(iter(modes.values())))["latencia_ms"]["total"]
+        return f"p50 {total['p50']:.0f} ms / p95 {total['p95']:.0f} ms"
+    except (OSError, ValueError, KeyError, StopIteration):
+        return "NOT MEASURED"
+
 st.markdown("<h1>NFe Intelligence AI</h1>", unsafe_allow_html=True)
 st.markdown("<div class='subtitle'>Automated Fiscal Data Extraction System</div>", unsafe_allow_html=True)
 
@@ -131,12 +144,13 @@ with st.sidebar:
     with st.spinner("Initializing..."):
         nfe_engine = load_engine()
     
-    st.markdown("""
+    device = "CUDA (GPU)" if nfe_engine.device.type == "cuda" else "CPU"
+    st.markdown(f"""
     <div style='background-color: #1E2126; padding: 15px; border-radius: 4px; border: 1px solid #2D3139; font-size: 0.85rem; color: #ccc;'>
         <div><b>MODEL:</b> LayoutLMv3-FineTuned</div>
         <div style='margin-top: 8px;'><b>INFERENCE:</b> <span style='color:#00FFDD'>ACTIVE</span></div>
-        <div style='margin-top: 8px;'><b>DEVICE:</b> CUDA (GPU)</div>
-        <div style='margin-top: 8px;'><b>LATENCY:</b> LOW</div>
+        <div style='margin-top: 8px;'><b>DEVICE:</b> {device}</div>
+        <div style='margin-top: 8px;'><b>LATENCY:</b> {measured_latency()}</div>
     </div>
     """, unsafe_allow_html=True)
     
@@ -173,35 +187,46 @@ if uploaded_files:
         
         results_area = st.container()
 
-        for i, uploaded_file in enumerate(uploaded_files):
+        batch_size = nfe_engine.max_batch_size
 
-            status_text.markdown(f"<p class='status-text'>PROCESSING: {uploaded_file.name}...</p>", unsafe_allow_html=True)
-            progress_bar.progress((i + 1) / total_files)
+        for start in range(0, total_files, batch_size):
+            batch_files = uploaded_files[start:start + batch_size]
+            batch_names = ", ".join(f.name for f in batch_files)
+
+            status_text.markdown(f"<p class='status-text'>PROCESSING: {batch_names}...</p>", unsafe_allow_html=True)
             
-            temp_path = os.path.join(temp_dir, f"temp_{i}_{uploaded_file.name}")
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            temp_paths = []
+            for i, uploaded_file in enumerate(batch_files, start=start):
+                temp_path = os.path.join(temp_dir, f"temp_{i}_{uploaded_file.name}")
+                with open(temp_path, "wb") as f:
+                    f.write(uploaded_file.getbuffer())
+                temp_paths.append(temp_path)
 
             try:
-                raw_result = nfe_engine.process_file(temp_path)
-                formatted_result = utils.format_output(uploaded_file.name, raw_result)
-                results_list.append(formatted_result)
-
-                with results_area:
-                    status_label = "[SUCESSO]"
-                    if "erro" in str(formatted_result).lower() or "falha" in str(formatted_result).lower():
-                         status_label = "[FALHA]"
-                    
-                    expander_title = f"{uploaded_file.name} - {status_label}"
-                    
-                    with st.expander(expander_title, expanded=False):
-                        st.json(formatted_result)
+                raw_results = nfe_engine.process_batch(temp_paths)
+
+                for uploaded_file, raw_result in zip(batch_files, raw_results):
+                    formatted_result = utils.format_output(uploaded_file.name, raw_result)
+                    results_list.append(formatted_result)
+
+                    with results_area:
+                        status_label = "[SUCESSO]"
+                        if "erro" in str(formatted_result).lower() or "falha" in str(formatted_result).lower():
+                             status_label = "[FALHA]"
+                        
+                        expander_title = f"{uploaded_file.name} - {status_label}"
+                        
+                        with st.expander(expander_title, expanded=False):
+                            st.json(formatted_result)
 
             except Exception as e:
-                st.error(f"SYSTEM ERROR: {uploaded_file.name}")
+                st.error(f"SYSTEM ERROR: {batch_names}")
             
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            for temp_path in temp_paths:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            progress_bar.progress(min(start + batch_size, total_files) / total_files)
 
         progress_bar.progress(100)
         status_text.markdown("<p class='status-text' style='color:#00FFDD'>BATCH PROCESSING COMPLETED.</p>", unsafe_allow_html=True)
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import argparse
+import statistics
+import torch
+from transformers import AutoModelForTokenClassification
+import utils
+
+BACKENDS = ("torch-fp32", "torch-int8", "onnxruntime")
+ONNX_MODEL_PATH = "layoutlmv3-finetuned-nfe-onnx/model.onnx"
+ONNX_OPSET = 17
+
+class TorchBackend:
+    def __init__(self, model, device):
+        self.model = model.to(device).eval()
+        self.device = device
+
+    def __call__(self, batch):
+        batch = {k: v.to(self.device) for k, v in batch.items()}
+        with torch.no_grad():
+            return self.model(**batch).logits
+
+class OnnxBackend:
+    def __init__(self, onnx_path):
+        import onnxruntime
+
+        self.onnxruntime = onnxruntime
+        self.onnx_path = onnx_path
+        self.session = None
+        self.pid = None
+
+    def _session(self):
+        # Sessions own native thread pools that do not survive fork(), so each worker process builds its own.
+        if self.pid != os.getpid():
+            options = self.onnxruntime.SessionOptions()
+            options.intra_op_num_threads = torch.get_num_threads()
+            options.graph_optimization_level = self.onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = self.onnxruntime.InferenceSession(
+                self.onnx_path, options, providers=self.onnxruntime.get_available_providers()
+            )
+            self.input_names = {i.name for i in self.session.get_inputs()}
+            self.pid = os.getpid()
+        return self.session
+
+    def __call__(self, batch):
+        session = self._session()
+        feeds = {k: v.cpu().numpy() for k, v in batch.items() if k in self.input_names}
+        logits, = session.run(["logits"], feeds)
+        return torch.from_numpy(logits)
+
+class _LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, bbox, pixel_values):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, bbox=bbox, pixel_values=pixel_values).logits
+
+def load_backend(name, model_path, device, onnx_path=ONNX_MODEL_PATH):
+    if name == "onnxruntime":
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX model not found at '{onnx_path}'. Run: python backends.py export")
+        return OnnxBackend(onnx_path)
+
+    model = AutoModelForTokenClassification.from_pretrained(model_path)
+    if name == "torch-fp32":
+        return TorchBackend(model, device)
+    if name == "torch-int8":
+        # Dynamic quantization only has CPU kernels.
+        quantized = torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        return TorchBackend(quantized, torch.device("cpu"))
+    raise ValueError(f"Unknown backend '{name}'. Options: {', '.join(BACKENDS)}")
+
+def export_onnx(model_path, onnx_path=ONNX_MODEL_PATH, quantize=False, opset=ONNX_OPSET):
+    from transformers import AutoProcessor
+
+    processor = AutoProcessor.from_pretrained(model_path, apply_ocr=False)
+    model = AutoModelForTokenClassification.from_pretrained(model_path).eval()
+
+    size = processor.image_processor.size
+    dummy = (
+        torch.ones(1, 8, dtype=torch.long),
+        torch.ones(1, 8, dtype=torch.long),
+        torch.zeros(1, 8, 4, dtype=torch.long),
+        torch.zeros(1, 3, size["height"], size["width"])
+    )
+
+    directory = os.path.dirname(onnx_path)
+    if directory: os.makedirs(directory, exist_ok=True)
+
+    sequence_axes = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        _LogitsOnly(model), dummy, onnx_path,
+        input_names=["input_ids", "attention_mask", "bbox", "pixel_values"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": sequence_axes, "attention_mask": sequence_axes, "bbox": sequence_axes,
+            "pixel_values": {0: "batch"}, "logits": sequence_axes
+        },
+        opset_version=opset,
+        dynamo=False
+    )
+    exported = [onnx_path]
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        root, extension = os.path.splitext(onnx_path)
+        quantized_path = f"{root}.int8{extension}"
+        quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+        exported.append(quantized_path)
+
+    return exported
+
+def accuracy_latency_report(file_paths, backend_specs, repeats=1):
+    from inference import NFeProcessor, LABELS_LIST, MODEL_PATH
+
+    engine = NFeProcessor(result_cache=None)
+    documents, encodings = [], []
+    for file_path in file_paths:
+        document = engine._prepare(file_path)
+        documents.append(document)
+        encodings.append([engine._encode(page) for page in document["pages"]])
+
+    results, report = {}, {"documentos": len(file_paths), "backends": {}}
+    for spec in backend_specs:
+        name, _, onnx_path = spec.partition(":")
+        engine.backend = load_backend(name, MODEL_PATH, engine.device, onnx_path or ONNX_MODEL_PATH)
+        engine._infer(encodings[:1])
+
+        latencies, outputs = [], []
+        for _ in range(repeats):
+            outputs = []
+            for document, document_encodings in zip(documents, encodings):
+                start = time.perf_counter()
+                predictions, errors = engine._infer([document_encodings])
+                latencies.append((time.perf_counter() - start) * 1000)
+                outputs.append({"erro": errors[0]} if errors else engine._decode(document, document_encodings, predictions[0]))
+        results[spec] = outputs
+
+        latencies.sort()
+        report["backends"][spec] = {
+            "latencia_media_ms": round(statistics.mean(latencies), 2),
+            "latencia_p50_ms": round(statistics.median(latencies), 2),
+            "latencia_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2)
+        }
+
+    reference = results.get("torch-fp32")
+    if reference is not None:
+        baseline = report["backends"]["torch-fp32"]["latencia_media_ms"]
+        for spec, outputs in results.items():
+            entry = report["backends"][spec]
+            entry["concordancia_campos"] = round(utils.field_agreement(reference, outputs, LABELS_LIST[1:]), 4)
+            entry["speedup"] = round(baseline / entry["latencia_media_ms"], 2) if entry["latencia_media_ms"] else None
+    return report
+
+if __name__ == "__main__":
+    from inference import MODEL_PATH, ACCEPTED_EXTENSIONS
+
+    parser = argparse.ArgumentParser(description="Backends de inferência do LayoutLMv3")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Exporta o modelo para ONNX")
+    export.add_argument("--model", default=MODEL_PATH)
+    export.add_argument("--output", default=ONNX_MODEL_PATH)
+    export.add_argument("--quantize", action="store_true", help="Também gera uma versão INT8 (quantização dinâmica)")
+    export.add_argument("--opset", type=int, default=ONNX_OPSET)
+
+    report = subparsers.add_parser("report", help="Compara acurácia e latência de cada backend com o fp32")
+    # No default: the generated PDFs are the training data, and a report on them says nothing about held-out accuracy.
+    report.add_argument("--input", required=True, help="Pasta com documentos que não foram usados no treino")
+    report.add_argument("--backends", nargs="+", default=["torch-fp32", "torch-int8", f"onnxruntime:{ONNX_MODEL_PATH}"],
+                        help="Ex.: torch-fp32 torch-int8 onnxruntime:caminho/model.int8.onnx")
+    report.add_argument("--repeats", type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps({"exportado": export_onnx(args.model, args.output, args.quantize, args.opset)}, ensure_ascii=False))
+    else:
+        files = [os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.lower().endswith(ACCEPTED_EXTENSIONS)]
+        if not files:
+            print(json.dumps({"aviso": f"No files found in '{args.input}'."}))
+        else:
+            specs = args.backends if "torch-fp32" in args.backends else ["torch-fp32"] + args.backends
+            print(json.dumps(accuracy_latency_report(files, specs, args.repeats), indent=4, ensure_ascii=False))
@@ -0,0 +1,57 @@
+import re
+import cv2
+import numpy as np
+
+try:
+    import zxingcpp
+except ImportError:
+    zxingcpp = None
+
+try:
+    from pyzbar import pyzbar
+except ImportError:
+    pyzbar = None
+
+SEARCH_BAND = 0.35
+MASK_MARGIN = 8
+
+def available():
+    return zxingcpp is not None or pyzbar is not None
+
+def _read_zxing(grey):
+    found = []
+    for result in zxingcpp.read_barcodes(grey, formats=zxingcpp.BarcodeFormat.Code128):
+        corners = [result.position.top_left, result.position.top_right, result.position.bottom_right, result.position.bottom_left]
+        xs, ys = [p.x for p in corners], [p.y for p in corners]
+        found.append((result.text, (min(xs), min(ys), max(xs), max(ys))))
+    return found
+
+def _read_pyzbar(grey):
+    found = []
+    for result in pyzbar.decode(grey, symbols=[pyzbar.ZBarSymbol.CODE128]):
+        left, top, width, height = result.rect
+        found.append((result.data.decode("ascii", "ignore"), (left, top, left + width, top + height)))
+    return found
+
+def _read(grey):
+    return _read_zxing(grey) if zxingcpp is not None else _read_pyzbar(grey)
+
+def read_access_key(image):
+    if not available(): return None
+
+    grey = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    # The key barcode sits in the DANFE header; only scan the whole page when the header band has none.
+    band = grey[:int(grey.shape[0] * SEARCH_BAND)]
+    for region in (band, grey):
+        for text, box in _read(np.ascontiguousarray(region)):
+            digits = re.sub(r'\D', '', text)
+            if len(digits) == 44:
+                return {"key": digits, "box": box}
+    return None
+
+def mask(image, box, margin=MASK_MARGIN):
+    x1, y1, x2, y2 = box
+    height, width = image.shape[:2]
+    masked = image.copy()
+    masked[max(0, y1 - margin):min(height, y2 + margin), max(0, x1 - margin):min(width, x2 + margin)] = 255
+    return masked
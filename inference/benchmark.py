@@ -0,0 +1,118 @@
+import os
+import time
+import json
+import uuid
+import argparse
+import statistics
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+INPUT_FOLDER = "../dataset_generation/generated_pdfs"
+RENDER_DPI = 216
+REPEATS = 5
+SCALE_DPIS = [100, 144, 180, 216, 300]
+
+def rasterize_temp_png(file_path, dpi):
+    doc = fitz.open(file_path)
+    pix = doc.load_page(0).get_pixmap(dpi=dpi, alpha=False)
+    temp_name = f"temp_{uuid.uuid4()}.png"
+    pix.save(temp_name)
+    doc.close()
+    try:
+        image = Image.open(temp_name).convert("RGB")
+        grey = cv2.imread(temp_name, cv2.IMREAD_GRAYSCALE)
+        color = np.asarray(Image.open(temp_name).convert("RGB"))
+        return image.size, grey.shape, color.shape
+    finally:
+        os.remove(temp_name)
+
+def rasterize_in_memory(file_path, dpi):
+    with fitz.open(file_path) as doc:
+        pix = doc.load_page(0).get_pixmap(dpi=dpi, alpha=False)
+        image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image.shape, grey.shape
+
+def extract_native_text(file_path, dpi):
+    with fitz.open(file_path) as doc:
+        page = doc.load_page(0)
+        words = page.get_text("words")
+        pix = page.get_pixmap(dpi=72, alpha=False)
+    return len(words), (pix.height, pix.width)
+
+MODES = {
+    "temp_png": rasterize_temp_png,
+    "in_memory": rasterize_in_memory,
+    "native_text": extract_native_text,
+}
+
+def run_rasterization(files, dpi, repeats):
+    report = {}
+    for mode, func in MODES.items():
+        latencies = []
+        for _ in range(repeats):
+            for file_path in files:
+                start = time.perf_counter()
+                func(file_path, dpi)
+                latencies.append((time.perf_counter() - start) * 1000)
+        report[mode] = {
+            "pdfs": len(files),
+            "repeats": repeats,
+            "mean_ms": round(statistics.mean(latencies), 2),
+            "p50_ms": round(statistics.median(latencies), 2),
+            "max_ms": round(max(latencies), 2)
+        }
+    return report
+
+def run_scales(files, dpis):
+    from inference import NFeProcessor, LABELS_LIST
+    import utils
+
+    # The text layer of the generated PDFs is the reference every OCR scale is compared with.
+    engine = NFeProcessor(read_barcodes=False)
+    references = engine.process_batch(files)
+    engine.native_text = False
+
+    settings = [(str(dpi), dpi, False) for dpi in dpis] + [("adaptativo", RENDER_DPI, True)]
+    report = {}
+    for name, dpi, adaptive in settings:
+        engine.dpi, engine.adaptive_resolution = dpi, adaptive
+        engine.stage_timings = {}
+
+        latencies, outputs, pixels = [], [], []
+        for file_path in files:
+            pixels.extend(page["image"].shape[0] * page["image"].shape[1] for page in engine._load_pages(file_path))
+            start = time.perf_counter()
+            outputs.append(engine.process_file(file_path))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        timings = engine.timing_report()
+        report[name] = {
+            "megapixels_por_pagina": round(statistics.mean(pixels) / 1e6, 2),
+            "mean_ms": round(statistics.mean(latencies), 2),
+            "p50_ms": round(statistics.median(latencies), 2),
+            "ocr_ms": timings.get("ocr", {}).get("total_ms", 0.0),
+            "escalada_ms": timings.get("escalation", {}).get("total_ms", 0.0),
+            "concordancia_campos": round(utils.field_agreement(references, outputs, LABELS_LIST[1:]), 4)
+        }
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de latência do pipeline de extração")
+    parser.add_argument("--input", default=INPUT_FOLDER)
+    parser.add_argument("--dpi", type=int, default=RENDER_DPI)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--scales", nargs="*", type=int, default=None,
+                        help="Também mede OCR+extração em cada DPI (sem valores: %s) e no modo adaptativo" % SCALE_DPIS)
+    args = parser.parse_args()
+
+    pdfs = [os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.lower().endswith(".pdf")]
+    if not pdfs:
+        print(json.dumps({"aviso": f"No PDFs found in '{args.input}'."}))
+    else:
+        result = {"dpi": args.dpi, "rasterizacao": run_rasterization(pdfs, args.dpi, args.repeats)}
+        if args.scales is not None:
+            result["escalas"] = run_scales(pdfs, args.scales or SCALE_DPIS)
+        print(json.dumps(result, indent=4, ensure_ascii=False))
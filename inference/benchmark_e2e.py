@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+GENERATION_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dataset_generation"))
+GENERATION_WORKERS = os.cpu_count() or 1
+DATA_DIR = "benchmark_data"
+OUTPUT_PATH = "benchmark_results.json"
+DOCUMENT_COUNT = 20
+SEED = 42
+REPEATS = 1
+PERCENTILES = (50, 95, 99)
+REGRESSION_TOLERANCE = 0.10
+NS = {"nfe": "http://www.portalfiscal.inf.br/nfe"}
+
+MODES = {
+    "padrao": {},
+    "ocr": {"native_text": False},
+    "modelo": {"native_text": False, "rules_first": False},
+    "int8": {"native_text": False, "rules_first": False, "backend": "torch-int8"},
+    "onnx": {"native_text": False, "rules_first": False, "backend": "onnxruntime"},
+    "roi": {"native_text": False, "ocr_mode": "roi"},
+    "adaptativo": {"native_text": False, "adaptive_resolution": True}
+}
+DEFAULT_MODES = ["padrao", "ocr", "modelo"]
+
+FIELDS = [
+    "numero", "serie", "chave_acesso", "data_emissao", "emitente_cpf_cnpj", "emitente_razao_social",
+    "destinatario_cpf_cnpj", "destinatario_nome", "valor_total"
+]
+
+def generate_dataset(data_dir, count, seed, workers=GENERATION_WORKERS):
+    os.makedirs(data_dir, exist_ok=True)
+    command = [
+        sys.executable, os.path.join(GENERATION_DIR, "pipeline.py"), "--output-dir", os.path.abspath(data_dir),
+        "--count", str(count), "--seed", str(seed), "--workers", str(workers), "--fresh"
+    ]
+    subprocess.run(command, cwd=GENERATION_DIR, check=True, stdout=subprocess.DEVNULL)
+
+def ground_truth(xml_path):
+    root = ET.parse(xml_path).getroot()
+    inf_nfe = root.find(".//nfe:infNFe", NS)
+
+    def text(path):
+        node = inf_nfe.find(path, NS)
+        return node.text if node is not None else ""
+
+    def document(party):
+        return text(f"nfe:{party}/nfe:CNPJ") or text(f"nfe:{party}/nfe:CPF")
+
+    return {
+        "numero": text("nfe:ide/nfe:nNF"),
+        "serie": text("nfe:ide/nfe:serie"),
+        # The DANFE prints the key from the infNFe Id attribute.
+        "chave_acesso": inf_nfe.get("Id", "")[3:],
+        "data_emissao": text("nfe:ide/nfe:dhEmi")[:10],
+        "emitente_cpf_cnpj": document("emit"),
+        "emitente_razao_social": text("nfe:emit/nfe:xNome"),
+        "destinatario_cpf_cnpj": document("dest"),
+        "destinatario_nome": text("nfe:dest/nfe:xNome"),
+        "valor_total": text("nfe:total/nfe:ICMSTot/nfe:vNF")
+    }
+
+def flatten_output(output):
+    nfe = output.get("nfe", {})
+    general, issuer = nfe.get("informacoes_gerais", {}), nfe.get("emitente", {})
+    recipient, financial = nfe.get("destinatario", {}), nfe.get("financeiro", {})
+    return {
+        "numero": general.get("numero", ""),
+        "serie": general.get("serie", ""),
+        "chave_acesso": general.get("chave_acesso", ""),
+        "data_emissao": general.get("data_emissao", ""),
+        "emitente_cpf_cnpj": issuer.get("cpf_cnpj", ""),
+        "emitente_razao_social": issuer.get("razao_social", ""),
+        "destinatario_cpf_cnpj": recipient.get("cpf_cnpj", ""),
+        "destinatario_nome": recipient.get("nome", ""),
+        "valor_total": financial.get("valor_total", "")
+    }
+
+def _normalize(field, value):
+    value = str(value if value is not None else "")
+    if field in ("numero", "serie"):
+        digits = re.sub(r'\D', '', value)
+        return int(digits) if digits else None
+    if field in ("chave_acesso", "emitente_cpf_cnpj", "destinatario_cpf_cnpj"):
+        return re.sub(r'\D', '', value)
+    if field == "valor_total":
+        try:
+            return round(float(value), 2)
+        except ValueError:
+            return None
+    return " ".join(value.split()).casefold()
+
+def field_accuracy(pairs):
+    hits = {field: 0 for field in FIELDS}
+    for truth, output in pairs:
+        extracted = flatten_output(output)
+        for field in FIELDS:
+            expected = _normalize(field, truth[field])
+            hits[field] += int(expected not in (None, "") and _normalize(field, extracted[field]) == expected)
+
+    total = len(pairs)
+    return {
+        "geral": round(sum(hits.values()) / (total * len(FIELDS)), 4) if total else 0.0,
+        "campos": {field: round(count / total, 4) if total else 0.0 for field, count in hits.items()}
+    }
+
+def dataset_files(data_dir):
+    xml_dir = os.path.join(data_dir, "generated_xmls")
+    sources = {"pdf": ("generated_pdfs", ""), "imagem": ("dataset_images", "aug_")}
+
+    files = []
+    for source, (folder, prefix) in sources.items():
+        folder = os.path.join(data_dir, folder)
+        for filename in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            stem = os.path.splitext(filename)[0]
+            xml_path = os.path.join(xml_dir, stem[len(prefix):] + ".xml")
+            if stem.startswith(prefix) and os.path.exists(xml_path):
+                files.append((source, os.path.join(folder, filename), xml_path))
+    return files
+
+def _percentiles(samples):
+    values = np.percentile(samples, PERCENTILES)
+    return {"amostras": len(samples), **{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, values)}}
+
+def run_mode(engine_kwargs, file_paths, repeats):
+    from inference import NFeProcessor
+    import utils
+
+    engine = NFeProcessor(result_cache=None, ocr_cache=None, debug_timings=True, **engine_kwargs)
+    # Warm-up: lazy sessions, allocator growth and first-call kernels stay out of the measured run.
+    engine.process_file(file_paths[0])
+
+    samples, outputs = {}, []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        outputs = []
+        for offset in range(0, len(file_paths), engine.max_batch_size):
+            batch = file_paths[offset:offset + engine.max_batch_size]
+            for file_path, result in zip(batch, engine.process_batch(batch)):
+                timings = result.pop("tempos_ms", {})
+                for stage, elapsed in timings.items():
+                    samples.setdefault(stage, []).append(elapsed)
+                samples.setdefault("total", []).append(sum(timings.values()))
+                outputs.append(utils.format_output(os.path.basename(file_path), result))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "documentos": len(file_paths) * repeats,
+        "tempo_total_s": round(elapsed, 3),
+        "docs_por_s": round(len(file_paths) * repeats / elapsed, 3),
+        # ru_maxrss is in KiB on Linux; each mode runs in its own process so the peak is per mode.
+        "rss_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "latencia_ms": {stage: _percentiles(values) for stage, values in sorted(samples.items())},
+        "outputs": outputs
+    }
+
+def run_benchmark(files, modes, repeats):
+    report = {}
+    for name in modes:
+        # A fresh process per mode keeps model memory and caches from leaking into the next measurement.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = executor.submit(run_mode, MODES[name], [path for _, path, _ in files], repeats).result()
+
+        outputs = result.pop("outputs")
+        pairs = [(ground_truth(xml_path), output) for (_, _, xml_path), output in zip(files, outputs)]
+        result["erros"] = sum(1 for output in outputs if output["metadados"]["status"] == "erro")
+        result["acuracia"] = field_accuracy(pairs)
+        result["acuracia"]["por_fonte"] = {
+            source: field_accuracy([pair for (s, _, _), pair in zip(files, pairs) if s == source])["geral"]
+            for source in sorted({source for source, _, _ in files})
+        }
+        report[name] = result
+    return report
+
+def same_dataset(config, previous):
+    # Accuracy is only comparable on the same documents: a seeded run regenerates the identical corpus.
+    return all(config.get(key) == previous.get(key) for key in ("seed", "documentos"))
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    regressions = []
+    comparable = same_dataset(report["config"], baseline.get("config", {}))
+    for name, current in report["modos"].items():
+        previous = baseline.get("modos", {}).get(name)
+        if not previous: continue
+        checks = [
+            ("docs_por_s", current["docs_por_s"], previous["docs_por_s"], False),
+            ("p95_total_ms", current["latencia_ms"]["total"]["p95"], previous["latencia_ms"]["total"]["p95"], True),
+            ("rss_pico_mb", current["rss_pico_mb"], previous["rss_pico_mb"], True),
+        ]
+        if comparable: checks.append(("acuracia", current["acuracia"]["geral"], previous["acuracia"]["geral"], False))
+        for metric, value, reference, lower_is_better in checks:
+            if not reference: continue
+            change = (value - reference) / reference
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append({"modo": name, "metrica": metric, "atual": value, "base": reference, "variacao": round(change, 4)})
+    return regressions
+
+def environment():
+    import torch
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cpus": os.cpu_count(),
+        "cuda": torch.cuda.is_available(),
+        "plataforma": platform.platform(),
+        "commit": commit
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta com DANFEs sintéticas e gabarito dos XMLs")
+    parser.add_argument("--count", type=int, default=DOCUMENT_COUNT)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--no-generate", action="store_true", help="Usa os arquivos que já estão em --data-dir")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=DEFAULT_MODES)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--baseline", default=None, help="JSON de uma execução anterior para apontar regressões")
+    args = parser.parse_args()
+
+    if not args.no_generate:
+        generate_dataset(args.data_dir, args.count, args.seed)
+
+    files = dataset_files(args.data_dir)
+    if not files:
+        print(json.dumps({"aviso": f"No DANFEs with XML ground truth found in '{args.data_dir}'."}))
+        sys.exit(1)
+
+    report = {
+        "config": {
+            "documentos": len(files), "seed": None if args.no_generate else args.seed, "repeticoes": args.repeats,
+            "modos": args.modes, "ambiente": environment()
+        },
+        "modos": run_benchmark(files, args.modes, args.repeats)
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["regressoes"] = compare(report, baseline)
+        if not same_dataset(report["config"], baseline.get("config", {})):
+            print(json.dumps({"aviso": "Baseline used a different seed or document count; accuracy was not compared."}),
+                  file=sys.stderr)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(json.dumps(report, indent=4, ensure_ascii=False))
+    if report.get("regressoes"): sys.exit(2)
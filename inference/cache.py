@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import threading
+import numpy as np
+
+RESULT_CACHE_MAX_ENTRIES = 100000
+RESULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+FINGERPRINT_INLINE_LIMIT = 1024 * 1024
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def directory_fingerprint(path):
+    entries = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            stat = os.stat(file_path)
+            # Weights are too big to hash at every start; a retrained checkpoint keeps its size but not its mtime.
+            content = file_sha256(file_path) if stat.st_size <= FINGERPRINT_INLINE_LIMIT else stat.st_mtime_ns
+            entries.append((os.path.relpath(file_path, path), stat.st_size, content))
+    return sorted(entries)
+
+def fingerprint(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+class ResultCache:
+    def __init__(self, path, fingerprint, max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES):
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results(accessed)")
+        return conn
+
+    def reopen(self):
+        self.lock = threading.Lock()
+        self.conn = self._connect()
+
+    def _key(self, digest):
+        return f"{self.fingerprint}:{digest}"
+
+    def get(self, digest):
+        key = self._key(digest)
+        with self.lock:
+            row = self.conn.execute("SELECT payload FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, digest, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, payload, size, accessed) VALUES (?, ?, ?, ?)",
+                (self._key(digest), payload, len(payload), time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes: return
+
+        excess_entries = max(0, count - self.max_entries)
+        excess_bytes = max(0, total - self.max_bytes)
+        removed, freed = [], 0
+        for key, size in self.conn.execute("SELECT key, size FROM results ORDER BY accessed"):
+            if len(removed) >= excess_entries and freed >= excess_bytes: break
+            removed.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM results WHERE key = ?", removed)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM results")
+
+    def stats(self):
+        with self.lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
+
+class OCRCache:
+    def __init__(self, directory, fingerprint):
+        self.root = directory
+        self.directory = os.path.join(directory, fingerprint)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], f"{digest}.npz")
+
+    def load(self, digest):
+        path = self._path(digest)
+        if not os.path.exists(path):
+            self.misses += 1
+            return {}, {}
+
+        self.hits += 1
+        with np.load(path) as data:
+            pages = {int(p): [] for p in data["ocr_pages"]}
+            for page, bbox, text, prob in zip(data["page"], data["boxes"], data["texts"], data["probs"]):
+                pages[int(page)].append((bbox.tolist(), str(text), float(prob)))
+            scales = {p: s for p, s in zip(pages, data["scales"].tolist()) if s > 0} if "scales" in data else {}
+        return pages, scales
+
+    def save(self, digest, pages, scales=None):
+        rows = [(page, bbox, text, prob) for page, results in pages.items() for bbox, text, prob in results]
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez_compressed(
+            temp_path,
+            ocr_pages=np.array(sorted(pages), dtype=np.int32),
+            scales=np.array([(scales or {}).get(p, 0.0) for p in sorted(pages)], dtype=np.float64),
+            page=np.array([r[0] for r in rows], dtype=np.int32),
+            boxes=np.array([r[1] for r in rows], dtype=np.float32).reshape(-1, 4, 2),
+            texts=np.array([r[2] for r in rows], dtype=str),
+            probs=np.array([r[3] for r in rows], dtype=np.float32)
+        )
+        os.replace(temp_path, path)
+
+    def invalidate(self, digest=None):
+        if digest is None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            return
+        for entry in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            path = os.path.join(self.root, entry, digest[:2], f"{digest}.npz")
+            if os.path.exists(path): os.remove(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cache de OCR")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    warm = subparsers.add_parser("warm", help="Executa o OCR de uma pasta e salva no cache")
+    warm.add_argument("folder")
+    warm.add_argument("--cache-dir", required=True)
+
+    invalidate = subparsers.add_parser("invalidate", help="Remove entradas do cache")
+    invalidate.add_argument("files", nargs="*")
+    invalidate.add_argument("--cache-dir", required=True)
+    invalidate.add_argument("--all", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        from inference import NFeProcessor, ACCEPTED_EXTENSIONS
+
+        nfe_engine = NFeProcessor(ocr_cache=args.cache_dir)
+        files = [f for f in sorted(os.listdir(args.folder)) if f.lower().endswith(ACCEPTED_EXTENSIONS)]
+        for filename in files:
+            try:
+                nfe_engine._prepare(os.path.join(args.folder, filename))
+            except Exception as e:
+                print(json.dumps({"arquivo": filename, "erro": str(e)}, ensure_ascii=False), file=sys.stderr)
+
+        ocr_cache = nfe_engine.ocr_cache
+        print(json.dumps({"arquivos": len(files), "hits": ocr_cache.hits, "misses": ocr_cache.misses}))
+    else:
+        ocr_cache = OCRCache(args.cache_dir, "")
+        if args.all:
+            ocr_cache.invalidate()
+        else:
+            for file_path in args.files:
+                ocr_cache.invalidate(file_sha256(file_path))
+        print(json.dumps({"invalidado": "tudo" if args.all else len(args.files)}))
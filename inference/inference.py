@@ -2,12 +2,25 @@ import torch
 import easyocr
 import re
 import os
+import sys
 import fitz  # PyMuPDF
 import json
-import uuid
+import argparse
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from transformers import AutoModelForTokenClassification, AutoProcessor
+from transformers import AutoProcessor
 import utils  
+import cache
+import backends
+import rules
+import barcode
+import roi
+import scaling
+import metrics
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -15,6 +28,30 @@ INPUT_FOLDER = "documentos_entrada"
 ACCEPTED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.pdf')
 MODEL_PATH = "layoutlmv3-finetuned-nfe"
 CONFIDENCE_THRESHOLD = 0.50
+LOW_CONFIDENCE_THRESHOLD = 0.20
+LOW_CONFIDENCE_LABELS = ["NOME_DESTINATARIO", "VALOR_TOTAL", "CHAVE_ACESSO", "CNPJ_EMITENTE", "CNPJ_DESTINATARIO"]
+KEY_SEED_THRESHOLD = 0.4
+Y_TOLERANCE = 15
+X_GAP_LIMIT = 150
+RESULT_CACHE_PATH = None
+OCR_CACHE_DIR = None
+OCR_LANGUAGES = ['pt']
+RENDER_DPI = 216
+MAX_SEQ_LENGTH = 512
+MAX_BATCH_SIZE = 8
+MAX_BATCH_TOKENS = 4096
+WINDOW_STRIDE = 128
+RENDER_WORKERS = 4
+LAST_PAGE_FIELDS = ["VALOR_TOTAL"]
+NATIVE_RENDER_DPI = 72
+MIN_NATIVE_WORDS = 30
+NATIVE_GAP_RATIO = 0.5
+MODEL_BACKEND = "torch-fp32"
+RULES_FIRST = True
+READ_BARCODES = True
+OCR_MODE = "full"
+ADAPTIVE_RESOLUTION = False
+DEBUG_TIMINGS = False
 
 LABELS_LIST = [
     "O", "CHAVE_ACESSO", "NOME_EMITENTE", "CNPJ_EMITENTE",
@@ -24,27 +61,189 @@ LABELS_LIST = [
 id2label = {i: label for i, label in enumerate(LABELS_LIST)}
 
 class NFeProcessor:
-    def __init__(self):
-        print("Inicializando análise...", flush=True)
+    def __init__(self, dpi=RENDER_DPI, max_batch_size=MAX_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS,
+                 window_stride=WINDOW_STRIDE, render_workers=RENDER_WORKERS, native_text=True,
+                 result_cache=RESULT_CACHE_PATH, ocr_cache=OCR_CACHE_DIR, backend=MODEL_BACKEND,
+                 onnx_path=backends.ONNX_MODEL_PATH, rules_first=RULES_FIRST,
+                 read_barcodes=READ_BARCODES, ocr_mode=OCR_MODE, roi_template=roi.TEMPLATE_PATH,
+                 adaptive_resolution=ADAPTIVE_RESOLUTION, debug_timings=DEBUG_TIMINGS):
+        print("Inicializando análise...", file=sys.stderr, flush=True)
+        self.dpi = dpi
+        self.native_text = native_text
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.window_stride = window_stride
+        self.read_barcodes = read_barcodes and barcode.available()
+        self.ocr_mode = ocr_mode
+        self.adaptive_resolution = adaptive_resolution
+        self.roi_template = roi.load_template(roi_template) if ocr_mode == "roi" else None
+        self.stage_timings = {}
+        self.timing_lock = threading.Lock()
+        self.metrics = metrics.Metrics()
+        self.debug_timings = debug_timings
+        self.local = threading.local()
+        self.backend_name = f"{backend}:{onnx_path}" if backend == "onnxruntime" else backend
+        self.render_pool = ThreadPoolExecutor(max_workers=render_workers)
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         
-        self.reader = easyocr.Reader(['pt'], gpu=(self.device.type == 'cuda'), verbose=False)
+        self.reader = easyocr.Reader(OCR_LANGUAGES, gpu=(self.device.type == 'cuda'), verbose=False)
         self.processor = AutoProcessor.from_pretrained(MODEL_PATH, apply_ocr=False)
-        self.model = AutoModelForTokenClassification.from_pretrained(MODEL_PATH)
-        self.model.to(self.device)
-
-    def _convert_pdf_to_image(self, file_path):
+        self.backend = backends.load_backend(backend, MODEL_PATH, self.device, onnx_path)
+        self.tokenizer_lock = threading.Lock()
+
+        self.rules_first = rules_first
+        self.rule_stats = {"documentos": 0, "sem_modelo": 0}
+        self.rule_lock = threading.Lock()
+
+        self.result_cache = None
+        if result_cache:
+            self.result_cache = cache.ResultCache(result_cache, self._fingerprint())
+
+        self.ocr_cache = None
+        if ocr_cache:
+            self.ocr_cache = cache.OCRCache(ocr_cache, cache.fingerprint(
+                "easyocr", easyocr.__version__, OCR_LANGUAGES, self.dpi, self.read_barcodes, self.ocr_mode, self.roi_template,
+                self.adaptive_resolution
+            ))
+
+    def _fingerprint(self):
+        return cache.fingerprint(
+            cache.directory_fingerprint(MODEL_PATH), LABELS_LIST,
+            CONFIDENCE_THRESHOLD, LOW_CONFIDENCE_THRESHOLD, LOW_CONFIDENCE_LABELS,
+            KEY_SEED_THRESHOLD, Y_TOLERANCE, X_GAP_LIMIT,
+            self.dpi, self.window_stride, self.native_text, self.backend_name, self.rules_first, self.read_barcodes, self.ocr_mode, self.roi_template,
+            self.adaptive_resolution
+        )
+
+    @contextmanager
+    def _timed(self, stage):
+        start = time.perf_counter()
         try:
-            doc = fitz.open(file_path)
-            page = doc.load_page(0)
-            matrix = fitz.Matrix(3, 3)
-            pix = page.get_pixmap(matrix=matrix, alpha=False)
-            temp_name = f"temp_{uuid.uuid4()}.png"
-            pix.save(temp_name)
-            doc.close()
-            return temp_name, True
-        except Exception as e:
-            raise Exception(f"PDF Conversion Failed: {str(e)}")
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.timing_lock:
+                calls, total = self.stage_timings.get(stage, (0, 0.0))
+                self.stage_timings[stage] = (calls + 1, total + elapsed)
+            self.metrics.observe("stage_seconds", elapsed, stage=stage)
+
+            document_timings = getattr(self.local, "timings", None)
+            if document_timings is not None:
+                document_timings[stage] = document_timings.get(stage, 0.0) + elapsed
+
+    def _track(self, timings=None):
+        # Stages timed on this thread are also added to the given document's debug timings.
+        self.local.timings = timings
+
+    def timing_report(self):
+        with self.timing_lock:
+            return {
+                stage: {"chamadas": calls, "total_ms": round(total * 1000, 2), "media_ms": round(total * 1000 / calls, 2)}
+                for stage, (calls, total) in self.stage_timings.items()
+            }
+
+    def _native_words(self, page, dpi):
+        matrix = page.rotation_matrix * fitz.Matrix(dpi / 72, dpi / 72)
+        segments, current = [], None
+
+        for x0, y0, x1, y1, text, block_no, line_no, _ in page.get_text("words"):
+            key = (block_no, line_no)
+            if current and current["key"] == key and x0 - current["box"][2] <= (y1 - y0) * NATIVE_GAP_RATIO:
+                current["text"] += " " + text
+                current["box"] = [min(current["box"][0], x0), min(current["box"][1], y0), max(current["box"][2], x1), max(current["box"][3], y1)]
+            else:
+                if current: segments.append(current)
+                current = {"key": key, "text": text, "box": [x0, y0, x1, y1]}
+        if current: segments.append(current)
+
+        results = []
+        for segment in segments:
+            rect = fitz.Rect(segment["box"]) * matrix
+            bbox = [[rect.x0, rect.y0], [rect.x1, rect.y0], [rect.x1, rect.y1], [rect.x0, rect.y1]]
+            results.append((bbox, segment["text"], 1.0))
+        return results
+
+    @staticmethod
+    def _pixmap_array(pix):
+        return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+    def _render_pdf_page(self, pdf_bytes, page_index):
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            page = doc.load_page(page_index)
+            dpi, results = self.dpi, None
+
+            if self.native_text and len(page.get_text("words")) >= MIN_NATIVE_WORDS:
+                dpi = NATIVE_RENDER_DPI
+                results = self._native_words(page, dpi)
+            elif self.adaptive_resolution:
+                probe_scale = scaling.PROBE_DPI / 72
+                glyph_height = scaling.estimate_glyph_height(self._pixmap_array(page.get_pixmap(dpi=scaling.PROBE_DPI, alpha=False)))
+                dpi = round(72 * scaling.choose_scale(glyph_height / probe_scale if glyph_height else None, scaling.PDF_SCALE_RANGE))
+
+            pix = page.get_pixmap(dpi=dpi, alpha=False)
+        return {"image": self._pixmap_array(pix), "ocr": results, "source": ("pdf", pdf_bytes, page_index), "scale": dpi / 72}
+
+    def _load_pages(self, file_path):
+        if file_path.lower().endswith('.pdf'):
+            try:
+                with open(file_path, "rb") as f:
+                    pdf_bytes = f.read()
+                with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+                    page_count = doc.page_count
+
+                if page_count == 1:
+                    return [self._render_pdf_page(pdf_bytes, 0)]
+                return list(self.render_pool.map(lambda i: self._render_pdf_page(pdf_bytes, i), range(page_count)))
+            except Exception as e:
+                raise Exception(f"PDF Conversion Failed: {str(e)}")
+
+        with Image.open(file_path) as img:
+            image = np.asarray(img.convert("RGB"))
+        scale = scaling.probe_image_scale(image) if self.adaptive_resolution else 1.0
+        return [{"image": scaling.resize(image, scale), "ocr": None, "source": ("image", image), "scale": scale}]
+
+    def _rescale_page(self, page, scale):
+        kind, *source = page["source"]
+        if kind == "pdf":
+            pdf_bytes, page_index = source
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+                dpi = round(72 * scale)
+                image = self._pixmap_array(doc.load_page(page_index).get_pixmap(dpi=dpi, alpha=False))
+            scale = dpi / 72
+        else:
+            image = scaling.resize(source[0], scale)
+
+        ratio = image.shape[1] / page["image"].shape[1]
+        if page.get("barcode"):
+            page["barcode"] = {**page["barcode"], "box": tuple(int(v * ratio) for v in page["barcode"]["box"])}
+        page["image"], page["scale"] = image, scale
+
+    def _ocr_input(self, page):
+        # The barcode already gives the key; its bars are only noise for the detector.
+        if page.get("barcode"): return barcode.mask(page["image"], page["barcode"]["box"])
+        return page["image"]
+
+    def _escalate(self, page):
+        scale_range = scaling.PDF_SCALE_RANGE if page["source"][0] == "pdf" else scaling.IMAGE_SCALE_RANGE
+        for _ in range(scaling.MAX_ESCALATIONS):
+            confidence = scaling.mean_confidence(page["ocr"])
+            scale = scaling.next_scale(page["scale"], scale_range)
+            if confidence >= scaling.ESCALATE_BELOW_CONFIDENCE or scale is None: return
+
+            previous = (page["image"], page["scale"], page.get("barcode"), page["ocr"])
+            self._rescale_page(page, scale)
+            page["ocr"] = self._ocr_pages([self._ocr_input(page)])[0]
+            if scaling.mean_confidence(page["ocr"]) < confidence:
+                page["image"], page["scale"], page["barcode"], page["ocr"] = previous
+                return
+
+    def _ocr_pages(self, images):
+        if self.ocr_mode == "roi" and self.roi_template:
+            results = [roi.read_regions(self.reader, image, self.roi_template) for image in images]
+            return [r if r is not None else self.reader.readtext(image) for r, image in zip(results, images)]
+        if len(images) > 1 and len({image.shape for image in images}) == 1:
+            return self.reader.readtext_batched(images)
+        return [self.reader.readtext(image) for image in images]
 
     def _retrieve_highest_value(self, ocr_results):
         candidates = []
@@ -62,190 +261,506 @@ class NFeProcessor:
             return candidates[0][0]
         return None
 
-    def process_file(self, file_path):
-        temp_created = False
-        processing_path = file_path
+    def _build_page(self, image, results, barcode_key=None):
+        height, width = image.shape[:2]
 
-        try:
-            if file_path.lower().endswith('.pdf'):
-                processing_path, temp_created = self._convert_pdf_to_image(file_path)
+        words, boxes = [], []
+        header_text = "" 
 
-            image = Image.open(processing_path).convert("RGB")
-            width, height = image.size
+        for (bbox, text, prob) in results:
+            y_med = (bbox[0][1] + bbox[2][1]) / 2
+            if y_med < (height * 0.30): header_text += " " + text
             
-            results = self.reader.readtext(processing_path) 
-
-            words, boxes = [], []
-            header_text = "" 
-
-            for (bbox, text, prob) in results:
-                y_med = (bbox[0][1] + bbox[2][1]) / 2
-                if y_med < (height * 0.30): header_text += " " + text
-                
-                x_coords = [p[0] for p in bbox]
-                y_coords = [p[1] for p in bbox]
-                x1, y1, x2, y2 = min(x_coords), min(y_coords), max(x_coords), max(y_coords)
-                
-                norm_box = [
-                    int((x1 / width) * 1000), int((y1 / height) * 1000),
-                    int((x2 / width) * 1000), int((y2 / height) * 1000)
-                ]
-                norm_box = [max(0, min(1000, val)) for val in norm_box]
-                words.append(text); boxes.append(norm_box)
-
-            encoding = self.processor(image, words, boxes=boxes, return_tensors="pt", truncation=True)
-            for k,v in encoding.items(): encoding[k] = v.to(self.device)
+            x_coords = [p[0] for p in bbox]
+            y_coords = [p[1] for p in bbox]
+            x1, y1, x2, y2 = min(x_coords), min(y_coords), max(x_coords), max(y_coords)
             
-            with torch.no_grad(): 
-                outputs = self.model(**encoding)
-
-            probs = torch.nn.functional.softmax(outputs.logits, dim=-1)
-            scores, predictions = torch.max(probs, dim=-1)
-            scores = scores.squeeze().tolist()
-            preds = predictions.squeeze().tolist()
-            tokens = self.processor.tokenizer.convert_ids_to_tokens(encoding.input_ids.squeeze().tolist())
-            token_boxes = encoding.bbox.squeeze().tolist()
-
-            reconstructed_words = []
-            current_word_obj = None
-
-            if not isinstance(scores, list): 
-                scores, preds, tokens, token_boxes = [scores], [preds], [tokens], [token_boxes]
-
-            for p, s, t, b in zip(preds, scores, tokens, token_boxes):
-                if t in ["<s>", "</s>", "<pad>"]: continue
-                
-                is_start_of_word = t.startswith("Ġ") or t.startswith(" ")
-                clean_text = t.replace("Ġ", "").strip()
-                if not clean_text: continue 
-
-                if is_start_of_word or current_word_obj is None:
-                    if current_word_obj: reconstructed_words.append(current_word_obj)
-                    current_word_obj = {
-                        "text": clean_text,
-                        "label_id": p,
-                        "label_name": id2label[p],
-                        "score": s,
-                        "x_pos": b[0],
-                        "x_end": b[2], 
-                        "box": b 
-                    }
-                else:
-                    current_word_obj["text"] += clean_text
-                    current_word_obj["x_end"] = b[2] 
+            norm_box = [
+                int((x1 / width) * 1000), int((y1 / height) * 1000),
+                int((x2 / width) * 1000), int((y2 / height) * 1000)
+            ]
+            norm_box = [max(0, min(1000, val)) for val in norm_box]
+            words.append(text); boxes.append(norm_box)
+
+        return {"image": image, "ocr": results, "words": words, "boxes": boxes, "header_text": header_text, "barcode": barcode_key}
+
+    def _recognize(self, file_path, pages):
+        pending = [i for i, page in enumerate(pages) if page["ocr"] is None]
+        if pending and self.read_barcodes:
+            with self._timed("barcode"):
+                for i in pending: pages[i]["barcode"] = barcode.read_access_key(pages[i]["image"])
+
+        if pending:
+            digest = cache.file_sha256(file_path) if self.ocr_cache else None
+            cached, cached_scales = self.ocr_cache.load(digest) if digest else ({}, {})
+            missing = [i for i in pending if i not in cached]
+            if digest: self.metrics.inc("cache_requests_total", cache="ocr", result="miss" if missing else "hit")
+
+            for i in pending:
+                if i not in cached: continue
+                # Cached boxes are in the coordinates of the scale they were read at, escalations included.
+                if i in cached_scales and abs(cached_scales[i] - pages[i]["scale"]) > 1e-6:
+                    self._rescale_page(pages[i], cached_scales[i])
+                pages[i]["ocr"] = cached[i]
+            if missing:
+                with self._timed("ocr"):
+                    for i, results in zip(missing, self._ocr_pages([self._ocr_input(pages[i]) for i in missing])):
+                        pages[i]["ocr"] = results
+                if self.adaptive_resolution:
+                    with self._timed("escalation"):
+                        for i in missing: self._escalate(pages[i])
+
+            if digest and missing:
+                self.ocr_cache.save(digest, {i: pages[i]["ocr"] for i in pending}, {i: pages[i]["scale"] for i in pending})
+
+        return {"pages": [self._build_page(page["image"], page["ocr"], page.get("barcode")) for page in pages]}
+
+    def _prepare(self, file_path):
+        with self._timed("render"):
+            pages = self._load_pages(file_path)
+        self.metrics.inc("pages_total", len(pages))
+        return self._recognize(file_path, pages)
+
+    def _apply_rules(self, document):
+        if not self.rules_first: return None
+
+        with self._timed("rules"):
+            data = rules.extract(document["pages"], LAST_PAGE_FIELDS)
+        complete = rules.is_complete(data)
+        self.metrics.inc("rules_total", result="complete" if complete else "incomplete")
+        with self.rule_lock:
+            self.rule_stats["documentos"] += 1
+            self.rule_stats["sem_modelo"] += int(complete)
+        return data if complete else None
+
+    def rule_report(self):
+        with self.rule_lock:
+            total, skipped = self.rule_stats["documentos"], self.rule_stats["sem_modelo"]
+        return {"documentos": total, "sem_modelo": skipped, "taxa_sem_modelo": round(skipped / total, 3) if total else 0.0}
+
+    def _window_spans(self, word_spans):
+        budget = MAX_SEQ_LENGTH - 2
+        spans = list(word_spans.values())
+
+        if self.window_stride is None:
+            end = spans[-1][1] if spans else 1
+            return [(1, min(end, budget + 1))]
+
+        windows, start = [], 0
+        while start < len(spans):
+            end = start
+            while end < len(spans) and spans[end][1] - spans[start][0] <= budget: end += 1
+            if end == start: end = start + 1
+            windows.append((spans[start][0], min(spans[end - 1][1], spans[start][0] + budget)))
+            if end >= len(spans): break
+
+            next_start = end
+            while next_start - 1 > start and spans[end - 1][1] - spans[next_start - 1][0] <= self.window_stride:
+                next_start -= 1
+            start = next_start
+
+        return windows or [(1, 1)]
+
+    def _encode(self, page):
+        tokenizer = self.processor.tokenizer
+        with self.tokenizer_lock:
+            encoding = tokenizer(page["words"], boxes=page["boxes"], verbose=False)
+        input_ids, bbox, word_ids = encoding["input_ids"], encoding["bbox"], encoding.word_ids()
+        self.metrics.inc("tokens_total", len(input_ids))
+        if len(input_ids) > MAX_SEQ_LENGTH:
+            self.metrics.inc("truncations_total", handling="truncated" if self.window_stride is None else "windowed")
+        pixel_values = self.processor.image_processor(page["image"])["pixel_values"][0]
+
+        word_spans = {}
+        for i, word_id in enumerate(word_ids):
+            if word_id is None: continue
+            if word_id not in word_spans: word_spans[word_id] = [i, i + 1]
+            word_spans[word_id][1] = i + 1
+
+        windows = []
+        for start, end in self._window_spans(word_spans):
+            windows.append({
+                "input_ids": [tokenizer.cls_token_id] + input_ids[start:end] + [tokenizer.sep_token_id],
+                "bbox": [[0, 0, 0, 0]] + bbox[start:end] + [[0, 0, 0, 0]],
+                "pixel_values": pixel_values,
+                "offset": start - 1
+            })
+
+        return {"input_ids": input_ids, "bbox": bbox, "word_ids": word_ids, "windows": windows}
+
+    def _make_batches(self, encodings):
+        order = sorted(range(len(encodings)), key=lambda i: len(encodings[i]["input_ids"]))
+        batches, current, current_len = [], [], 0
+
+        for i in order:
+            length = len(encodings[i]["input_ids"])
+            padded_tokens = max(current_len, length) * (len(current) + 1)
+            if current and (len(current) >= self.max_batch_size or padded_tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_len = [], 0
+            current.append(i)
+            current_len = max(current_len, length)
+
+        if current: batches.append(current)
+        return batches
+
+    def _forward(self, encodings):
+        with self.tokenizer_lock:
+            batch = self.processor.tokenizer.pad(
+                [{"input_ids": e["input_ids"], "bbox": e["bbox"]} for e in encodings], return_tensors="pt"
+            )
+        batch["pixel_values"] = torch.stack([torch.as_tensor(e["pixel_values"]) for e in encodings])
+
+        logits = self.backend(dict(batch))
+
+        probs = torch.nn.functional.softmax(logits, dim=-1)
+        scores, predictions = torch.max(probs, dim=-1)
+        scores, predictions = scores.cpu().tolist(), predictions.cpu().tolist()
+
+        return [
+            (scores[i][:len(e["input_ids"])], predictions[i][:len(e["input_ids"])])
+            for i, e in enumerate(encodings)
+        ]
+
+    def _merge_windows(self, encoding, predictions):
+        word_ids = encoding["word_ids"]
+        best = {}
+
+        for k, (window, (scores, preds)) in enumerate(zip(encoding["windows"], predictions)):
+            previous = None
+            for j in range(1, len(window["input_ids"]) - 1):
+                word_id = word_ids[window["offset"] + j]
+                if word_id is not None and word_id != previous:
+                    if word_id not in best or scores[j] > best[word_id][0]:
+                        best[word_id] = (scores[j], k)
+                previous = word_id
+
+        merged = {"input_ids": [], "bbox": [], "scores": [], "preds": []}
+        for i, word_id in enumerate(word_ids):
+            if word_id not in best: continue
+            window = encoding["windows"][best[word_id][1]]
+            scores, preds = predictions[best[word_id][1]]
+            j = i - window["offset"]
+            if j >= len(window["input_ids"]) - 1: continue
+
+            merged["input_ids"].append(encoding["input_ids"][i])
+            merged["bbox"].append(encoding["bbox"][i])
+            merged["scores"].append(scores[j])
+            merged["preds"].append(preds[j])
+
+        return merged
+
+    def _decode_page(self, page, encoding, predictions):
+        header_text = page["header_text"]
+        merged = self._merge_windows(encoding, predictions)
+        scores, preds = merged["scores"], merged["preds"]
+        with self.tokenizer_lock:
+            tokens = self.processor.tokenizer.convert_ids_to_tokens(merged["input_ids"])
+        token_boxes = merged["bbox"]
+
+        reconstructed_words = []
+        current_word_obj = None
+
+        for p, s, t, b in zip(preds, scores, tokens, token_boxes):
+            if t in ["<s>", "</s>", "<pad>"]: continue
+            
+            is_start_of_word = t.startswith("Ġ") or t.startswith(" ")
+            clean_text = t.replace("Ġ", "").strip()
+            if not clean_text: continue 
+
+            if is_start_of_word or current_word_obj is None:
+                if current_word_obj: reconstructed_words.append(current_word_obj)
+                current_word_obj = {
+                    "text": clean_text,
+                    "label_id": p,
+                    "label_name": id2label[p],
+                    "score": s,
+                    "x_pos": b[0],
+                    "x_end": b[2], 
+                    "box": b 
+                }
+            else:
+                current_word_obj["text"] += clean_text
+                current_word_obj["x_end"] = b[2] 
 
-            if current_word_obj: reconstructed_words.append(current_word_obj)
+        if current_word_obj: reconstructed_words.append(current_word_obj)
 
-            confident_keys = [w for w in reconstructed_words if w["label_name"] == "CHAVE_ACESSO" and w["score"] > 0.4]
-            
-            if confident_keys:
+        confident_keys = [w for w in reconstructed_words if w["label_name"] == "CHAVE_ACESSO" and w["score"] > KEY_SEED_THRESHOLD]
+        
+        if confident_keys and not page["barcode"]:
 
-                cluster_y1 = min([w["box"][1] for w in confident_keys])
-                cluster_y2 = max([w["box"][3] for w in confident_keys])
+            cluster_y1 = min([w["box"][1] for w in confident_keys])
+            cluster_y2 = max([w["box"][3] for w in confident_keys])
 
-                avg_y_center = (sum([w["box"][1] for w in confident_keys]) + sum([w["box"][3] for w in confident_keys])) / (2 * len(confident_keys))
+            avg_y_center = (sum([w["box"][1] for w in confident_keys]) + sum([w["box"][3] for w in confident_keys])) / (2 * len(confident_keys))
 
-                cluster_x_min = min([w["box"][0] for w in confident_keys])
-                cluster_x_max = max([w["box"][2] for w in confident_keys])
+            cluster_x_min = min([w["box"][0] for w in confident_keys])
+            cluster_x_max = max([w["box"][2] for w in confident_keys])
 
-                Y_TOLERANCE = 15
-                X_GAP_LIMIT = 150
+            for w in reconstructed_words:
+                if w["label_name"] != "CHAVE_ACESSO":
+                    if not (re.fullmatch(r'\d{4}', w["text"]) or (w["text"].isdigit() and len(w["text"]) >= 2)):
+                        continue
 
-                for w in reconstructed_words:
-                    if w["label_name"] != "CHAVE_ACESSO":
-                        if not (re.fullmatch(r'\d{4}', w["text"]) or (w["text"].isdigit() and len(w["text"]) >= 2)):
-                            continue
+                    w_y_center = (w["box"][1] + w["box"][3]) / 2
+                    if abs(w_y_center - avg_y_center) > Y_TOLERANCE:
+                        continue
 
-                        w_y_center = (w["box"][1] + w["box"][3]) / 2
-                        if abs(w_y_center - avg_y_center) > Y_TOLERANCE:
-                            continue
+                    dist_to_left = abs(w["box"][2] - cluster_x_min) 
+                    dist_to_right = abs(w["box"][0] - cluster_x_max) 
+                    
 
-                        dist_to_left = abs(w["box"][2] - cluster_x_min) 
-                        dist_to_right = abs(w["box"][0] - cluster_x_max) 
+                    if dist_to_left < X_GAP_LIMIT or dist_to_right < X_GAP_LIMIT:
+                        w["label_name"] = "CHAVE_ACESSO"
+                        w["score"] = 0.95 
                         
+                        cluster_x_min = min(cluster_x_min, w["box"][0])
+                        cluster_x_max = max(cluster_x_max, w["box"][2])
 
-                        if dist_to_left < X_GAP_LIMIT or dist_to_right < X_GAP_LIMIT:
-                            w["label_name"] = "CHAVE_ACESSO"
-                            w["score"] = 0.95 
-                            
-                            cluster_x_min = min(cluster_x_min, w["box"][0])
-                            cluster_x_max = max(cluster_x_max, w["box"][2])
+        final_data = {}
+        if page["barcode"]: final_data["CHAVE_ACESSO"] = [(page["barcode"]["key"], 0)]
+        
+        for word in reconstructed_words:
+            label_name = word["label_name"]
+            score = word["score"]
 
-            final_data = {}
+            limit = LOW_CONFIDENCE_THRESHOLD if label_name in LOW_CONFIDENCE_LABELS else CONFIDENCE_THRESHOLD
             
-            for word in reconstructed_words:
-                label_name = word["label_name"]
-                score = word["score"]
-
-                limit = 0.20 if label_name in ["NOME_DESTINATARIO", "VALOR_TOTAL", "CHAVE_ACESSO", "CNPJ_EMITENTE", "CNPJ_DESTINATARIO"] else CONFIDENCE_THRESHOLD
-                
-                if label_name == "O" or score < limit: continue
-                
-                if label_name not in final_data: final_data[label_name] = []
-                final_data[label_name].append((word["text"], word["x_pos"]))
-
-            match_invoice = re.search(r'(\d{3}\.\d{3}\.\d{3})', header_text)
-            if match_invoice: final_data["NUM_NOTA_FISCAL"] = [(match_invoice.group(1), 0)]
-            match_series = re.search(r'(?i)S[ÉE]RIE[:\s]*(\d+)', header_text)
-            if match_series: final_data["NUM_SERIE"] = [(match_series.group(1), 0)]
-
-            processed_data = {}
-            for label, parts in final_data.items():
-                parts.sort(key=lambda x: x[1])
-                
-                text = " ".join([p[0] for p in parts]).strip()
-                
-                text = utils.fix_encoding(text) 
-                
-                if label == "CHAVE_ACESSO":
-                    clean = re.sub(r'\D', '', text)
-                    if len(clean) > 44: clean = clean[:44]
-                    text = ' '.join([clean[i:i+4] for i in range(0, len(clean), 4)])
-                
-                final_text = utils.clean_field(label, text)
-                
-                if len(final_text) > 1:
-                    processed_data[label] = final_text
+            if label_name == "O" or score < limit: continue
+            if label_name == "CHAVE_ACESSO" and page["barcode"]: continue
+            
+            if label_name not in final_data: final_data[label_name] = []
+            final_data[label_name].append((word["text"], word["x_pos"]))
 
+        match_invoice = re.search(r'(\d{3}\.\d{3}\.\d{3})', header_text)
+        if match_invoice: final_data["NUM_NOTA_FISCAL"] = [(match_invoice.group(1), 0)]
+        match_series = re.search(r'(?i)S[ÉE]RIE[:\s]*(\d+)', header_text)
+        if match_series: final_data["NUM_SERIE"] = [(match_series.group(1), 0)]
 
-            value_in_output = processed_data.get("VALOR_TOTAL", "")
-            if not value_in_output:
-                recovered_value = self._retrieve_highest_value(results)
-                if recovered_value: processed_data["VALOR_TOTAL"] = recovered_value
+        processed_data = {}
+        for label, parts in final_data.items():
+            parts.sort(key=lambda x: x[1])
+            
+            text = " ".join([p[0] for p in parts]).strip()
+            
+            text = utils.fix_encoding(text) 
+            
+            if label == "CHAVE_ACESSO":
+                clean = re.sub(r'\D', '', text)
+                if len(clean) > 44: clean = clean[:44]
+                text = ' '.join([clean[i:i+4] for i in range(0, len(clean), 4)])
             
-            return processed_data
+            final_text = utils.clean_field(label, text)
+            
+            if len(final_text) > 1:
+                processed_data[label] = final_text
+
+        return processed_data
+
+    def _decode(self, document, encodings, predictions):
+        pages = document["pages"]
+        page_data = [self._decode_page(*args) for args in zip(pages, encodings, predictions)]
+
+        processed_data = {}
+        for label in LABELS_LIST[1:]:
+            ordered = reversed(page_data) if label in LAST_PAGE_FIELDS else page_data
+            for data in ordered:
+                if data.get(label):
+                    processed_data[label] = data[label]
+                    break
+
+        value_in_output = processed_data.get("VALOR_TOTAL", "")
+        if not value_in_output:
+            for page in reversed(pages):
+                recovered_value = self._retrieve_highest_value(page["ocr"])
+                if recovered_value:
+                    processed_data["VALOR_TOTAL"] = recovered_value
+                    break
+
+        rules.apply_access_key(processed_data)
+        return processed_data
+
+    def _infer(self, encodings, timings=None):
+        windows = [
+            (d, p, k)
+            for d, pages in enumerate(encodings)
+            for p, encoding in enumerate(pages)
+            for k in range(len(encoding["windows"]))
+        ]
+        predictions = [[[None] * len(encoding["windows"]) for encoding in pages] for pages in encodings]
+        errors = {}
+
+        for batch in self._make_batches([encodings[d][p]["windows"][k] for d, p, k in windows]):
+            batch_windows = [windows[i] for i in batch]
+            start = time.perf_counter()
+            try:
+                with self._timed("forward"):
+                    window_predictions = self._forward([encodings[d][p]["windows"][k] for d, p, k in batch_windows])
+                for (d, p, k), prediction in zip(batch_windows, window_predictions):
+                    predictions[d][p][k] = prediction
+            except Exception as e:
+                self.metrics.inc("errors_total", exception=type(e).__name__)
+                for d, p, k in batch_windows: errors[d] = str(e)
+
+            if timings:
+                # A batch mixes windows from several documents; each one is charged its share.
+                share = (time.perf_counter() - start) / len(batch_windows)
+                for d, _, _ in batch_windows: timings[d]["forward"] = timings[d].get("forward", 0.0) + share
+
+        return predictions, errors
+
+    def _process_chunk(self, file_paths, timings=None):
+        outputs = [None] * len(file_paths)
+        documents, encodings, positions = [], [], []
+
+        for i, file_path in enumerate(file_paths):
+            self._track(timings[i] if timings else None)
+            try:
+                document = self._prepare(file_path)
+                outputs[i] = self._apply_rules(document)
+                if outputs[i] is not None: continue
+                with self._timed("encode"):
+                    encodings.append([self._encode(page) for page in document["pages"]])
+                documents.append(document)
+                positions.append(i)
+            except Exception as e:
+                self.metrics.inc("errors_total", exception=type(e).__name__)
+                outputs[i] = {"erro": str(e)}
+        self._track()
+
+        predictions, errors = self._infer(encodings, [timings[i] for i in positions] if timings else None)
+        for d, message in errors.items():
+            outputs[positions[d]] = {"erro": message}
+
+        for d, document in enumerate(documents):
+            if outputs[positions[d]] is not None: continue
+            self._track(timings[positions[d]] if timings else None)
+            try:
+                with self._timed("decode"):
+                    outputs[positions[d]] = self._decode(document, encodings[d], predictions[d])
+            except Exception as e:
+                self.metrics.inc("errors_total", exception=type(e).__name__)
+                outputs[positions[d]] = {"erro": str(e)}
+        self._track()
+
+        return outputs
+
+    def process_batch(self, file_paths):
+        results = [None] * len(file_paths)
+        timings = [{} for _ in file_paths] if self.debug_timings else None
+        digests = {}
+        pending = []
+
+        for i, file_path in enumerate(file_paths):
+            if self.result_cache:
+                self._track(timings[i] if timings else None)
+                try:
+                    with self._timed("result_cache"):
+                        digests[i] = cache.file_sha256(file_path)
+                        results[i] = self.result_cache.get(digests[i])
+                except OSError:
+                    pass
+                self.metrics.inc("cache_requests_total", cache="result", result="miss" if results[i] is None else "hit")
+            if results[i] is None: pending.append(i)
+        self._track()
+
+        for start in range(0, len(pending), self.max_batch_size):
+            chunk = pending[start:start + self.max_batch_size]
+            chunk_timings = [timings[i] for i in chunk] if timings else None
+            for i, result in zip(chunk, self._process_chunk([file_paths[i] for i in chunk], chunk_timings)):
+                results[i] = result
+                if i in digests and "erro" not in result:
+                    self.result_cache.put(digests[i], result)
+
+        for result in results:
+            self.metrics.inc("documents_total", status="erro" if "erro" in result else "sucesso")
+        if timings:
+            results = [
+                {**result, "tempos_ms": {stage: round(elapsed * 1000, 2) for stage, elapsed in document_timings.items()}}
+                for result, document_timings in zip(results, timings)
+            ]
+        return results
 
-        except Exception as e:
-            return {"erro": str(e)}
-        finally:
-            if temp_created and os.path.exists(processing_path):
-                try: os.remove(processing_path)
-                except: pass
+    def process_file(self, file_path):
+        return self.process_batch([file_path])[0]
+
+def _dump_metrics(results, nfe_engine, total, metrics_file):
+    for i, result in enumerate(results, 1):
+        # Written before yielding: callers zip against the file list and stop right after the last result.
+        if metrics_file and (i % nfe_engine.max_batch_size == 0 or i == total):
+            nfe_engine.metrics.dump(metrics_file)
+        yield result
+
+def iter_results(file_paths, workers=0, threads_per_worker=None, metrics_file=None, **engine_kwargs):
+    if workers > 0:
+        from workers import WorkerPool
+        with WorkerPool(workers, threads_per_worker, **engine_kwargs) as pool:
+            yield from _dump_metrics(pool.imap(file_paths), pool.engine, len(file_paths), metrics_file)
+    else:
+        nfe_engine = NFeProcessor(**engine_kwargs)
+        results = (
+            result
+            for start in range(0, len(file_paths), nfe_engine.max_batch_size)
+            for result in nfe_engine.process_batch(file_paths[start:start + nfe_engine.max_batch_size])
+        )
+        yield from _dump_metrics(results, nfe_engine, len(file_paths), metrics_file)
 
 if __name__ == "__main__":
-    if not os.path.exists(INPUT_FOLDER):
-        os.makedirs(INPUT_FOLDER)
-        print(json.dumps({"aviso": f"Folder '{INPUT_FOLDER}' created. Add files there."}))
+    parser = argparse.ArgumentParser(description="Extração de dados de DANFEs")
+    parser.add_argument("--input", default=INPUT_FOLDER)
+    parser.add_argument("--workers", type=int, default=0, help="Processos paralelos (0 = processo único)")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=MODEL_BACKEND)
+    parser.add_argument("--onnx-path", default=backends.ONNX_MODEL_PATH)
+    parser.add_argument("--no-rules", action="store_true", help="Sempre usa o LayoutLMv3, sem o extrator por regras")
+    parser.add_argument("--ocr-mode", choices=["full", "roi"], default=OCR_MODE, help="OCR da página inteira ou só das regiões do DANFE")
+    parser.add_argument("--adaptive-resolution", action="store_true", help="Escolhe a resolução pela altura estimada do texto")
+    parser.add_argument("--jsonl", default=None, help="Grava um JSON por linha assim que cada arquivo termina ('-' = stdout)")
+    parser.add_argument("--resume", action="store_true", help="Pula arquivos que já estão no JSONL de saída")
+    parser.add_argument("--skip-errors", action="store_true", help="Com --resume, também pula os arquivos que terminaram com erro")
+    parser.add_argument("--metrics-file", default=None, help="Grava as métricas no formato texto do Prometheus ao final")
+    parser.add_argument("--debug-timings", action="store_true", help="Inclui os tempos por etapa em metadados.tempos_ms")
+    args = parser.parse_args()
+    if args.resume and not args.jsonl: parser.error("--resume needs --jsonl")
+    if args.resume and args.jsonl == "-": parser.error("--resume needs a JSONL file, not stdout")
+    if args.skip_errors and not args.resume: parser.error("--skip-errors needs --resume")
+
+    if not os.path.exists(args.input):
+        os.makedirs(args.input)
+        print(json.dumps({"aviso": f"Folder '{args.input}' created. Add files there."}))
     else:
         try:
-            nfe_engine = NFeProcessor()
-            
-            files = [f for f in os.listdir(INPUT_FOLDER) if f.lower().endswith(ACCEPTED_EXTENSIONS)]
-            results_list = []
+            files = [f for f in os.listdir(args.input) if f.lower().endswith(ACCEPTED_EXTENSIONS)]
             
+            if args.resume:
+                processed_files = utils.load_processed_files(args.jsonl, include_errors=args.skip_errors)
+                files = [f for f in files if f not in processed_files]
+
             if not files:
-                print(json.dumps({"aviso": "No files found in input folder."}))
+                print(json.dumps({"aviso": "No files found in input folder."}), file=sys.stderr if args.jsonl == "-" else sys.stdout)
             else:
-                for filename in files:
-                    file_path = os.path.join(INPUT_FOLDER, filename)
-                    
-                    raw_result = nfe_engine.process_file(file_path)
-                    
-                    formatted_result = utils.format_output(filename, raw_result)
-                    
-                    results_list.append(formatted_result)
+                file_paths = [os.path.join(args.input, filename) for filename in files]
+                raw_results = iter_results(
+                    file_paths, args.workers, args.threads_per_worker, backend=args.backend, onnx_path=args.onnx_path,
+                    rules_first=not args.no_rules, ocr_mode=args.ocr_mode,
+                    adaptive_resolution=args.adaptive_resolution, metrics_file=args.metrics_file,
+                    debug_timings=args.debug_timings
+                )
+
+                if args.jsonl:
+                    output = sys.stdout if args.jsonl == "-" else open(args.jsonl, "a" if args.resume else "w", encoding="utf-8")
+                    try:
+                        for filename, raw_result in zip(files, raw_results):
+                            output.write(json.dumps(utils.format_output(filename, raw_result), ensure_ascii=False) + "\n")
+                            output.flush()
+                    finally:
+                        if output is not sys.stdout: output.close()
+                else:
+                    results_list = [utils.format_output(filename, raw_result) for filename, raw_result in zip(files, raw_results)]
 
-                print(json.dumps(results_list, indent=4, ensure_ascii=False))
+                    print(json.dumps(results_list, indent=4, ensure_ascii=False))
                 
         except Exception as e:
-            print(json.dumps({"erro_fatal": str(e)}))
\ No newline at end of file
+            # stdout may already hold part of the JSONL; the error goes to stderr and the exit code marks the run as failed.
+            print(json.dumps({"erro_fatal": str(e)}, ensure_ascii=False), file=sys.stderr)
+            sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import zipfile
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import utils
+
+JOBS_DB = "jobs/jobs.db"
+JOBS_DIR = "jobs/arquivos"
+LEASE_SECONDS = 300
+POLL_INTERVAL = 2.0
+MAX_ZIP_MEMBERS = 20000
+MAX_ZIP_MB = 2048
+
+class SubmissionTooLarge(ValueError):
+    pass
+
+def iter_documents(paths, extensions, max_members=MAX_ZIP_MEMBERS, max_mb=MAX_ZIP_MB):
+    members, size = 0, 0
+    for path in paths:
+        if path.lower().endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                # Checked from the central directory before anything is extracted, so a zip bomb never reaches the disk.
+                # zipfile stops reading a member at its declared size, so the declared sizes are a real bound.
+                members += len(archive.infolist())
+                size += sum(member.file_size for member in archive.infolist())
+                if members > max_members:
+                    raise SubmissionTooLarge(f"Submission has more than {max_members} ZIP members.")
+                if size > max_mb * 1024 * 1024:
+                    raise SubmissionTooLarge(f"Submission expands to more than {max_mb} MB.")
+                for member in archive.infolist():
+                    if member.is_dir() or not member.filename.lower().endswith(extensions): continue
+                    with archive.open(member) as f:
+                        yield member.filename, f
+        elif path.lower().endswith(extensions):
+            with open(path, "rb") as f:
+                yield os.path.basename(path), f
+
+class JobQueue(ABC):
+    @abstractmethod
+    def submit(self, documents): ...
+
+    @abstractmethod
+    def claim(self, worker_id): ...
+
+    @abstractmethod
+    def pending_documents(self, job_id): ...
+
+    # complete and finish return False when worker_id no longer holds the job's lease.
+    @abstractmethod
+    def complete(self, job_id, worker_id, results): ...
+
+    @abstractmethod
+    def finish(self, job_id, worker_id): ...
+
+    @abstractmethod
+    def status(self, job_id): ...
+
+    @abstractmethod
+    def results(self, job_id): ...
+
+class SQLiteJobQueue(JobQueue):
+    def __init__(self, db_path=JOBS_DB, storage_dir=JOBS_DIR, lease_seconds=LEASE_SECONDS):
+        for directory in (os.path.dirname(db_path), storage_dir):
+            if directory: os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self.storage_dir = storage_dir
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL, created REAL NOT NULL, "
+            "updated REAL NOT NULL, worker TEXT, lease_until REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT NOT NULL, path TEXT NOT NULL, "
+            "status TEXT, payload TEXT, PRIMARY KEY (job_id, idx))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created)")
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def submit(self, documents):
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.storage_dir, job_id)
+        os.makedirs(job_dir)
+
+        rows = []
+        try:
+            for filename, source in documents:
+                path = os.path.join(job_dir, f"{len(rows):06d}_{os.path.basename(filename)}")
+                with open(path, "wb") as f:
+                    shutil.copyfileobj(source, f)
+                rows.append((job_id, len(rows), filename, path))
+            if not rows: raise ValueError("No supported files in submission.")
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+        now = time.time()
+        with self._transaction():
+            self.conn.executemany("INSERT INTO documents (job_id, idx, filename, path) VALUES (?, ?, ?, ?)", rows)
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, total, created, updated) VALUES (?, 'pendente', ?, ?, ?)",
+                (job_id, len(rows), now, now)
+            )
+        return job_id
+
+    def claim(self, worker_id):
+        now = time.time()
+        with self._transaction():
+            # A job whose lease expired lost its worker; the same worker id coming back takes it over at once.
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE status = 'pendente' OR (status = 'processando' AND (lease_until < ? OR worker = ?)) "
+                "ORDER BY created LIMIT 1", (now, worker_id)
+            ).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'processando', worker = ?, lease_until = ?, updated = ? WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, row[0])
+                )
+        return row[0] if row else None
+
+    def pending_documents(self, job_id):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT idx, filename, path FROM documents WHERE job_id = ? AND status IS NULL ORDER BY idx", (job_id,)
+            ).fetchall()
+
+    def complete(self, job_id, worker_id, results):
+        now = time.time()
+        with self._transaction():
+            # The lease is renewed and checked in the same transaction as the write, so a worker whose job was
+            # taken over after its lease expired cannot overwrite what the new owner stores.
+            renewed = self.conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND status = 'processando' AND worker = ?",
+                (now + self.lease_seconds, now, job_id, worker_id)
+            ).rowcount
+            if not renewed: return False
+            self.conn.executemany(
+                "UPDATE documents SET status = ?, payload = ? WHERE job_id = ? AND idx = ?",
+                [(payload["metadados"]["status"], json.dumps(payload, ensure_ascii=False), job_id, idx) for idx, payload in results]
+            )
+        return True
+
+    def finish(self, job_id, worker_id):
+        with self.lock:
+            finished = self.conn.execute(
+                "UPDATE jobs SET status = 'concluido', lease_until = NULL, updated = ? "
+                "WHERE id = ? AND status = 'processando' AND worker = ?", (time.time(), job_id, worker_id)
+            ).rowcount
+        # The files belong to whoever holds the lease; a worker that lost it leaves them to the new owner.
+        if not finished: return False
+        shutil.rmtree(os.path.join(self.storage_dir, job_id), ignore_errors=True)
+        return True
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.conn.execute("SELECT status, total, created, updated FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None: return None
+            counts = dict(self.conn.execute(
+                "SELECT status, COUNT(*) FROM documents WHERE job_id = ? AND status IS NOT NULL GROUP BY status", (job_id,)
+            ).fetchall())
+
+        status, total, created, updated = job
+        done = sum(counts.values())
+        return {
+            "job_id": job_id,
+            "status": status,
+            "total": total,
+            "concluidos": done,
+            "erros": counts.get("erro", 0),
+            "progresso": round(done / total, 4) if total else 1.0,
+            "criado_em": created,
+            "atualizado_em": updated
+        }
+
+    def results(self, job_id):
+        last = -1
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT idx, payload FROM documents WHERE job_id = ? AND idx > ? AND payload IS NOT NULL ORDER BY idx LIMIT 500",
+                    (job_id, last)
+                ).fetchall()
+            if not rows: return
+            for idx, payload in rows:
+                yield payload
+            last = rows[-1][0]
+
+def process_job(job_queue, engine, job_id, worker_id):
+    # Only documents without a stored result are left, so a restarted job picks up after the last saved batch.
+    pending = job_queue.pending_documents(job_id)
+    for start in range(0, len(pending), engine.max_batch_size):
+        batch = pending[start:start + engine.max_batch_size]
+        outputs = engine.process_batch([path for _, _, path in batch])
+        stored = job_queue.complete(job_id, worker_id, [
+            (idx, utils.format_output(filename, result)) for (idx, filename, _), result in zip(batch, outputs)
+        ])
+        if not stored:
+            print(f"Lease on job {job_id} lost by {worker_id}; leaving it to the new owner", file=sys.stderr, flush=True)
+            return False
+    return job_queue.finish(job_id, worker_id)
+
+def run_worker(job_queue, engine, worker_id, poll_interval=POLL_INTERVAL, once=False, metrics_file=None):
+    while True:
+        job_id = job_queue.claim(worker_id)
+        if job_id is None:
+            if once: return
+            time.sleep(poll_interval)
+            continue
+        process_job(job_queue, engine, job_id, worker_id)
+        if metrics_file: engine.metrics.dump(metrics_file)
+        print(json.dumps(job_queue.status(job_id), ensure_ascii=False), file=sys.stderr, flush=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fila de jobs para lotes grandes de DANFEs")
+    parser.add_argument("--db", default=JOBS_DB)
+    parser.add_argument("--storage", default=JOBS_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit = subparsers.add_parser("submit", help="Envia um ZIP (ou arquivos soltos) como um job")
+    submit.add_argument("files", nargs="+")
+    submit.add_argument("--max-zip-members", type=int, default=MAX_ZIP_MEMBERS)
+    submit.add_argument("--max-zip-mb", type=int, default=MAX_ZIP_MB, help="Limite do conteúdo descompactado dos ZIPs")
+
+    worker = subparsers.add_parser("worker", help="Processa jobs da fila")
+    worker.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}",
+                        help="Use um id fixo para retomar na hora os jobs deste worker após um reinício")
+    worker.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    worker.add_argument("--once", action="store_true", help="Sai quando a fila estiver vazia")
+    worker.add_argument("--metrics-file", default=None, help="Atualiza as métricas (formato Prometheus) após cada job")
+    worker.add_argument("--workers", type=int, default=0, help="Processos de inferência (0 = processo único)")
+    worker.add_argument("--threads-per-worker", type=int, default=None)
+
+    status = subparsers.add_parser("status", help="Mostra o progresso de um job")
+    status.add_argument("job_id")
+
+    results = subparsers.add_parser("results", help="Escreve os resultados de um job em JSONL")
+    results.add_argument("job_id")
+
+    args = parser.parse_args()
+    job_queue = SQLiteJobQueue(args.db, args.storage)
+
+    if args.command == "submit":
+        from inference import ACCEPTED_EXTENSIONS
+
+        try:
+            job_id = job_queue.submit(iter_documents(args.files, ACCEPTED_EXTENSIONS, args.max_zip_members, args.max_zip_mb))
+        except ValueError as e:
+            parser.error(str(e))
+        print(json.dumps(job_queue.status(job_id), ensure_ascii=False))
+    elif args.command == "worker":
+        if args.workers > 0:
+            from workers import WorkerPool
+
+            with WorkerPool(args.workers, args.threads_per_worker) as pool:
+                run_worker(job_queue, pool, args.worker_id, args.poll_interval, args.once, args.metrics_file)
+        else:
+            from inference import NFeProcessor
+
+            run_worker(job_queue, NFeProcessor(), args.worker_id, args.poll_interval, args.once, args.metrics_file)
+    elif args.command == "status":
+        print(json.dumps(job_queue.status(args.job_id), ensure_ascii=False))
+    else:
+        for line in job_queue.results(args.job_id):
+            print(line)
@@ -0,0 +1,105 @@
+import os
+import bisect
+import threading
+
+PREFIX = "nfe"
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DESCRIPTIONS = {
+    "stage_seconds": ("histogram", "Time spent in each engine stage."),
+    "documents_total": ("counter", "Documents returned, by status."),
+    "pages_total": ("counter", "Pages rendered or loaded."),
+    "tokens_total": ("counter", "Tokens produced by the LayoutLMv3 tokenizer."),
+    "truncations_total": ("counter", "Pages longer than one model window, by how they were handled."),
+    "cache_requests_total": ("counter", "Cache lookups, by cache and result."),
+    "rules_total": ("counter", "Documents checked by the rule extractor, by result."),
+    "errors_total": ("counter", "Errors caught while processing documents, by exception type."),
+    "service_batches_total": ("counter", "Micro-batches sent to the engine by the HTTP service."),
+    "service_rejected_total": ("counter", "HTTP requests rejected with 429 because the queue was full."),
+    "service_queue_depth": ("gauge", "Documents waiting in the HTTP service queue.")
+}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+class Metrics:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.setdefault(key, {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0})
+            histogram["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def drain(self):
+        with self.lock:
+            data = {"counters": self.counters, "gauges": self.gauges, "histograms": self.histograms}
+            self.counters, self.gauges, self.histograms = {}, {}, {}
+        return data
+
+    def merge(self, data):
+        with self.lock:
+            for key, value in data["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(data["gauges"])
+            for key, other in data["histograms"].items():
+                histogram = self.histograms.setdefault(key, {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0})
+                histogram["buckets"] = [a + b for a, b in zip(histogram["buckets"], other["buckets"])]
+                histogram["sum"] += other["sum"]
+                histogram["count"] += other["count"]
+
+    def render(self):
+        with self.lock:
+            counters = {**self.counters, **self.gauges}
+            histograms = {key: {**h, "buckets": list(h["buckets"])} for key, h in self.histograms.items()}
+
+        lines = []
+        for name in sorted({key[0] for key in counters} | {key[0] for key in histograms}):
+            default_kind = "histogram" if any(k[0] == name for k in histograms) else "counter"
+            kind, description = DESCRIPTIONS.get(name, (default_kind, ""))
+            lines.append(f"# HELP {PREFIX}_{name} {description}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+            for (_, labels), value in sorted(item for item in counters.items() if item[0][0] == name):
+                lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {value}")
+
+            for (_, labels), histogram in sorted((item for item in histograms.items() if item[0][0] == name), key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ["+Inf"], histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{PREFIX}_{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{PREFIX}_{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{PREFIX}_{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
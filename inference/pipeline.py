@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import cache
+import utils
+from inference import NFeProcessor, INPUT_FOLDER, ACCEPTED_EXTENSIONS
+
+LOAD_WORKERS = 4
+QUEUE_SIZE = 16
+BATCH_SIZE = 8
+BATCH_TIMEOUT_MS = 50
+REPORT_INTERVAL = 10
+
+STOP_POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+class _Stopped(Exception):
+    pass
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, items, elapsed, errors=0):
+        with self.lock:
+            self.items += items
+            self.errors += errors
+            self.busy += elapsed
+
+class TrackedQueue(queue.Queue):
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.max_depth = 0
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        self.max_depth = max(self.max_depth, self.qsize())
+
+class PipelineEngine:
+    def __init__(self, engine, load_workers=LOAD_WORKERS, queue_size=QUEUE_SIZE,
+                 batch_size=BATCH_SIZE, batch_timeout_ms=BATCH_TIMEOUT_MS):
+        self.engine = engine
+        self.load_workers = load_workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout_ms / 1000
+        self.stages = {name: StageStats(name) for name in ("load", "ocr", "model", "postprocess")}
+        self.queues = {}
+        self.threads = []
+        self.stopping = threading.Event()
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    # Queue operations wake up every STOP_POLL_INTERVAL, so close() reaches threads blocked on a full or empty queue.
+    def _put(self, q, item):
+        while not self.stopping.is_set():
+            try:
+                q.put(item, timeout=STOP_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+        raise _Stopped
+
+    def _get(self, q, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.stopping.is_set():
+            wait = STOP_POLL_INTERVAL if deadline is None else max(0, min(STOP_POLL_INTERVAL, deadline - time.monotonic()))
+            try:
+                return q.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline: raise
+        raise _Stopped
+
+    def _stage(self, target, *args):
+        try:
+            target(*args)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            # A failure outside the per-document handlers (CUDA OOM, a bug in a stage) stops every stage,
+            # and run() raises it to the consumer instead of waiting for a _DONE that will never come.
+            if self.error is None: self.error = e
+            self.stopping.set()
+
+    def _error(self, job, e):
+        self.engine.metrics.inc("errors_total", exception=type(e).__name__)
+        job["result"] = {"erro": str(e)}
+
+    def _load_worker(self, inputs, outputs):
+        engine = self.engine
+        while True:
+            item = self._get(inputs)
+            if item is _DONE:
+                self._put(outputs, _DONE)
+                return
+
+            index, file_path = item
+            # Same per-document debug timings and counters as NFeProcessor.process_batch.
+            job = {"index": index, "path": file_path, "timings": {} if engine.debug_timings else None}
+            start = time.perf_counter()
+            engine._track(job["timings"])
+            try:
+                if engine.result_cache:
+                    with engine._timed("result_cache"):
+                        job["digest"] = cache.file_sha256(file_path)
+                        cached = engine.result_cache.get(job["digest"])
+                    engine.metrics.inc("cache_requests_total", cache="result", result="miss" if cached is None else "hit")
+                    if cached is not None: job["result"] = cached
+                if "result" not in job:
+                    with engine._timed("render"):
+                        job["pages"] = engine._load_pages(file_path)
+                    engine.metrics.inc("pages_total", len(job["pages"]))
+            except Exception as e:
+                self._error(job, e)
+            engine._track()
+            self.stages["load"].record(1, time.perf_counter() - start, int("erro" in job.get("result", {})))
+            self._put(outputs, job)
+
+    def _ocr_worker(self, inputs, outputs):
+        engine = self.engine
+        finished = 0
+        while finished < self.load_workers:
+            job = self._get(inputs)
+            if job is _DONE:
+                finished += 1
+                continue
+
+            if "result" not in job:
+                start = time.perf_counter()
+                engine._track(job["timings"])
+                try:
+                    job["document"] = engine._recognize(job["path"], job.pop("pages"))
+                    ruled = engine._apply_rules(job["document"])
+                    if ruled is not None: job["result"] = ruled
+                    else:
+                        with engine._timed("encode"):
+                            job["encodings"] = [engine._encode(page) for page in job["document"]["pages"]]
+                except Exception as e:
+                    self._error(job, e)
+                engine._track()
+                self.stages["ocr"].record(1, time.perf_counter() - start, int("erro" in job.get("result", {})))
+            self._put(outputs, job)
+        self._put(outputs, _DONE)
+
+    def _model_worker(self, inputs, outputs):
+        done = False
+        while not done:
+            batch, deadline = [], None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                try:
+                    job = self._get(inputs, timeout)
+                except queue.Empty:
+                    break
+                if job is _DONE:
+                    done = True
+                    break
+                if "result" in job:
+                    self._put(outputs, job)
+                    continue
+                batch.append(job)
+                if deadline is None: deadline = time.monotonic() + self.batch_timeout
+
+            if not batch: continue
+
+            start = time.perf_counter()
+            timings = [job["timings"] for job in batch] if self.engine.debug_timings else None
+            predictions, errors = self.engine._infer([job["encodings"] for job in batch], timings)
+            self.stages["model"].record(len(batch), time.perf_counter() - start, len(errors))
+
+            for d, job in enumerate(batch):
+                if d in errors: job["result"] = {"erro": errors[d]}
+                else: job["predictions"] = predictions[d]
+                self._put(outputs, job)
+        self._put(outputs, _DONE)
+
+    def _postprocess_worker(self, inputs, outputs):
+        engine = self.engine
+        while True:
+            job = self._get(inputs)
+            if job is _DONE:
+                self._put(outputs, _DONE)
+                return
+
+            if "predictions" in job:
+                start = time.perf_counter()
+                engine._track(job["timings"])
+                try:
+                    with engine._timed("decode"):
+                        job["result"] = engine._decode(job["document"], job["encodings"], job["predictions"])
+                except Exception as e:
+                    self._error(job, e)
+                engine._track()
+                self.stages["postprocess"].record(1, time.perf_counter() - start, int("erro" in job["result"]))
+            if "digest" in job and "document" in job and "erro" not in job["result"]:
+                engine.result_cache.put(job["digest"], job["result"])
+
+            result = job["result"]
+            engine.metrics.inc("documents_total", status="erro" if "erro" in result else "sucesso")
+            if job["timings"] is not None:
+                result = {**result, "tempos_ms": {stage: round(elapsed * 1000, 2) for stage, elapsed in job["timings"].items()}}
+            self._put(outputs, (job["index"], job["path"], result))
+
+    def _feed(self, file_paths, outputs):
+        for item in enumerate(file_paths):
+            self._put(outputs, item)
+        for _ in range(self.load_workers):
+            self._put(outputs, _DONE)
+
+    def _report(self, interval):
+        while not self.stopping.wait(interval):
+            print(json.dumps(self.stats(), ensure_ascii=False), file=sys.stderr, flush=True)
+
+    def run(self, file_paths, report_interval=None):
+        names = ["entrada", "load->ocr", "ocr->model", "model->postprocess", "saida"]
+        self.queues = {name: TrackedQueue(self.queue_size) for name in names}
+        q = self.queues
+        self.stopping.clear()
+        self.error = None
+
+        stages = [(self._feed, file_paths, q["entrada"])]
+        stages += [(self._load_worker, q["entrada"], q["load->ocr"])] * self.load_workers
+        stages += [
+            (self._ocr_worker, q["load->ocr"], q["ocr->model"]),
+            (self._model_worker, q["ocr->model"], q["model->postprocess"]),
+            (self._postprocess_worker, q["model->postprocess"], q["saida"])
+        ]
+        self.threads = [threading.Thread(target=self._stage, args=stage, daemon=True) for stage in stages]
+        if report_interval:
+            self.threads.append(threading.Thread(target=self._report, args=(report_interval,), daemon=True))
+
+        self.started, self.finished = time.perf_counter(), None
+        for thread in self.threads: thread.start()
+
+        try:
+            while True:
+                try:
+                    item = q["saida"].get(timeout=STOP_POLL_INTERVAL)
+                except queue.Empty:
+                    if self.error is not None: raise self.error
+                    continue
+                if item is _DONE: break
+                yield item
+        finally:
+            # Also reached when the consumer stops early (break, exception or close() on the generator).
+            self.finished = time.perf_counter()
+            self.close()
+
+    def close(self):
+        # Stage threads notice within STOP_POLL_INTERVAL; one already inside OCR or a forward pass finishes that item first.
+        self.stopping.set()
+        for thread in self.threads:
+            if thread is not threading.current_thread(): thread.join()
+        self.threads = []
+
+    def stats(self):
+        elapsed = ((self.finished or time.perf_counter()) - self.started) if self.started else 0.0
+        report = {"tempo_total_s": round(elapsed, 3), "etapas": {}, "filas": {}, "regras": self.engine.rule_report(),
+                  "tempos": self.engine.timing_report()}
+
+        for name, stage in self.stages.items():
+            report["etapas"][name] = {
+                "itens": stage.items,
+                "erros": stage.errors,
+                "ocupado_s": round(stage.busy, 3),
+                "itens_por_s": round(stage.items / elapsed, 2) if elapsed else 0.0,
+                "utilizacao": round(stage.busy / elapsed, 3) if elapsed else 0.0
+            }
+        for name, tracked in self.queues.items():
+            report["filas"][name] = {"atual": tracked.qsize(), "maxima": tracked.max_depth}
+        return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline de extração com etapas em paralelo")
+    parser.add_argument("--input", default=INPUT_FOLDER)
+    parser.add_argument("--load-workers", type=int, default=LOAD_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--batch-timeout-ms", type=int, default=BATCH_TIMEOUT_MS)
+    parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL)
+    parser.add_argument("--debug-timings", action="store_true", help="Inclui os tempos por etapa em metadados.tempos_ms")
+    args = parser.parse_args()
+
+    files = [f for f in sorted(os.listdir(args.input)) if f.lower().endswith(ACCEPTED_EXTENSIONS)]
+    if not files:
+        print(json.dumps({"aviso": "No files found in input folder."}))
+    else:
+        pipeline = PipelineEngine(
+            NFeProcessor(debug_timings=args.debug_timings), load_workers=args.load_workers, queue_size=args.queue_size,
+            batch_size=args.batch_size, batch_timeout_ms=args.batch_timeout_ms
+        )
+
+        results_list = [None] * len(files)
+        for index, file_path, raw_result in pipeline.run([os.path.join(args.input, f) for f in files], args.report_interval):
+            results_list[index] = utils.format_output(files[index], raw_result)
+
+        print(json.dumps(results_list, indent=4, ensure_ascii=False))
+        print(json.dumps(pipeline.stats(), ensure_ascii=False), file=sys.stderr)
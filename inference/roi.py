@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import time
+import argparse
+import cv2
+import fitz  # PyMuPDF
+import rules
+import utils
+
+TEMPLATE_PATH = "danfe_roi_template.json"
+LEARN_FOLDER = "../dataset_generation/generated_pdfs"
+DETECT_MAX_SIDE = 960
+ROI_MARGIN = 0.015
+CELL_BELOW_GAP = 2.5
+
+FIELD_PATTERNS = list(rules.ANCHORS.values()) + [
+    r'RECEBEMOS\s+DE', r'N[º°o]\.?\s*\d{3}', r'S[ÉE]RIE\s*\d', r'\d{4}(?:\s\d{4}){10}'
+]
+
+def orientation(width, height):
+    return "paisagem" if width > height else "retrato"
+
+def _merge(rects, margin):
+    pending = [[x1 - margin, y1 - margin, x2 + margin, y2 + margin] for x1, y1, x2, y2 in rects]
+    changed = True
+    while changed:
+        changed, merged = False, []
+        for rect in pending:
+            for block in merged:
+                if rect[0] <= block[2] and block[0] <= rect[2] and rect[1] <= block[3] and block[1] <= rect[3]:
+                    block[:] = [min(rect[0], block[0]), min(rect[1], block[1]), max(rect[2], block[2]), max(rect[3], block[3])]
+                    changed = True
+                    break
+            else:
+                merged.append(rect)
+        pending = merged
+    return sorted([[round(min(1.0, max(0.0, v)), 4) for v in rect] for rect in pending], key=lambda r: (r[1], r[0]))
+
+def _page_lines(page):
+    lines = {}
+    for x0, y0, x1, y1, text, block_no, line_no, _ in page.get_text("words"):
+        line = lines.setdefault((block_no, line_no), [x0, y0, x1, y1, []])
+        line[:4] = [min(line[0], x0), min(line[1], y0), max(line[2], x1), max(line[3], y1)]
+        line[4].append(text)
+    return [(x0, y0, x1, y1, " ".join(words)) for x0, y0, x1, y1, words in lines.values()]
+
+def _page_cells(page):
+    lines = _page_lines(page)
+    if not lines: return None, []
+
+    cx1, cy1 = min(l[0] for l in lines), min(l[1] for l in lines)
+    cx2, cy2 = max(l[2] for l in lines), max(l[3] for l in lines)
+    # Nothing we extract lives below the tax block, whatever the item table length.
+    totals = [l[3] for l in lines if re.search(rules.ANCHORS["VALOR_TOTAL"], l[4], re.IGNORECASE)]
+    limit = max(totals) if totals else cy2
+
+    cells = []
+    for x0, y0, x1, y1, text in lines:
+        if y0 > limit or y1 - y0 > x1 - x0: continue
+        if not any(re.search(p, text, re.IGNORECASE) for p in FIELD_PATTERNS): continue
+
+        # DANFE cells print the label above the value, so take the lines right below the anchor.
+        height = y1 - y0
+        same_row = [l for l in lines if abs((l[1] + l[3]) / 2 - (y0 + y1) / 2) <= height / 2 and l[0] >= x1]
+        cell_right = min([l[0] for l in same_row], default=cx2)
+        cell = [x0, y0, x1, y1]
+        for lx0, ly0, lx1, ly1, _ in lines:
+            if ly1 - ly0 > height * 2: continue
+            if y1 - height / 2 <= ly0 <= y1 + height * CELL_BELOW_GAP and lx0 < cell_right and lx1 > x0 - height:
+                cell = [min(cell[0], lx0), min(cell[1], ly0), max(cell[2], lx1), max(cell[3], ly1)]
+
+        cells.append([(cell[0] - cx1) / (cx2 - cx1), (cell[1] - cy1) / (cy2 - cy1), (cell[2] - cx1) / (cx2 - cx1), (cell[3] - cy1) / (cy2 - cy1)])
+    return orientation(page.rect.width, page.rect.height), cells
+
+def learn_template(pdf_paths, margin=ROI_MARGIN):
+    cells = {}
+    for pdf_path in pdf_paths:
+        with fitz.open(pdf_path) as doc:
+            name, page_cells = _page_cells(doc.load_page(0))
+        if name: cells.setdefault(name, []).extend(page_cells)
+    return {name: _merge(rects, margin) for name, rects in cells.items()}
+
+def load_template(path=TEMPLATE_PATH):
+    if not path or not os.path.exists(path): return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def content_box(reader, image):
+    scale = min(1.0, DETECT_MAX_SIDE / max(image.shape[:2]))
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else image
+
+    horizontal, free = reader.detect(small)
+    boxes = [(b[0], b[2], b[1], b[3]) for b in horizontal[0]]
+    boxes += [(min(p[0] for p in poly), min(p[1] for p in poly), max(p[0] for p in poly), max(p[1] for p in poly)) for poly in free[0]]
+    if not boxes: return None
+
+    return (
+        min(b[0] for b in boxes) / scale, min(b[1] for b in boxes) / scale,
+        max(b[2] for b in boxes) / scale, max(b[3] for b in boxes) / scale
+    )
+
+def regions(image, content, template):
+    height, width = image.shape[:2]
+    cx1, cy1, cx2, cy2 = content
+    return [
+        (max(0, int(cx1 + x1 * (cx2 - cx1))), max(0, int(cy1 + y1 * (cy2 - cy1))),
+         min(width, int(cx1 + x2 * (cx2 - cx1)) + 1), min(height, int(cy1 + y2 * (cy2 - cy1)) + 1))
+        for x1, y1, x2, y2 in template.get(orientation(width, height), [])
+    ]
+
+def read_regions(reader, image, template):
+    content = content_box(reader, image)
+    crops = regions(image, content, template) if content else []
+    if not crops: return None
+
+    results = []
+    for x1, y1, x2, y2 in crops:
+        if x2 - x1 < 2 or y2 - y1 < 2: continue
+        for bbox, text, prob in reader.readtext(image[y1:y2, x1:x2]):
+            results.append(([[p[0] + x1, p[1] + y1] for p in bbox], text, prob))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OCR só nas regiões de interesse do DANFE")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    learn = subparsers.add_parser("learn", help="Aprende as regiões a partir dos PDFs gerados")
+    learn.add_argument("--input", default=LEARN_FOLDER)
+    learn.add_argument("--output", default=TEMPLATE_PATH)
+    learn.add_argument("--margin", type=float, default=ROI_MARGIN)
+
+    report = subparsers.add_parser("report", help="Compara tempo de OCR e campos extraídos: página inteira x regiões")
+    report.add_argument("--input", default=LEARN_FOLDER)
+    report.add_argument("--template", default=TEMPLATE_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == "learn":
+        pdfs = [os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.lower().endswith(".pdf")]
+        template = learn_template(pdfs, args.margin)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(template, f, indent=4)
+        coverage = {
+            name: round(sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects), 3) for name, rects in template.items()
+        }
+        print(json.dumps({"pdfs": len(pdfs), "regioes": {n: len(r) for n, r in template.items()}, "area_coberta": coverage}))
+    else:
+        from inference import NFeProcessor, ACCEPTED_EXTENSIONS, LABELS_LIST
+
+        if load_template(args.template) is None: parser.error(f"template not found: {args.template}")
+        files = [os.path.join(args.input, f) for f in sorted(os.listdir(args.input)) if f.lower().endswith(ACCEPTED_EXTENSIONS)]
+
+        report_data = {"arquivos": len(files), "modos": {}}
+        outputs = {}
+        for mode in ("full", "roi"):
+            # One engine per mode: the template is only loaded by an engine built with ocr_mode="roi".
+            engine = NFeProcessor(native_text=False, rules_first=False, ocr_cache=None, result_cache=None, ocr_mode=mode,
+                                  roi_template=args.template)
+            start = time.perf_counter()
+            outputs[mode] = engine.process_batch(files)
+            report_data["modos"][mode] = {
+                "tempo_total_s": round(time.perf_counter() - start, 3),
+                "ocr": engine.timing_report().get("ocr", {})
+            }
+        report_data["concordancia_campos"] = round(utils.field_agreement(outputs["full"], outputs["roi"], LABELS_LIST[1:]), 4)
+        print(json.dumps(report_data, indent=4, ensure_ascii=False))
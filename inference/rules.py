@@ -0,0 +1,165 @@
+import re
+import utils
+
+REQUIRED_FIELDS = [
+    "CHAVE_ACESSO", "NOME_EMITENTE", "CNPJ_EMITENTE", "NOME_DESTINATARIO", "CNPJ_DESTINATARIO",
+    "DATA_EMISSAO", "VALOR_TOTAL", "NUM_NOTA_FISCAL", "NUM_SERIE"
+]
+MAX_BELOW_GAP = 2.5
+SAME_LINE_TOLERANCE = 0.5
+
+ANCHORS = {
+    "CHAVE_ACESSO": r'CHAVE\s+DE\s+ACESSO',
+    "DATA_EMISSAO": r'DATA\s+D[AE]\s+EMISS[ÃA]O',
+    "VALOR_TOTAL": r'VALOR\s+TOTAL\s+DA\s+NOTA',
+    "NOME": r'NOME\s*/\s*RAZ[ÃA]O\s+SOCIAL',
+    "CNPJ": r'CNPJ\s*/\s*CPF',
+    "DESTINATARIO": r'DESTINAT[ÁA]RIO\s*/\s*REMETENTE'
+}
+
+VALIDATORS = {
+    "CHAVE_ACESSO": utils.validate_access_key,
+    "CNPJ_EMITENTE": utils.validate_document,
+    "CNPJ_DESTINATARIO": utils.validate_document,
+    "DATA_EMISSAO": utils.validate_date,
+    "VALOR_TOTAL": utils.validate_value,
+    "NUM_NOTA_FISCAL": lambda text: bool(re.fullmatch(r'\d{3}\.\d{3}\.\d{3}', text)),
+    "NUM_SERIE": lambda text: bool(re.fullmatch(r'\d{1,3}', text))
+}
+
+def _segments(ocr_results):
+    segments = []
+    for bbox, text, _ in ocr_results:
+        xs, ys = [p[0] for p in bbox], [p[1] for p in bbox]
+        segments.append({"text": utils.fix_encoding(text).strip(), "box": (min(xs), min(ys), max(xs), max(ys))})
+    segments.sort(key=lambda s: (s["box"][1], s["box"][0]))
+    return segments
+
+def _is_anchor(text):
+    return any(re.fullmatch(pattern, text, re.IGNORECASE) for pattern in ANCHORS.values())
+
+def _normalize(label, text):
+    return utils.clean_field(label, text)
+
+def _is_valid(label, value):
+    validator = VALIDATORS.get(label)
+    if validator: return validator(value)
+    return len(value) > 1 and bool(re.search(r'[A-Za-zÀ-ÿ]', value))
+
+def _value_near(segments, anchor, anchor_name, label):
+    x1, y1, x2, y2 = anchor["box"]
+    height = max(y2 - y1, 1)
+
+    remainder = re.split(ANCHORS[anchor_name], anchor["text"], maxsplit=1, flags=re.IGNORECASE)[-1].strip(" :")
+    candidates = [(0.0, remainder)] if remainder else []
+
+    same_line = [
+        s for s in segments
+        if s is not anchor and abs((s["box"][1] + s["box"][3]) / 2 - (y1 + y2) / 2) <= height * SAME_LINE_TOLERANCE
+    ]
+    # DANFE cells are label-over-value; the next label on the row closes the current cell.
+    cell_right = min([s["box"][0] for s in same_line if s["box"][0] >= x2], default=float("inf"))
+
+    for segment in segments:
+        if segment is anchor or _is_anchor(segment["text"]): continue
+        sx1, sy1, sx2, sy2 = segment["box"]
+
+        if segment in same_line:
+            if sx1 >= x2 - height: candidates.append(((sx1 - x2) / height, segment["text"]))
+        elif y1 + height / 2 <= sy1 <= y2 + height * MAX_BELOW_GAP and sx1 >= x1 - height and sx2 <= cell_right + height:
+            candidates.append(((sy1 - y2) / height + (sx1 - x1) / (100 * height), segment["text"]))
+
+    for _, text in sorted(candidates, key=lambda c: c[0]):
+        value = _normalize(label, text)
+        if _is_valid(label, value): return value
+    return None
+
+def _find_anchors(segments, name):
+    return [s for s in segments if re.search(ANCHORS[name], s["text"], re.IGNORECASE)]
+
+def extract_page(page):
+    segments = _segments(page["ocr"])
+    page_text = " ".join(s["text"] for s in segments)
+    data = {}
+
+    candidates = [page["barcode"]["key"]] if page.get("barcode") else []
+    candidates += [match.group(1) for match in re.finditer(r'(?<!\d)(\d{4}(?:\s?\d{4}){10})(?!\d)', page_text)]
+    for candidate in candidates:
+        value = _normalize("CHAVE_ACESSO", candidate)
+        if _is_valid("CHAVE_ACESSO", value):
+            data["CHAVE_ACESSO"] = value
+            break
+
+    match_invoice = re.search(r'N[º°o]\.?\s*(\d{3}\.\d{3}\.\d{3})', page["header_text"])
+    if match_invoice: data["NUM_NOTA_FISCAL"] = _normalize("NUM_NOTA_FISCAL", match_invoice.group(1))
+    match_series = re.search(r'(?i)S[ÉE]RIE[:\s]*(\d+)', page["header_text"])
+    if match_series: data["NUM_SERIE"] = _normalize("NUM_SERIE", match_series.group(1))
+
+    match_issuer = re.search(r'(?i)RECEBEMOS\s+DE\s+(.+?)\s+OS\s+PRODUTOS', page_text)
+    if match_issuer: data["NOME_EMITENTE"] = _normalize("NOME_EMITENTE", match_issuer.group(1))
+
+    for label in ("DATA_EMISSAO", "VALOR_TOTAL"):
+        for anchor in _find_anchors(segments, label):
+            value = _value_near(segments, anchor, label, label)
+            if value:
+                data[label] = value
+                break
+
+    recipient_sections = _find_anchors(segments, "DESTINATARIO")
+    recipient_top = recipient_sections[0]["box"][1] if recipient_sections else None
+
+    for anchor in _find_anchors(segments, "CNPJ"):
+        is_recipient = recipient_top is not None and anchor["box"][1] > recipient_top
+        label = "CNPJ_DESTINATARIO" if is_recipient else "CNPJ_EMITENTE"
+        if label in data: continue
+        value = _value_near(segments, anchor, "CNPJ", label)
+        if value: data[label] = value
+
+    if recipient_top is not None:
+        for anchor in _find_anchors(segments, "NOME"):
+            if anchor["box"][1] <= recipient_top: continue
+            value = _value_near(segments, anchor, "NOME", "NOME_DESTINATARIO")
+            if value:
+                data["NOME_DESTINATARIO"] = value
+                break
+
+    return {label: value for label, value in data.items() if value and _is_valid(label, value)}
+
+def apply_access_key(data):
+    key = utils.decode_access_key(data.get("CHAVE_ACESSO", ""))
+    if key is None: return []
+
+    derived = {
+        "CNPJ_EMITENTE": utils.clean_field("CNPJ_EMITENTE", key["cnpj_emitente"]),
+        # The key zero-pads the series to 3 digits; the DANFE prints it unpadded, like the anchor path returns it.
+        "NUM_SERIE": str(int(key["serie"])),
+        "NUM_NOTA_FISCAL": f"{key['numero'][:3]}.{key['numero'][3:6]}.{key['numero'][6:]}"
+    }
+    mismatched = []
+    for label, value in derived.items():
+        current = re.sub(r'\D', '', data.get(label, ""))
+        if current and int(current) != int(re.sub(r'\D', '', value)): mismatched.append(label)
+        if not current or label in mismatched: data[label] = value
+
+    date = data.get("DATA_EMISSAO", "")
+    if utils.validate_date(date) and date[8:10] + date[3:5] != key["ano_mes"]:
+        mismatched.append("DATA_EMISSAO")
+    return mismatched
+
+def extract(pages, last_page_fields=()):
+    page_data = [extract_page(page) for page in pages]
+
+    data = {}
+    for label in REQUIRED_FIELDS:
+        ordered = reversed(page_data) if label in last_page_fields else page_data
+        for values in ordered:
+            if values.get(label):
+                data[label] = values[label]
+                break
+
+    # The key is checksummed, so an emission date from another month is the misread one.
+    if "DATA_EMISSAO" in apply_access_key(data): del data["DATA_EMISSAO"]
+    return data
+
+def is_complete(data, required_fields=REQUIRED_FIELDS):
+    return all(data.get(label) for label in required_fields)
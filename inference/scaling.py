@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+MIN_GLYPH_HEIGHT = 10
+MIN_GLYPHS = 50
+PROBE_DPI = 96
+PROBE_MAX_SIDE = 1600
+PDF_SCALE_RANGE = (100 / 72, 300 / 72)
+IMAGE_SCALE_RANGE = (0.35, 2.0)
+ESCALATE_BELOW_CONFIDENCE = 0.6
+ESCALATION_FACTOR = 1.5
+MAX_ESCALATIONS = 1
+
+def estimate_glyph_height(image):
+    grey = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    _, binary = cv2.threshold(grey, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+
+    heights, widths = stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_WIDTH]
+    # Glyph-shaped components only: drops specks, table rules and barcode bars.
+    glyphs = (heights >= 3) & (heights <= grey.shape[0] * 0.05) & (widths <= heights * 3)
+    if glyphs.sum() < MIN_GLYPHS: return None
+    return float(np.median(heights[glyphs]))
+
+def choose_scale(glyph_height, scale_range):
+    low, high = scale_range
+    if not glyph_height: return high
+    return float(min(high, max(low, MIN_GLYPH_HEIGHT / glyph_height)))
+
+def probe_image_scale(image):
+    probe = min(1.0, PROBE_MAX_SIDE / max(image.shape[:2]))
+    small = resize(image, probe)
+    glyph_height = estimate_glyph_height(small)
+    return choose_scale(glyph_height / probe if glyph_height else None, IMAGE_SCALE_RANGE)
+
+def resize(image, scale):
+    if scale == 1.0: return image
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+def mean_confidence(results):
+    return float(np.mean([prob for _, _, prob in results])) if results else 0.0
+
+def next_scale(scale, scale_range):
+    escalated = min(scale_range[1], scale * ESCALATION_FACTOR)
+    return escalated if escalated > scale + 1e-6 else None
@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import shutil
+import asyncio
+import argparse
+import zipfile
+import tempfile
+import itertools
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+import utils
+import jobs
+from inference import NFeProcessor, ACCEPTED_EXTENSIONS
+
+HOST = "0.0.0.0"
+PORT = 8080
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 20
+QUEUE_SIZE = 64
+MAX_UPLOAD_MB = 50
+PROGRESS_INTERVAL = 1.0
+RESULTS_PAGE_SIZE = 500
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class MicroBatcher:
+    def __init__(self, engine, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, queue_size=QUEUE_SIZE):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(queue_size)
+        # A single model thread: batches run back to back and the event loop never blocks on inference.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.documents = 0
+        # Slots held by uploads still being read, so concurrent requests cannot overfill the queue meanwhile.
+        self.reserved = 0
+
+    def free_slots(self):
+        return self.queue.maxsize - self.queue.qsize() - self.reserved
+
+    def reserve(self):
+        if self.free_slots() <= 0: return False
+        self.reserved += 1
+        return True
+
+    def unreserve(self, count):
+        self.reserved -= count
+
+    def submit(self, file_path, on_done=None):
+        # on_done runs once the file is no longer needed: after its batch, or when its request was cancelled.
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((file_path, future, on_done))
+        return future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0: break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Requests whose client went away cancel their futures; those files are skipped.
+            live = [(path, future) for path, future, _ in batch if not future.cancelled()]
+            try:
+                if live:
+                    try:
+                        results = await loop.run_in_executor(self.executor, self.engine.process_batch, [path for path, _ in live])
+                    except Exception as e:
+                        results = [{"erro": str(e)}] * len(live)
+
+                    self.batches += 1
+                    self.documents += len(live)
+                    self.engine.metrics.inc("service_batches_total")
+                    for (_, future), result in zip(live, results):
+                        if not future.done(): future.set_result(result)
+            finally:
+                for _, _, on_done in batch:
+                    if on_done: on_done()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+def _error(status, message):
+    return web.json_response({"erro": message}, status=status)
+
+def _queue_full():
+    return web.HTTPTooManyRequests(
+        text=json.dumps({"erro": "Queue is full, try again later."}), content_type="application/json", headers={"Retry-After": "1"}
+    )
+
+async def _read_uploads(request, directory, extensions=ACCEPTED_EXTENSIONS, reserve=None):
+    # client_max_size only covers bodies aiohttp reads itself, not a streamed multipart, so the limit is kept here.
+    max_size = request.app["max_upload_bytes"]
+    files, size = [], 0
+    reader = await request.multipart()
+    async for part in reader:
+        if not part.filename: continue
+        filename = os.path.basename(part.filename)
+        if not filename.lower().endswith(extensions):
+            raise web.HTTPBadRequest(text=json.dumps({"erro": f"Unsupported file type: {filename}"}), content_type="application/json")
+        # A queue slot is taken before the part is read, so a full queue rejects the upload without storing it.
+        if reserve and not reserve(): raise _queue_full()
+
+        file_path = os.path.join(directory, f"{len(files)}_{filename}")
+        with open(file_path, "wb") as f:
+            while chunk := await part.read_chunk():
+                size += len(chunk)
+                if size > max_size: break
+                f.write(chunk)
+        if size > max_size:
+            os.remove(file_path)
+            raise web.HTTPRequestEntityTooLarge(
+                max_size, size, text=json.dumps({"erro": f"Upload larger than {max_size} bytes."}), content_type="application/json"
+            )
+        files.append((filename, file_path))
+    return files
+
+def _resolve_paths(paths, path_root):
+    files = []
+    for path in paths:
+        file_path = os.path.realpath(os.path.join(path_root, path))
+        if os.path.commonpath([file_path, path_root]) != path_root or not os.path.isfile(file_path):
+            raise web.HTTPBadRequest(text=json.dumps({"erro": f"File not found: {path}"}), content_type="application/json")
+        files.append((os.path.basename(file_path), file_path))
+    return files
+
+def _load_failed(app):
+    error = app.get("load_error")
+    return _error(500, f"Model failed to load: {type(error).__name__}: {error}")
+
+async def extract(request):
+    batcher = request.app.get("batcher")
+    if request.app.get("load_error"): return _load_failed(request.app)
+    if batcher is None:
+        return _error(503, "Model is still loading.")
+    if batcher.free_slots() <= 0:
+        batcher.engine.metrics.inc("service_rejected_total")
+        raise _queue_full()
+
+    loop = asyncio.get_running_loop()
+    directory = tempfile.mkdtemp(prefix="nfe_")
+    reserved = 0
+
+    def reserve():
+        nonlocal reserved
+        if not batcher.reserve(): return False
+        reserved += 1
+        return True
+
+    pending = 0
+
+    def release():
+        # The batcher owns the uploads once they are queued; the folder goes when the last one is done with.
+        nonlocal pending
+        pending -= 1
+        if pending == 0: loop.run_in_executor(None, shutil.rmtree, directory, True)
+
+    try:
+        if request.content_type.startswith("multipart/"):
+            files = await _read_uploads(request, directory, reserve=reserve)
+        elif request.app["path_root"]:
+            body = await request.json()
+            files = _resolve_paths(body.get("paths", []), request.app["path_root"])
+        else:
+            return _error(400, "Send files as multipart/form-data.")
+
+        if not files:
+            return _error(400, "No files received.")
+        batcher.unreserve(reserved)
+        reserved = 0
+        if len(files) > batcher.free_slots(): raise _queue_full()
+
+        pending = len(files)
+        futures = [batcher.submit(file_path, release) for _, file_path in files]
+    except web.HTTPTooManyRequests:
+        batcher.engine.metrics.inc("service_rejected_total")
+        raise
+    finally:
+        batcher.unreserve(reserved)
+        if not pending: await loop.run_in_executor(None, shutil.rmtree, directory, True)
+
+    # Cancelling the gather (client disconnect) cancels every future, and the batcher skips those files.
+    results = await asyncio.gather(*futures)
+    return web.json_response(
+        [utils.format_output(filename, result) for (filename, _), result in zip(files, results)],
+        dumps=lambda data: json.dumps(data, ensure_ascii=False)
+    )
+
+async def metrics_endpoint(request):
+    batcher = request.app.get("batcher")
+    if batcher is None:
+        return web.Response(body=b"", headers={"Content-Type": METRICS_CONTENT_TYPE})
+    batcher.engine.metrics.set("service_queue_depth", batcher.queue.qsize())
+    return web.Response(body=batcher.engine.metrics.render().encode("utf-8"), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+async def health(request):
+    if request.app.get("load_error"): return _load_failed(request.app)
+    return web.json_response({"status": "ok"})
+
+async def ready(request):
+    batcher = request.app.get("batcher")
+    if request.app.get("load_error"): return _load_failed(request.app)
+    if batcher is None:
+        return web.json_response({"status": "carregando"}, status=503)
+    return web.json_response({
+        "status": "pronto",
+        "fila": batcher.queue.qsize(),
+        "capacidade_fila": batcher.queue.maxsize,
+        "lotes": batcher.batches,
+        "documentos": batcher.documents
+    })
+
+def _blocking(function, *args):
+    # SQLite queries and file copies run on the default thread pool so they never stall the event loop.
+    return asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+async def _job_queue(request):
+    job_queue = request.app["job_queue"]
+    job_id = request.match_info["job_id"]
+    status = await _blocking(job_queue.status, job_id)
+    if status is None:
+        raise web.HTTPNotFound(text=json.dumps({"erro": f"Job not found: {job_id}"}), content_type="application/json")
+    return job_queue, job_id, status
+
+async def submit_job(request):
+    if not request.content_type.startswith("multipart/"):
+        return _error(400, "Send a ZIP or DANFE files as multipart/form-data.")
+
+    job_queue = request.app["job_queue"]
+
+    def submit(files):
+        # The ZIP is read while it is copied into the job folder, so extraction happens here too.
+        job_id = job_queue.submit(jobs.iter_documents(
+            [file_path for _, file_path in files], ACCEPTED_EXTENSIONS, request.app["max_zip_members"], request.app["max_zip_mb"]
+        ))
+        return job_queue.status(job_id)
+
+    directory = tempfile.mkdtemp(prefix="nfe_job_")
+    try:
+        files = await _read_uploads(request, directory, ACCEPTED_EXTENSIONS + (".zip",))
+        status = await _blocking(submit, files)
+    except jobs.SubmissionTooLarge as e:
+        return _error(413, str(e))
+    except (ValueError, zipfile.BadZipFile) as e:
+        return _error(400, str(e))
+    finally:
+        await _blocking(shutil.rmtree, directory, True)
+
+    return web.json_response(status, status=202)
+
+async def job_status(request):
+    _, _, status = await _job_queue(request)
+    return web.json_response(status)
+
+async def job_events(request):
+    job_queue, job_id, status = await _job_queue(request)
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+
+    last = None
+    while True:
+        progress = (status["status"], status["concluidos"])
+        if progress != last:
+            await response.write((json.dumps(status) + "\n").encode("utf-8"))
+            last = progress
+        if status["status"] == "concluido": break
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        status = await _blocking(job_queue.status, job_id)
+
+    await response.write_eof()
+    return response
+
+async def job_results(request):
+    job_queue, job_id, _ = await _job_queue(request)
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    rows = job_queue.results(job_id)
+    while lines := await _blocking(lambda: list(itertools.islice(rows, RESULTS_PAGE_SIZE))):
+        await response.write("".join(line + "\n" for line in lines).encode("utf-8"))
+    await response.write_eof()
+    return response
+
+async def _start(app):
+    async def load():
+        try:
+            engine = app["engine"] or await asyncio.get_running_loop().run_in_executor(None, lambda: NFeProcessor(**app["engine_kwargs"]))
+        except Exception as e:
+            # Kept for /health and /ready, which answer 500 so the orchestrator restarts the service.
+            app["load_error"] = e
+            print("Model failed to load:", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+            return
+        batcher = MicroBatcher(engine, app["max_batch_size"], app["max_wait_ms"], app["queue_size"])
+        app["batcher"] = batcher
+        await batcher.run()
+    app["batcher_task"] = asyncio.create_task(load())
+
+async def _stop(app):
+    app["batcher_task"].cancel()
+    if app.get("batcher"): app["batcher"].close()
+
+def create_app(engine=None, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, queue_size=QUEUE_SIZE,
+               path_root=None, max_upload_mb=MAX_UPLOAD_MB, job_queue=None, max_zip_members=jobs.MAX_ZIP_MEMBERS,
+               max_zip_mb=jobs.MAX_ZIP_MB, **engine_kwargs):
+    app = web.Application(client_max_size=max_upload_mb * 1024 * 1024)
+    app.update(
+        engine=engine, engine_kwargs=engine_kwargs, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+        queue_size=queue_size, max_upload_bytes=max_upload_mb * 1024 * 1024, job_queue=job_queue,
+        max_zip_members=max_zip_members, max_zip_mb=max_zip_mb,
+        path_root=os.path.realpath(path_root) if path_root else None
+    )
+    app.router.add_post("/extract", extract)
+    app.router.add_get("/health", health)
+    app.router.add_get("/ready", ready)
+    app.router.add_get("/metrics", metrics_endpoint)
+    if job_queue:
+        app.router.add_post("/jobs", submit_job)
+        app.router.add_get("/jobs/{job_id}", job_status)
+        app.router.add_get("/jobs/{job_id}/events", job_events)
+        app.router.add_get("/jobs/{job_id}/results", job_results)
+    app.on_startup.append(_start)
+    app.on_cleanup.append(_stop)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço HTTP de extração de DANFEs")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=int, default=MAX_WAIT_MS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--path-root", default=None, help="Permite enviar caminhos de arquivos dentro desta pasta")
+    parser.add_argument("--max-upload-mb", type=int, default=MAX_UPLOAD_MB, help="Limite do total enviado por requisição")
+    parser.add_argument("--debug-timings", action="store_true", help="Inclui os tempos por etapa em metadados.tempos_ms")
+    parser.add_argument("--jobs-db", default=None, help="Ativa a API de jobs (/jobs) com a fila SQLite neste arquivo")
+    parser.add_argument("--jobs-storage", default=jobs.JOBS_DIR)
+    parser.add_argument("--max-zip-members", type=int, default=jobs.MAX_ZIP_MEMBERS)
+    parser.add_argument("--max-zip-mb", type=int, default=jobs.MAX_ZIP_MB, help="Limite do conteúdo descompactado dos ZIPs de /jobs")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processos de inferência (0 = uma thread); cada lote é dividido entre eles")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    args = parser.parse_args()
+
+    pool = None
+    if args.workers > 0:
+        from workers import WorkerPool
+
+        # Forked here, before the event loop and its threads exist.
+        pool = WorkerPool(args.workers, args.threads_per_worker, debug_timings=args.debug_timings)
+
+    web.run_app(
+        create_app(engine=pool, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                   queue_size=args.queue_size, path_root=args.path_root, max_upload_mb=args.max_upload_mb,
+                   job_queue=jobs.SQLiteJobQueue(args.jobs_db, args.jobs_storage) if args.jobs_db else None,
+                   max_zip_members=args.max_zip_members, max_zip_mb=args.max_zip_mb,
+                   debug_timings=args.debug_timings),
+        host=args.host, port=args.port
+    )
+    if pool: pool.close()
@@ -1,4 +1,6 @@
 import re
+import os
+import json
 import uuid
 from datetime import datetime
 
@@ -74,9 +76,69 @@ def clean_field(label, text):
         
     return text
 
+def _mod11_digit(digits, weights):
+    remainder = sum(int(d) * w for d, w in zip(digits, weights)) % 11
+    return 0 if remainder < 2 else 11 - remainder
+
+def validate_cnpj(text):
+    nums = re.sub(r'\D', '', text)
+    if len(nums) != 14 or len(set(nums)) == 1: return False
+    weights = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    return (_mod11_digit(nums[:12], weights[1:]) == int(nums[12])
+            and _mod11_digit(nums[:13], weights) == int(nums[13]))
+
+def validate_cpf(text):
+    nums = re.sub(r'\D', '', text)
+    if len(nums) != 11 or len(set(nums)) == 1: return False
+    return (_mod11_digit(nums[:9], range(10, 1, -1)) == int(nums[9])
+            and _mod11_digit(nums[:10], range(11, 1, -1)) == int(nums[10]))
+
+def validate_document(text):
+    return validate_cnpj(text) or validate_cpf(text)
+
+def access_key_check_digit(digits):
+    weights = [2 + (i % 8) for i in range(len(digits))][::-1]
+    return _mod11_digit(digits, weights)
+
+def validate_access_key(text):
+    nums = re.sub(r'\D', '', text)
+    return len(nums) == 44 and access_key_check_digit(nums[:43]) == int(nums[43])
+
+def decode_access_key(text):
+    nums = re.sub(r'\D', '', text or "")
+    if not validate_access_key(nums): return None
+
+    issuer = nums[6:20]
+    if not validate_cnpj(issuer) and issuer.startswith("000") and validate_cpf(issuer[3:]): issuer = issuer[3:]
+    return {
+        "uf": nums[0:2],
+        "ano_mes": nums[2:6],
+        "cnpj_emitente": issuer,
+        "modelo": nums[20:22],
+        "serie": nums[22:25],
+        "numero": nums[25:34],
+        "tipo_emissao": nums[34],
+        "codigo_numerico": nums[35:43],
+        "dv": nums[43]
+    }
+
+def validate_date(text):
+    try:
+        datetime.strptime(text, "%d/%m/%Y")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def validate_value(text):
+    return bool(re.fullmatch(r'\d{1,3}(?:\.\d{3})*,\d{2}', text or ""))
+
+def field_agreement(references, candidates, labels):
+    matches = sum(1 for ref, cand in zip(references, candidates) for label in labels if ref.get(label) == cand.get(label))
+    return matches / (len(references) * len(labels)) if references and labels else 0.0
+
 def format_output(filename, raw_data):
     if "erro" in raw_data:
-        return {
+        output = {
             "metadados": {
                 "arquivo": filename, 
                 "status": "erro", 
@@ -84,6 +146,8 @@ def format_output(filename, raw_data):
                 "data_processamento": datetime.now().isoformat()
             }
         }
+        if "tempos_ms" in raw_data: output["metadados"]["tempos_ms"] = raw_data["tempos_ms"]
+        return output
 
     issuer_doc = re.sub(r'\D', '', raw_data.get("CNPJ_EMITENTE", ""))
     recipient_doc = re.sub(r'\D', '', raw_data.get("CNPJ_DESTINATARIO", ""))
@@ -91,7 +155,7 @@ def format_output(filename, raw_data):
     issuer_type = "PJ" if len(issuer_doc) > 11 else "PF"
     recipient_type = "PJ" if len(recipient_doc) > 11 else "PF"
 
-    return {
+    output = {
         "metadados": {
             "id_transacao": str(uuid.uuid4()),
             "data_processamento": datetime.now().isoformat(),
@@ -120,4 +184,31 @@ def format_output(filename, raw_data):
                 "moeda": "BRL"
             }
         }
-    }
\ No newline at end of file
+    }
+    if "tempos_ms" in raw_data: output["metadados"]["tempos_ms"] = raw_data["tempos_ms"]
+    return output
+
+def load_processed_files(jsonl_path, include_errors=False):
+    if not os.path.exists(jsonl_path):
+        return set()
+
+    # Read line by line, so resuming a large JSONL does not load it into memory.
+    processed = set()
+    with open(jsonl_path, "rb+") as f:
+        offset = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                # Last line of a run that was killed mid-write.
+                f.truncate(offset)
+                break
+            offset += len(line)
+            try:
+                metadata = json.loads(line).get("metadados", {})
+            except ValueError:
+                continue
+            filename = metadata.get("arquivo_origem") or metadata.get("arquivo")
+            if not filename: continue
+            # Errors are retried unless include_errors; the latest line for a file decides.
+            if metadata.get("status") == "erro" and not include_errors: processed.discard(filename)
+            else: processed.add(filename)
+    return processed
\ No newline at end of file
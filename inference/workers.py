@@ -0,0 +1,92 @@
+import os
+import gc
+import torch
+import multiprocessing
+from inference import NFeProcessor
+
+WORKERS = max(1, (os.cpu_count() or 1) // 4)
+
+# Engines loaded in the parent, keyed by their arguments. A forked worker picks its pool's engine in _init_worker,
+# so pools built with different settings never share a model.
+_ENGINES = {}
+_ENGINE = None
+
+def _engine_key(engine_kwargs):
+    return repr(sorted(engine_kwargs.items()))
+
+def _init_worker(num_threads, engine_key):
+    global _ENGINE
+    _ENGINE = _ENGINES[engine_key]
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    if _ENGINE.result_cache:
+        _ENGINE.result_cache.reopen()
+
+def _process_chunk(file_paths):
+    # Metrics recorded in the child are sent back with the results and merged into the parent's engine.
+    return _ENGINE.process_batch(file_paths), _ENGINE.metrics.drain()
+
+def _collect(engine, chunk_results):
+    results = []
+    for chunk, chunk_metrics in chunk_results:
+        engine.metrics.merge(chunk_metrics)
+        results.extend(chunk)
+    return results
+
+class WorkerPool:
+    def __init__(self, workers=WORKERS, threads_per_worker=None, **engine_kwargs):
+        engine_key = _engine_key(engine_kwargs)
+        if engine_key not in _ENGINES:
+            _ENGINES[engine_key] = NFeProcessor(**engine_kwargs)
+
+        self.engine = _ENGINES[engine_key]
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+        gc.collect()
+        gc.freeze()
+        context = multiprocessing.get_context("fork")
+        self.pool = context.Pool(workers, initializer=_init_worker, initargs=(self.threads_per_worker, engine_key))
+
+    # Same interface as NFeProcessor, so the service batcher and the job worker take a pool in place of an engine.
+    @property
+    def metrics(self):
+        return self.engine.metrics
+
+    @property
+    def max_batch_size(self):
+        return self.engine.max_batch_size * self.workers
+
+    def process_batch(self, file_paths):
+        return self.map(file_paths)
+
+    def _chunks(self, file_paths):
+        # Split evenly so a batch of up to max_batch_size reaches every worker instead of filling the first ones.
+        size = min(self.engine.max_batch_size, max(1, -(-len(file_paths) // self.workers)))
+        return [file_paths[start:start + size] for start in range(0, len(file_paths), size)]
+
+    def imap(self, file_paths):
+        for chunk_result in self.pool.imap(_process_chunk, self._chunks(file_paths)):
+            yield from _collect(self.engine, [chunk_result])
+
+    def map(self, file_paths):
+        return list(self.imap(file_paths))
+
+    def submit(self, file_paths, callback=None, error_callback=None):
+        def flatten(chunk_results):
+            results = _collect(self.engine, chunk_results)
+            if callback: callback(results)
+        return self.pool.map_async(_process_chunk, self._chunks(file_paths), callback=flatten, error_callback=error_callback)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,143 @@
+import io
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import easyocr
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from label_studio_ml.utils import get_image_local_path
+from PIL import Image
+
+OCR_LANGUAGES = ['pt']
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", 2))
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", os.path.join(os.environ.get("MODEL_DIR", "."), "ocr_cache"))
+CACHE_VERSION = f"easyocr-{easyocr.__version__}-{'-'.join(OCR_LANGUAGES)}"
+
+# easyocr.Reader is not thread-safe, so each pool thread loads its own: OCR_WORKERS OCRs really run in parallel,
+# at the cost of one copy of the model per worker in memory.
+_LOCAL = threading.local()
+_LOAD_LOCK = threading.Lock()
+
+def _create_reader():
+    if torch.cuda.is_available():
+        try:
+            return easyocr.Reader(OCR_LANGUAGES, gpu=True)
+        except Exception as e:
+            print(f"Erro ao carregar EasyOCR na GPU ({type(e).__name__}: {e}). Usando a CPU.", flush=True)
+    return easyocr.Reader(OCR_LANGUAGES, gpu=False)
+
+def _load_reader():
+    # One at a time, so the first start does not download the same weights from several threads.
+    with _LOAD_LOCK:
+        print("Inicializando EasyOCR...", flush=True)
+        try:
+            _LOCAL.reader = _create_reader()
+        except Exception as e:
+            # Raised again, so the pool is marked broken and predict() fails loudly instead of returning empty tasks.
+            print(f"Erro ao carregar EasyOCR ({type(e).__name__}: {e}). Verifique a instalação.", flush=True)
+            raise
+        print("EasyOCR pronto.", flush=True)
+
+# Shared by every request, so concurrent imports never run more than OCR_WORKERS OCRs at once.
+POOL = ThreadPoolExecutor(max_workers=OCR_WORKERS, initializer=_load_reader)
+
+def cache_path(digest):
+    return os.path.join(OCR_CACHE_DIR, CACHE_VERSION, digest[:2], f"{digest}.json")
+
+def load_cached(digest):
+    path = cache_path(digest)
+    if not os.path.exists(path): return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_cached(digest, entry):
+    path = cache_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(temp_path, path)
+
+def run_ocr(image_path):
+    with open(image_path, "rb") as f:
+        data = f.read()
+
+    digest = hashlib.sha256(data).hexdigest()
+    entry = load_cached(digest)
+    if entry is not None: return entry, True
+
+    # Image.open only parses the header; decoding the pixels is left to EasyOCR.
+    with Image.open(io.BytesIO(data)) as img:
+        img_width, img_height = img.size
+
+    results = _LOCAL.reader.readtext(image_path, detail=1)
+    entry = {
+        "width": img_width,
+        "height": img_height,
+        "results": [([[float(pt[0]), float(pt[1])] for pt in bbox], text, float(confidence)) for bbox, text, confidence in results]
+    }
+    save_cached(digest, entry)
+    return entry, False
+
+def to_regions(entry):
+    img_width, img_height = entry["width"], entry["height"]
+    result_items = []
+
+    for (bbox, text, confidence) in entry["results"]:
+        if not text.strip(): continue # Ignora vazio
+
+        # --- GEOMETRIA ---
+        x_min = min([pt[0] for pt in bbox])
+        y_min = min([pt[1] for pt in bbox])
+        x_max = max([pt[0] for pt in bbox])
+        y_max = max([pt[1] for pt in bbox])
+
+        # Converte para % do Label Studio
+        x = (x_min / img_width) * 100
+        y = (y_min / img_height) * 100
+        w = ((x_max - x_min) / img_width) * 100
+        h = ((y_max - y_min) / img_height) * 100
+
+        # --- CRIAÇÃO DO OBJETO ---
+        region_id = str(uuid.uuid4())[:10]
+
+        # Apenas TRANSCRICÃO (Texto), sem rótulo (Label)
+        # Isso cria a caixa clicável com o texto dentro
+        result_items.append({
+            "id": region_id,
+            "from_name": "transcription",
+            "to_name": "image",
+            "type": "textarea",
+            "value": {
+                "x": x, "y": y, "width": w, "height": h,
+                "rotation": 0, "text": [text]
+            }
+        })
+    return result_items
+
+def predict_task(task):
+    start = time.perf_counter()
+    image_url = task['data']['image']
+    try:
+        # 1. Carrega Imagem
+        image_path = get_image_local_path(image_url)
+        if not os.path.exists(image_path):
+            print(f"Imagem não encontrada: {image_url}", flush=True)
+            return {"result": []}
+
+        # 2. Roda EasyOCR (ou reaproveita o cache)
+        entry, cached = run_ocr(image_path)
+        result_items = to_regions(entry)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"OCR {image_url}: {elapsed:.0f} ms, {len(result_items)} regiões{' (cache)' if cached else ''}", flush=True)
+        return {"result": result_items}
+
+    except Exception as e:
+        print(f"Erro no OCR: {image_url}: {e}", flush=True)
+        return {"result": []}
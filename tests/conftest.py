@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scripts import their siblings by name (import utils, from collator import ...), as when run from their folder.
+for folder in ("inference", "training"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+# Appended: dataset_generation has its own pipeline.py, and the inference one must win for "import pipeline".
+sys.path.append(os.path.join(ROOT, "dataset_generation"))
@@ -0,0 +1,62 @@
+import utils
+import rules
+
+KEY = "35261008754291000115555950003109761810303630"
+
+def build_key(issuer, serie="001", numero="000000042"):
+    digits = f"352405{issuer:0>14}55{serie}{numero}112345678"
+    return digits + str(utils.access_key_check_digit(digits))
+
+def test_decode_access_key():
+    key = utils.decode_access_key(" ".join(KEY[i:i + 4] for i in range(0, 44, 4)))
+    assert key == {
+        "uf": "35",
+        "ano_mes": "2610",
+        "cnpj_emitente": "08754291000115",
+        "modelo": "55",
+        "serie": "595",
+        "numero": "000310976",
+        "tipo_emissao": "1",
+        "codigo_numerico": "81030363",
+        "dv": "0"
+    }
+
+def test_decode_access_key_strips_the_padding_of_a_cpf_issuer():
+    key = utils.decode_access_key(build_key("52998224725"))
+    assert key["cnpj_emitente"] == "52998224725"
+
+def test_decode_access_key_rejects_a_bad_check_digit():
+    assert utils.decode_access_key(KEY[:43] + "1") is None
+    assert utils.decode_access_key(KEY[:40]) is None
+    assert utils.decode_access_key(None) is None
+
+def test_apply_access_key_fills_missing_fields():
+    data = {"CHAVE_ACESSO": KEY}
+    assert rules.apply_access_key(data) == []
+    assert data["CNPJ_EMITENTE"] == "08.754.291/0001-15"
+    assert data["NUM_SERIE"] == "595"
+    assert data["NUM_NOTA_FISCAL"] == "000.310.976"
+
+def test_apply_access_key_prints_the_series_unpadded():
+    data = {"CHAVE_ACESSO": build_key("11222333000181", serie="001")}
+    rules.apply_access_key(data)
+    assert data["NUM_SERIE"] == "1"
+
+def test_apply_access_key_keeps_matching_fields_as_read():
+    data = {"CHAVE_ACESSO": build_key("11222333000181", serie="001"), "NUM_SERIE": "001",
+            "NUM_NOTA_FISCAL": "000.000.042", "CNPJ_EMITENTE": "11.222.333/0001-81", "DATA_EMISSAO": "15/05/2024"}
+    assert rules.apply_access_key(data) == []
+    assert data["NUM_SERIE"] == "001"
+
+def test_apply_access_key_overrides_mismatches():
+    data = {"CHAVE_ACESSO": KEY, "CNPJ_EMITENTE": "11.222.333/0001-81", "NUM_SERIE": "595",
+            "NUM_NOTA_FISCAL": "000.310.979", "DATA_EMISSAO": "01/09/2026"}
+    assert rules.apply_access_key(data) == ["CNPJ_EMITENTE", "NUM_NOTA_FISCAL", "DATA_EMISSAO"]
+    assert data["CNPJ_EMITENTE"] == "08.754.291/0001-15"
+    assert data["NUM_NOTA_FISCAL"] == "000.310.976"
+    assert data["DATA_EMISSAO"] == "01/09/2026"
+
+def test_apply_access_key_ignores_an_invalid_key():
+    data = {"CHAVE_ACESSO": KEY[:43] + "1", "NUM_SERIE": "7"}
+    assert rules.apply_access_key(data) == []
+    assert data == {"CHAVE_ACESSO": KEY[:43] + "1", "NUM_SERIE": "7"}
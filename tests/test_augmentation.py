@@ -0,0 +1,24 @@
+import cv2
+import numpy as np
+import image_augmentation
+
+BOXES = [[0.1, 0.1, 0.3, 0.2], [0.5, 0.5, 0.9, 0.6], [0.05, 0.8, 0.95, 0.9]]
+
+def augment(tmp_path, seed, name):
+    image_augmentation.transform.set_random_seed(seed)
+    output = str(tmp_path / name)
+    boxes = image_augmentation.augment_image(str(tmp_path / "page.png"), output, BOXES)
+    return boxes, cv2.imread(output)
+
+def test_seeded_runs_produce_the_same_image_and_boxes(tmp_path):
+    image = (np.random.RandomState(0).rand(300, 200, 3) * 255).astype(np.uint8)
+    cv2.imwrite(str(tmp_path / "page.png"), image)
+
+    runs = [augment(tmp_path, seed, f"aug_{i}.png") for i, seed in enumerate((123, 123, 7))]
+    assert runs[0][0] == runs[1][0]
+    assert np.array_equal(runs[0][1], runs[1][1])
+    assert runs[0][0] != runs[2][0] or not np.array_equal(runs[0][1], runs[2][1])
+
+    for index, box in runs[0][0]:
+        assert isinstance(index, int)
+        assert all(0.0 <= v <= 1.0 for v in box)
@@ -0,0 +1,22 @@
+import os
+import cache
+
+def write(path, data, mtime_ns=None):
+    with open(path, "wb") as f:
+        f.write(data)
+    if mtime_ns is not None: os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_small_files_are_fingerprinted_by_content(tmp_path):
+    write(tmp_path / "config.json", b'{"a": 1}', 10**18)
+    before = cache.directory_fingerprint(str(tmp_path))
+    write(tmp_path / "config.json", b'{"a": 2}', 10**18)
+    assert cache.directory_fingerprint(str(tmp_path)) != before
+
+def test_same_size_weights_change_the_fingerprint(tmp_path):
+    size = cache.FINGERPRINT_INLINE_LIMIT + 1
+    write(tmp_path / "model.safetensors", b"\0" * size, 10**18)
+    before = cache.directory_fingerprint(str(tmp_path))
+    assert cache.directory_fingerprint(str(tmp_path)) == before
+
+    write(tmp_path / "model.safetensors", b"\1" * size, 10**18 + 1)
+    assert cache.directory_fingerprint(str(tmp_path)) != before
@@ -0,0 +1,51 @@
+import numpy as np
+import torch
+from collator import LayoutLMv3Collator
+
+class FakeTokenizer:
+    pad_token_id = 1
+
+def feature(length, labels=True):
+    item = {
+        "input_ids": list(range(10, 10 + length)),
+        "attention_mask": [1] * length,
+        "bbox": [[i, i, i + 1, i + 1] for i in range(length)],
+        "pixel_values": np.full((3, 224, 224), length, dtype=np.float32),
+        "length": length
+    }
+    if labels: item["labels"] = [i % 3 for i in range(length)]
+    return item
+
+def test_pads_to_the_longest_sequence_rounded_to_a_multiple_of_8():
+    batch = LayoutLMv3Collator(FakeTokenizer())([feature(5), feature(11)])
+
+    assert set(batch) == {"input_ids", "attention_mask", "bbox", "labels", "pixel_values"}
+    assert batch["input_ids"].shape == (2, 16)
+    assert batch["bbox"].shape == (2, 16, 4)
+    assert batch["input_ids"][0].tolist() == list(range(10, 15)) + [1] * 11
+    assert batch["attention_mask"][0].tolist() == [1] * 5 + [0] * 11
+    assert batch["labels"][0].tolist() == [0, 1, 2, 0, 1] + [-100] * 11
+    assert batch["bbox"][0, 5:].abs().sum() == 0
+    assert batch["bbox"][1, 10].tolist() == [10, 10, 11, 11]
+    assert batch["input_ids"][1, 11:].tolist() == [1] * 5
+
+def test_pixel_values_are_stacked_as_float():
+    batch = LayoutLMv3Collator(FakeTokenizer())([feature(5), feature(11)])
+    assert batch["pixel_values"].shape == (2, 3, 224, 224)
+    assert batch["pixel_values"].dtype == torch.float32
+    assert batch["pixel_values"][1, 0, 0, 0] == 11
+
+def test_fixed_length_matches_the_old_max_length_padding():
+    collator = LayoutLMv3Collator(FakeTokenizer(), pad_to_multiple_of=None, pad_to_length=512)
+    batch = collator([feature(5)])
+    assert batch["input_ids"].shape == (1, 512)
+    assert batch["attention_mask"].sum() == 5
+
+def test_exact_multiple_is_not_padded_further():
+    batch = LayoutLMv3Collator(FakeTokenizer())([feature(8), feature(3)])
+    assert batch["input_ids"].shape == (2, 8)
+
+def test_features_without_labels():
+    batch = LayoutLMv3Collator(FakeTokenizer())([feature(4, labels=False)])
+    assert "labels" not in batch
+    assert batch["input_ids"].shape == (1, 8)
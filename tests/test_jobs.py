@@ -0,0 +1,142 @@
+import io
+import os
+import time
+import zipfile
+import pytest
+from jobs import SQLiteJobQueue, SubmissionTooLarge, iter_documents, process_job
+
+LEASE = 0.2
+
+@pytest.fixture
+def job_queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"), str(tmp_path / "arquivos"), lease_seconds=LEASE)
+
+def submit(job_queue, count=3):
+    return job_queue.submit((f"nota_{i}.pdf", io.BytesIO(b"%PDF-" + bytes([i]))) for i in range(count))
+
+def result(filename, status="sucesso"):
+    return {"arquivo": filename, "metadados": {"status": status}}
+
+def test_submit_stores_the_documents(job_queue):
+    job_id = submit(job_queue)
+    pending = job_queue.pending_documents(job_id)
+    assert [(idx, filename) for idx, filename, _ in pending] == [(0, "nota_0.pdf"), (1, "nota_1.pdf"), (2, "nota_2.pdf")]
+    assert all(os.path.exists(path) for _, _, path in pending)
+    assert job_queue.status(job_id)["status"] == "pendente"
+
+def test_empty_submission_is_rejected(job_queue):
+    with pytest.raises(ValueError):
+        job_queue.submit([])
+    assert os.listdir(job_queue.storage_dir) == []
+
+def test_claimed_job_is_not_given_to_another_worker(job_queue):
+    job_id = submit(job_queue)
+    assert job_queue.claim("w1") == job_id
+    assert job_queue.claim("w2") is None
+    assert job_queue.status(job_id)["status"] == "processando"
+
+def test_same_worker_reclaims_its_job_at_once(job_queue):
+    job_id = submit(job_queue)
+    assert job_queue.claim("w1") == job_id
+    assert job_queue.claim("w1") == job_id
+
+def test_complete_keeps_only_pending_documents(job_queue):
+    job_id = submit(job_queue)
+    job_queue.claim("w1")
+    assert job_queue.complete(job_id, "w1", [(0, result("nota_0.pdf")), (1, result("nota_1.pdf", "erro"))])
+    assert [idx for idx, _, _ in job_queue.pending_documents(job_id)] == [2]
+
+    status = job_queue.status(job_id)
+    assert (status["concluidos"], status["erros"], status["progresso"]) == (2, 1, 0.6667)
+
+def test_expired_lease_is_taken_over_by_another_worker(job_queue):
+    job_id = submit(job_queue)
+    job_queue.claim("w1")
+    assert job_queue.complete(job_id, "w1", [(0, result("nota_0.pdf"))])
+
+    time.sleep(LEASE * 1.5)
+    assert job_queue.claim("w2") == job_id
+
+    # The old worker can neither store results nor finish the job, and leaves the files to the new owner.
+    assert not job_queue.complete(job_id, "w1", [(1, result("nota_1.pdf"))])
+    assert not job_queue.finish(job_id, "w1")
+    assert [idx for idx, _, _ in job_queue.pending_documents(job_id)] == [1, 2]
+    assert os.path.isdir(os.path.join(job_queue.storage_dir, job_id))
+
+    assert job_queue.complete(job_id, "w2", [(1, result("nota_1.pdf")), (2, result("nota_2.pdf"))])
+    assert job_queue.finish(job_id, "w2")
+    assert not os.path.exists(os.path.join(job_queue.storage_dir, job_id))
+    assert job_queue.status(job_id)["status"] == "concluido"
+    assert [row for row in job_queue.results(job_id)] == [
+        '{"arquivo": "nota_0.pdf", "metadados": {"status": "sucesso"}}',
+        '{"arquivo": "nota_1.pdf", "metadados": {"status": "sucesso"}}',
+        '{"arquivo": "nota_2.pdf", "metadados": {"status": "sucesso"}}'
+    ]
+
+def test_complete_renews_the_lease(job_queue):
+    job_id = submit(job_queue)
+    job_queue.claim("w1")
+    time.sleep(LEASE * 0.75)
+    assert job_queue.complete(job_id, "w1", [(0, result("nota_0.pdf"))])
+    time.sleep(LEASE * 0.75)
+    assert job_queue.claim("w2") is None
+
+def test_finished_job_is_not_claimed_again(job_queue):
+    job_id = submit(job_queue, count=1)
+    job_queue.claim("w1")
+    job_queue.complete(job_id, "w1", [(0, result("nota_0.pdf"))])
+    assert job_queue.finish(job_id, "w1")
+    assert job_queue.claim("w1") is None
+    assert not job_queue.finish(job_id, "w1")
+
+class FakeEngine:
+    max_batch_size = 2
+
+    def __init__(self):
+        self.batches = []
+
+    def process_batch(self, paths):
+        self.batches.append(paths)
+        return [{"NUM_SERIE": "1"} for _ in paths]
+
+def test_process_job_stores_every_batch(job_queue):
+    job_id = submit(job_queue)
+    job_queue.claim("w1")
+    engine = FakeEngine()
+    assert process_job(job_queue, engine, job_id, "w1")
+    assert [len(batch) for batch in engine.batches] == [2, 1]
+    assert job_queue.status(job_id)["concluidos"] == 3
+
+def test_process_job_stops_when_the_lease_is_lost(job_queue):
+    job_id = submit(job_queue)
+    job_queue.claim("w1")
+
+    class TakenOver(FakeEngine):
+        def process_batch(self, paths):
+            time.sleep(LEASE * 1.5)
+            assert job_queue.claim("w2") == job_id
+            return super().process_batch(paths)
+
+    engine = TakenOver()
+    assert not process_job(job_queue, engine, job_id, "w1")
+    assert len(engine.batches) == 1
+    assert len(job_queue.pending_documents(job_id)) == 3
+    assert os.path.isdir(os.path.join(job_queue.storage_dir, job_id))
+
+def make_zip(path, count, size):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for i in range(count):
+            archive.writestr(f"lote/nota_{i}.pdf", b"\0" * size)
+    return str(path)
+
+def test_zip_within_the_limits_is_extracted(job_queue, tmp_path):
+    archive = make_zip(tmp_path / "lote.zip", 3, 1000)
+    job_id = job_queue.submit(iter_documents([archive], (".pdf",), max_members=3, max_mb=1))
+    assert len(job_queue.pending_documents(job_id)) == 3
+
+@pytest.mark.parametrize("count, size", [(4, 10), (2, 600 * 1024)])
+def test_zip_over_the_limits_is_rejected_before_extraction(job_queue, tmp_path, count, size):
+    archive = make_zip(tmp_path / "lote.zip", count, size)
+    with pytest.raises(SubmissionTooLarge):
+        job_queue.submit(iter_documents([archive], (".pdf",), max_members=3, max_mb=1))
+    assert os.listdir(job_queue.storage_dir) == []
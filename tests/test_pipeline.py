@@ -0,0 +1,55 @@
+import threading
+from contextlib import nullcontext
+import pytest
+import metrics
+from pipeline import PipelineEngine
+
+class FakeEngine:
+    debug_timings = False
+    result_cache = None
+
+    def __init__(self, fail_stage=None):
+        self.fail_stage = fail_stage
+        self.metrics = metrics.Metrics()
+
+    def _fail(self, stage):
+        if stage == self.fail_stage: raise MemoryError(f"{stage} failed")
+
+    def _track(self, timings=None): pass
+    def _timed(self, stage): return nullcontext()
+    def rule_report(self): return {}
+    def timing_report(self): return {}
+
+    def _load_pages(self, file_path):
+        return [file_path]
+
+    def _recognize(self, file_path, pages):
+        return {"pages": pages}
+
+    def _apply_rules(self, document):
+        return None
+
+    def _encode(self, page):
+        return page
+
+    def _infer(self, encodings, timings=None):
+        self._fail("model")
+        return [[1] for _ in encodings], {}
+
+    def _decode(self, document, encodings, predictions):
+        return {"NUM_SERIE": document["pages"][0]}
+
+def run(engine, count=20):
+    pipeline = PipelineEngine(engine, load_workers=2, queue_size=2, batch_size=4, batch_timeout_ms=5)
+    return pipeline, sorted(pipeline.run([f"nota_{i}.pdf" for i in range(count)]))
+
+def test_pipeline_returns_every_document():
+    pipeline, results = run(FakeEngine())
+    assert [result["NUM_SERIE"] for _, _, result in results] == [f"nota_{i}.pdf" for i in range(20)]
+    assert pipeline.stats()["etapas"]["model"]["itens"] == 20
+
+def test_stage_failure_is_raised_by_run():
+    before = threading.active_count()
+    with pytest.raises(MemoryError, match="model failed"):
+        run(FakeEngine(fail_stage="model"))
+    assert threading.active_count() == before
@@ -0,0 +1,22 @@
+import json
+import utils
+
+def line(filename, status="sucesso"):
+    key = "arquivo" if status == "erro" else "arquivo_origem"
+    return json.dumps({"metadados": {key: filename, "status": status}}) + "\n"
+
+def test_missing_file_has_nothing_processed(tmp_path):
+    assert utils.load_processed_files(str(tmp_path / "resultados.jsonl")) == set()
+
+def test_errors_are_retried_unless_included(tmp_path):
+    path = tmp_path / "resultados.jsonl"
+    path.write_text(line("a.pdf") + line("b.pdf", "erro") + "not json\n" + line("c.pdf", "erro") + line("c.pdf"))
+    assert utils.load_processed_files(str(path)) == {"a.pdf", "c.pdf"}
+    assert utils.load_processed_files(str(path), include_errors=True) == {"a.pdf", "b.pdf", "c.pdf"}
+
+def test_incomplete_last_line_is_dropped(tmp_path):
+    path = tmp_path / "resultados.jsonl"
+    content = line("a.pdf") + line("b.pdf")
+    path.write_text(content + line("c.pdf")[:20])
+    assert utils.load_processed_files(str(path)) == {"a.pdf", "b.pdf"}
+    assert path.read_text() == content
@@ -0,0 +1,89 @@
+import os
+import asyncio
+import tempfile
+import zipfile
+import pytest
+from aiohttp import FormData
+from aiohttp.test_utils import TestClient, TestServer
+import metrics
+import service
+from jobs import SQLiteJobQueue
+
+class FakeEngine:
+    def __init__(self):
+        self.metrics = metrics.Metrics()
+
+    def process_batch(self, file_paths):
+        return [{"NUM_SERIE": str(os.path.getsize(path))} for path in file_paths]
+
+def upload(*files):
+    data = FormData()
+    for name, size in files:
+        data.add_field("file", b"0" * size, filename=name)
+    return data
+
+async def request(app, path, data):
+    async with TestClient(TestServer(app)) as client:
+        while "batcher" not in app: await asyncio.sleep(0.01)
+        response = await client.post(path, data=data)
+        return response.status, await response.json(), app["batcher"]
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "tmp"
+    directory.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(directory))
+    return directory
+
+def test_extract_accepts_uploads_within_the_limit(temp_dir):
+    app = service.create_app(FakeEngine(), max_upload_mb=1)
+    status, body, batcher = asyncio.run(request(app, "/extract", upload(("a.pdf", 1000), ("b.png", 2000))))
+    assert status == 200
+    assert [item["nfe"]["informacoes_gerais"]["serie"] for item in body] == ["1000", "2000"]
+    assert batcher.reserved == 0
+
+def test_extract_rejects_an_upload_over_the_limit(temp_dir):
+    app = service.create_app(FakeEngine(), max_upload_mb=1)
+    status, body, batcher = asyncio.run(request(app, "/extract", upload(("a.pdf", 600 * 1024), ("b.pdf", 600 * 1024))))
+    assert status == 413
+    assert "erro" in body
+    assert batcher.reserved == 0
+    assert batcher.queue.qsize() == 0
+    assert os.listdir(temp_dir) == []
+
+def test_jobs_reject_an_upload_over_the_limit(tmp_path, temp_dir):
+    job_queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), str(tmp_path / "arquivos"))
+    app = service.create_app(FakeEngine(), max_upload_mb=1, job_queue=job_queue)
+    status, _, _ = asyncio.run(request(app, "/jobs", upload(("lote.zip", 2 * 1024 * 1024))))
+    assert status == 413
+    assert os.listdir(temp_dir) == []
+    assert os.listdir(job_queue.storage_dir) == []
+
+def test_failed_model_load_is_reported(capsys):
+    # NFeProcessor rejects the unknown option before loading anything.
+    app = service.create_app(max_upload_mb=1, unknown_option=True)
+
+    async def probe():
+        async with TestClient(TestServer(app)) as client:
+            while "load_error" not in app: await asyncio.sleep(0.01)
+            return [(response.status, await response.json()) for response in
+                    [await client.get("/ready"), await client.get("/health"), await client.post("/extract", data=upload(("a.pdf", 10)))]]
+
+    for status, body in asyncio.run(probe()):
+        assert status == 500
+        assert body["erro"].startswith("Model failed to load: TypeError")
+    assert "Model failed to load" in capsys.readouterr().err
+
+def test_jobs_reject_a_zip_that_expands_past_the_limit(tmp_path, temp_dir):
+    bomb = tmp_path / "bomb.zip"
+    with zipfile.ZipFile(bomb, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("nota.pdf", b"\0" * 3 * 1024 * 1024)
+    job_queue = SQLiteJobQueue(str(tmp_path / "jobs.db"), str(tmp_path / "arquivos"))
+    app = service.create_app(FakeEngine(), job_queue=job_queue, max_zip_mb=2)
+
+    data = FormData()
+    data.add_field("file", bomb.read_bytes(), filename="lote.zip")
+    status, body, _ = asyncio.run(request(app, "/jobs", data))
+    assert status == 413
+    assert "2 MB" in body["erro"]
+    assert os.listdir(job_queue.storage_dir) == []
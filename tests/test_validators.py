@@ -0,0 +1,54 @@
+import pytest
+import utils
+
+@pytest.mark.parametrize("text, expected", [
+    ("11.222.333/0001-81", True),
+    ("11222333000181", True),
+    ("11.222.333/0001-82", False),
+    ("11.222.333/0001-8", False),
+    ("00.000.000/0000-00", False),
+    ("", False)
+])
+def test_validate_cnpj(text, expected):
+    assert utils.validate_cnpj(text) is expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("529.982.247-25", True),
+    ("52998224725", True),
+    ("529.982.247-24", False),
+    ("111.111.111-11", False),
+    ("529.982.247", False)
+])
+def test_validate_cpf(text, expected):
+    assert utils.validate_cpf(text) is expected
+
+def test_validate_document_accepts_cnpj_or_cpf():
+    assert utils.validate_document("11.222.333/0001-81")
+    assert utils.validate_document("529.982.247-25")
+    assert not utils.validate_document("529.982.247-24")
+    assert not utils.validate_document("NOTA FISCAL")
+
+@pytest.mark.parametrize("text, expected", [
+    ("29/02/2024", True),
+    ("31/12/2023", True),
+    ("29/02/2023", False),
+    ("31/02/2024", False),
+    ("2024-02-29", False),
+    ("", False),
+    (None, False)
+])
+def test_validate_date(text, expected):
+    assert utils.validate_date(text) is expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("0,99", True),
+    ("1.234,56", True),
+    ("1.234.567,89", True),
+    ("1234,56", False),
+    ("1.234,5", False),
+    ("1,234.56", False),
+    ("R$ 1.234,56", False),
+    (None, False)
+])
+def test_validate_value(text, expected):
+    assert utils.validate_value(text) is expected
@@ -0,0 +1,81 @@
+import pytest
+from inference import NFeProcessor, MAX_SEQ_LENGTH
+
+BUDGET = MAX_SEQ_LENGTH - 2
+
+def make_engine(window_stride):
+    # Only the windowing helpers are exercised, so no OCR reader or model is loaded.
+    engine = NFeProcessor.__new__(NFeProcessor)
+    engine.window_stride = window_stride
+    return engine
+
+def word_spans(lengths):
+    # Token 0 is <s>, as in the tokenizer output the spans come from.
+    spans, position = {}, 1
+    for word_id, length in enumerate(lengths):
+        spans[word_id] = [position, position + length]
+        position += length
+    return spans
+
+def test_without_stride_keeps_a_single_truncated_window():
+    engine = make_engine(None)
+    assert engine._window_spans(word_spans([1] * 10)) == [(1, 11)]
+    assert engine._window_spans(word_spans([1] * 1000)) == [(1, BUDGET + 1)]
+    assert engine._window_spans({}) == [(1, 1)]
+
+def test_short_page_fits_in_one_window():
+    assert make_engine(128)._window_spans(word_spans([2] * 100)) == [(1, 201)]
+
+@pytest.mark.parametrize("lengths", [[1] * 1200, [3] * 700, [1, 4, 2, 7] * 150])
+def test_windows_cover_every_token_and_overlap_on_word_boundaries(lengths):
+    spans = word_spans(lengths)
+    starts = {start for start, _ in spans.values()}
+    windows = make_engine(128)._window_spans(spans)
+
+    assert len(windows) > 1
+    assert windows[0][0] == 1 and windows[-1][1] == sum(lengths) + 1
+    for (start, end), (next_start, next_end) in zip(windows, windows[1:]):
+        assert end - start <= BUDGET
+        assert next_start in starts
+        assert start < next_start < end <= next_end
+        assert end - next_start <= 128
+    assert windows[-1][1] - windows[-1][0] <= BUDGET
+
+def test_word_longer_than_the_budget_is_cut():
+    windows = make_engine(128)._window_spans(word_spans([2, BUDGET + 50, 2]))
+    assert windows[0] == (1, 3)
+    assert windows[1] == (3, 3 + BUDGET)
+    assert windows[-1] == (3 + BUDGET + 50, 5 + BUDGET + 50)
+
+def test_merge_keeps_each_word_from_its_most_confident_window():
+    # <s> w0 w1 w1 w2 </s>; the first window holds w0-w1, the second w1-w2.
+    encoding = {
+        "input_ids": [0, 10, 11, 12, 13, 2],
+        "bbox": [[0, 0, 0, 0], [1, 1, 1, 1], [2, 2, 2, 2], [3, 3, 3, 3], [4, 4, 4, 4], [0, 0, 0, 0]],
+        "word_ids": [None, 0, 1, 1, 2, None],
+        "windows": [
+            {"input_ids": [0, 10, 11, 12, 2], "offset": 0},
+            {"input_ids": [0, 11, 12, 13, 2], "offset": 1}
+        ]
+    }
+    predictions = [
+        ([0.0, 0.9, 0.5, 0.5, 0.0], [0, 1, 2, 2, 0]),
+        ([0.0, 0.8, 0.8, 0.7, 0.0], [0, 3, 3, 4, 0])
+    ]
+
+    merged = make_engine(128)._merge_windows(encoding, predictions)
+
+    assert merged["input_ids"] == [10, 11, 12, 13]
+    assert merged["bbox"] == [[1, 1, 1, 1], [2, 2, 2, 2], [3, 3, 3, 3], [4, 4, 4, 4]]
+    assert merged["preds"] == [1, 3, 3, 4]
+    assert merged["scores"] == [0.9, 0.8, 0.8, 0.7]
+
+def test_merge_of_a_single_window_is_the_window_without_special_tokens():
+    encoding = {
+        "input_ids": [0, 10, 11, 2],
+        "bbox": [[0, 0, 0, 0], [1, 1, 1, 1], [2, 2, 2, 2], [0, 0, 0, 0]],
+        "word_ids": [None, 0, 1, None],
+        "windows": [{"input_ids": [0, 10, 11, 2], "offset": 0}]
+    }
+    merged = make_engine(None)._merge_windows(encoding, [([0.0, 0.6, 0.7, 0.0], [0, 5, 6, 0])])
+    assert merged == {"input_ids": [10, 11], "bbox": [[1, 1, 1, 1], [2, 2, 2, 2]], "scores": [0.6, 0.7], "preds": [5, 6]}
@@ -0,0 +1,107 @@
+import json
+import time
+import argparse
+import resource
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import torch
+from torch.utils.data import DataLoader, RandomSampler
+from datasets import load_from_disk
+from transformers import AutoModelForTokenClassification, AutoProcessor
+from transformers.trainer_pt_utils import LengthGroupedSampler
+from collator import LayoutLMv3Collator
+
+DATASET_PATH = "processed_dataset"
+MODEL_ID = "microsoft/layoutlmv3-base"
+OUTPUT_PATH = "padding_benchmark.json"
+NUM_LABELS = 10
+MAX_LENGTH = 512
+BATCH_SIZE = 2
+STEPS = 30
+WARMUP_STEPS = 3
+LEARNING_RATE = 0.00002
+SEED = 7
+
+# "max_length" reproduces the old setup: every row padded to 512 in random order.
+MODES = ["max_length", "dinamico"]
+
+def run_mode(mode, dataset_path, batch_size, steps, warmup_steps, seed):
+    torch.manual_seed(seed)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    dataset = load_from_disk(dataset_path).with_format("torch")
+    tokenizer = AutoProcessor.from_pretrained(MODEL_ID, apply_ocr=False).tokenizer
+    model = AutoModelForTokenClassification.from_pretrained(MODEL_ID, num_labels=NUM_LABELS).to(device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=LEARNING_RATE)
+
+    generator = torch.Generator().manual_seed(seed)
+    if mode == "dinamico":
+        sampler = LengthGroupedSampler(batch_size, lengths=dataset["length"].tolist(), generator=generator)
+        collator = LayoutLMv3Collator(tokenizer)
+    else:
+        sampler = RandomSampler(dataset, generator=generator)
+        collator = LayoutLMv3Collator(tokenizer, pad_to_length=MAX_LENGTH)
+    loader = DataLoader(dataset, batch_size=batch_size, sampler=sampler, collate_fn=collator)
+
+    model.train()
+    samples = padded_tokens = real_tokens = 0
+    # The sampler is reshuffled on every pass, so short datasets are cycled until enough steps have run.
+    batches = itertools.chain.from_iterable(itertools.repeat(loader))
+    for step, batch in enumerate(itertools.islice(batches, warmup_steps + steps)):
+        if step == warmup_steps:
+            if device == "cuda":
+                torch.cuda.synchronize()
+                torch.cuda.reset_peak_memory_stats()
+            start = time.perf_counter()
+
+        batch = {key: value.to(device) for key, value in batch.items()}
+        with torch.autocast(device_type=device, dtype=torch.float16, enabled=device == "cuda"):
+            loss = model(**batch).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad(set_to_none=True)
+
+        if step >= warmup_steps:
+            samples += batch["input_ids"].shape[0]
+            padded_tokens += batch["attention_mask"].numel()
+            real_tokens += int(batch["attention_mask"].sum())
+
+    if device == "cuda": torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "amostras_por_s": round(samples / elapsed, 3),
+        "tokens_por_lote": round(padded_tokens / steps, 1),
+        "fracao_padding": round(1 - real_tokens / padded_tokens, 4) if padded_tokens else 0.0,
+        # On GPU the peak of allocated tensors; on CPU the process peak RSS (ru_maxrss is in KiB on Linux).
+        "pico_memoria_mb": round(
+            torch.cuda.max_memory_allocated() / 2**20 if device == "cuda" else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "dispositivo": device
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara padding até 512 com padding dinâmico + agrupamento por tamanho")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--steps", type=int, default=STEPS)
+    parser.add_argument("--warmup-steps", type=int, default=WARMUP_STEPS)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    report = {"config": {"batch_size": args.batch_size, "passos": args.steps}, "modos": {}}
+    for mode in MODES:
+        # A fresh process per mode, so the peak memory of one does not carry into the other.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            report["modos"][mode] = executor.submit(
+                run_mode, mode, args.dataset, args.batch_size, args.steps, args.warmup_steps, SEED
+            ).result()
+
+    static, dynamic = report["modos"]["max_length"], report["modos"]["dinamico"]
+    report["speedup"] = round(dynamic["amostras_por_s"] / static["amostras_por_s"], 3)
+    report["memoria_economizada_mb"] = round(static["pico_memoria_mb"] - dynamic["pico_memoria_mb"], 1)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    print(json.dumps(report, indent=4, ensure_ascii=False))
@@ -0,0 +1,38 @@
+import torch
+
+PAD_TO_MULTIPLE_OF = 8
+LABEL_PAD_TOKEN_ID = -100
+
+class LayoutLMv3Collator:
+    # Pads each batch to its longest sequence (rounded up to a multiple of 8 for fp16 kernels) instead of a fixed
+    # 512. input_ids, attention_mask, bbox and labels are padded; pixel_values are always 3x224x224 and only stacked.
+    def __init__(self, tokenizer, pad_to_multiple_of=PAD_TO_MULTIPLE_OF, pad_to_length=None, label_pad_token_id=LABEL_PAD_TOKEN_ID):
+        self.pad_token_id = tokenizer.pad_token_id
+        self.pad_to_multiple_of = pad_to_multiple_of
+        self.pad_to_length = pad_to_length
+        self.label_pad_token_id = label_pad_token_id
+
+    def __call__(self, features):
+        lengths = [len(f["input_ids"]) for f in features]
+        length = self.pad_to_length or max(lengths)
+        if self.pad_to_multiple_of:
+            length = -(-length // self.pad_to_multiple_of) * self.pad_to_multiple_of
+
+        size = len(features)
+        batch = {
+            "input_ids": torch.full((size, length), self.pad_token_id, dtype=torch.long),
+            "attention_mask": torch.zeros((size, length), dtype=torch.long),
+            "bbox": torch.zeros((size, length, 4), dtype=torch.long)
+        }
+        if "labels" in features[0]:
+            batch["labels"] = torch.full((size, length), self.label_pad_token_id, dtype=torch.long)
+
+        # Only the model inputs are copied, so extra columns such as "length" never reach forward().
+        for i, (feature, n) in enumerate(zip(features, lengths)):
+            batch["input_ids"][i, :n] = torch.as_tensor(feature["input_ids"])
+            batch["attention_mask"][i, :n] = torch.as_tensor(feature["attention_mask"])
+            batch["bbox"][i, :n] = torch.as_tensor(feature["bbox"])
+            if "labels" in batch: batch["labels"][i, :n] = torch.as_tensor(feature["labels"])
+
+        batch["pixel_values"] = torch.stack([torch.as_tensor(f["pixel_values"], dtype=torch.float32) for f in features])
+        return batch
@@ -1,18 +1,33 @@
 import json
+import os
 import re
+import time
+import resource
+import argparse
+import numpy as np
 from pathlib import Path
 from PIL import Image
-from datasets import Dataset, Features, Sequence, ClassLabel, Value, Array2D, Array3D
+from datasets import Dataset, Features, Sequence, ClassLabel, Value, Array3D
+from datasets import Image as ImageFeature
 from transformers import AutoProcessor
 import warnings
 warnings.filterwarnings("ignore")
 
-JSON_FILE = "annotations.json" 
-IMAGE_FOLDER = "nfes/" 
+JSON_FILE = "annotations.json"
+IMAGE_FOLDER = "nfes/"
+AUTO_LABELS_FILE = "auto_labels.jsonl"
+OUTPUT_PATH = "processed_dataset"
 MODEL_ID = "microsoft/layoutlmv3-base"
+MAX_LENGTH = 512
+
+NUM_PROC = max(1, (os.cpu_count() or 1) // 2)
+# Each row in a map batch holds a decoded page (~26 MB at 300 dpi), so batches stay small.
+MAP_BATCH_SIZE = 8
+# Rows buffered before they are flushed to the Arrow file; one processed row is ~0.6 MB, almost all pixel_values.
+WRITER_BATCH_SIZE = 64
 
 LABELS_LIST = [
-    "O", 
+    "O",
     "CHAVE_ACESSO",
     "NOME_EMITENTE",
     "CNPJ_EMITENTE",
@@ -24,6 +39,17 @@ LABELS_LIST = [
     "NUM_SERIE"
 ]
 
+label2id = {label: i for i, label in enumerate(LABELS_LIST)}
+id2label = {i: label for i, label in enumerate(LABELS_LIST)}
+
+# Images are stored as paths and only decoded inside map, one batch at a time.
+RAW_FEATURES = Features({
+    'image': ImageFeature(),
+    'tokens': Sequence(feature=Value(dtype='string')),
+    'bboxes': Sequence(feature=Sequence(feature=Value(dtype='int64'))),
+    'ner_tags': Sequence(feature=ClassLabel(names=LABELS_LIST)),
+})
+
 def clean_text_content(label, text):
     text = text.strip()
     if label == "NUM_NOTA_FISCAL":
@@ -32,7 +58,8 @@ def clean_text_content(label, text):
         return re.sub(r'(?i)^(s[ée]rie|ser\.)\s*', '', text).strip()
     return text
 
-def normalize_box(box, width, height):
+def normalize_box(box):
+    # Label Studio boxes are percentages of the page.
     x, y, w, h = box
     x1 = int(x * 10)
     y1 = int(y * 10)
@@ -40,18 +67,27 @@ def normalize_box(box, width, height):
     y2 = int((y + h) * 10)
     return [max(0, min(1000, val)) for val in [x1, y1, x2, y2]]
 
-def load_and_fix_data():
-    import urllib.parse 
+def check_image(image_path):
+    # Image.open only parses the header: broken files are skipped here without decoding the pixels.
+    try:
+        with Image.open(image_path):
+            return True
+    except Exception as e:
+        print(f"Erro ao abrir imagem {image_path}: {e}")
+        return False
+
+def iter_annotations():
+    import urllib.parse
+
+    if not os.path.exists(JSON_FILE): return
 
     with open(JSON_FILE, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    processed_data = []
-
     for item in data:
-        image_path = item['data']['image'] 
-        raw_filename = Path(image_path).name.split('?')[0] 
-        
+        image_path = item['data']['image']
+        raw_filename = Path(image_path).name.split('?')[0]
+
         candidates = []
         candidates.append(raw_filename)
         if '-' in raw_filename:
@@ -63,12 +99,14 @@ def load_and_fix_data():
             p = Path(IMAGE_FOLDER) / candidate
             if p.exists():
                 full_image_path = p
-                break 
-        
+                break
+
         if not full_image_path:
             print(f"Erro: Imagem nao encontrada: {candidates}")
             continue
 
+        if not check_image(full_image_path): continue
+
         id_to_text = {}
         id_to_label = {}
         id_to_box = {}
@@ -84,15 +122,7 @@ def load_and_fix_data():
 
         words = []
         boxes = []
-        ner_tags = [] 
-
-        try:
-            image = Image.open(full_image_path).convert("RGB")
-        except Exception as e:
-            print(f"Erro ao abrir imagem {full_image_path}: {e}")
-            continue
-
-        w, h = image.size
+        ner_tags = []
 
         for item_id, label in id_to_label.items():
             if item_id in id_to_text:
@@ -101,74 +131,125 @@ def load_and_fix_data():
 
                 raw_text = id_to_text[item_id]
                 clean_text = clean_text_content(label, raw_text)
-                
+
                 if not clean_text: continue
 
                 words.append(clean_text)
-                boxes.append(normalize_box(id_to_box[item_id], w, h))
-                ner_tags.append(label)
+                boxes.append(normalize_box(id_to_box[item_id]))
+                ner_tags.append(label2id[label])
 
-        processed_data.append({
-            "image": image, 
+        yield {
+            "image": str(full_image_path.resolve()),
             "tokens": words,
             "bboxes": boxes,
-            "ner_tags": ner_tags 
-        })
-
-    return processed_data
+            "ner_tags": ner_tags
+        }
+
+def iter_auto_labels():
+    # Records written by dataset_generation/auto_label.py: same tokens/bboxes/ner_tags, boxes already on the 0-1000 scale.
+    if not os.path.exists(AUTO_LABELS_FILE): return
+
+    base_dir = Path(AUTO_LABELS_FILE).parent
+    with open(AUTO_LABELS_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            image_path = base_dir / record['image']
+            if not check_image(image_path): continue
+
+            words, boxes, ner_tags = [], [], []
+            for text, box, label in zip(record['tokens'], record['bboxes'], record['ner_tags']):
+                clean_text = clean_text_content(label, text)
+                if not clean_text: continue
+                words.append(clean_text)
+                boxes.append(box)
+                ner_tags.append(label2id.get(label, 0))
 
-raw_data = load_and_fix_data()
+            yield {"image": str(image_path.resolve()), "tokens": words, "bboxes": boxes, "ner_tags": ner_tags}
 
-label2id = {label: i for i, label in enumerate(LABELS_LIST)}
-id2label = {i: label for i, label in enumerate(LABELS_LIST)}
+def iter_examples(signature):
+    yield from iter_annotations()
+    yield from iter_auto_labels()
 
-formatted_data = []
-for entry in raw_data:
-    formatted_data.append({
-        "image": entry['image'],
-        "tokens": entry['tokens'],
-        "bboxes": entry['bboxes'],
-        "ner_tags": [label2id[label] for label in entry['ner_tags']]
-    })
-
-ds = Dataset.from_list(formatted_data)
+def source_signature():
+    # from_generator caches by the generator's arguments; this makes a changed annotation file rebuild the dataset.
+    return ";".join(
+        f"{path}:{os.path.getmtime(path)}:{os.path.getsize(path)}" for path in (JSON_FILE, AUTO_LABELS_FILE) if os.path.exists(path)
+    )
 
 processor = AutoProcessor.from_pretrained(MODEL_ID, apply_ocr=False)
 
 def prepare_dataset(examples):
-    images = examples["image"]
+    images = [image.convert("RGB") for image in examples["image"]]
     words = examples["tokens"]
     boxes = examples["bboxes"]
     word_labels = examples["ner_tags"]
 
+    # Stored unpadded: collator.py pads each training batch to its own longest sequence.
     encoding = processor(
         images,
         words,
         boxes=boxes,
         word_labels=word_labels,
         truncation=True,
-        padding="max_length",
-        max_length=512
+        padding=False,
+        max_length=MAX_LENGTH
     )
+    # Recent transformers releases return one torch tensor per page here, which the Array3D column does not take.
+    encoding["pixel_values"] = [np.asarray(values, dtype=np.float32) for values in encoding["pixel_values"]]
+    encoding["length"] = [len(ids) for ids in encoding["input_ids"]]
     return encoding
 
 features = Features({
     'pixel_values': Array3D(dtype="float32", shape=(3, 224, 224)),
     'input_ids': Sequence(feature=Value(dtype='int64')),
     'attention_mask': Sequence(feature=Value(dtype='int64')),
-    'bbox': Array2D(dtype="int64", shape=(512, 4)),
+    'bbox': Sequence(feature=Sequence(feature=Value(dtype='int64'), length=4)),
     'labels': Sequence(feature=Value(dtype='int64')),
+    'length': Value(dtype='int64'),
 })
 
-train_dataset = ds.map(
-    prepare_dataset,
-    batched=True,
-    remove_columns=ds.column_names,
-    features=features
-)
-
-print("Dataset pronto para treinamento")
-print(train_dataset)
-
-train_dataset.save_to_disk("processed_dataset")
-print("Salvo em processed_dataset")
\ No newline at end of file
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; RUSAGE_CHILDREN is the largest of the map worker processes.
+    return {
+        "principal": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monta o dataset do LayoutLMv3 a partir das anotações")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--num-proc", type=int, default=NUM_PROC)
+    parser.add_argument("--batch-size", type=int, default=MAP_BATCH_SIZE, help="Páginas decodificadas por lote no map")
+    parser.add_argument("--writer-batch-size", type=int, default=WRITER_BATCH_SIZE, help="Linhas em memória antes de gravar no Arrow")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ds = Dataset.from_generator(
+        iter_examples, features=RAW_FEATURES, gen_kwargs={"signature": source_signature()},
+        writer_batch_size=args.writer_batch_size
+    )
+    print(f"{len(ds)} páginas encontradas em {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    train_dataset = ds.map(
+        prepare_dataset,
+        batched=True,
+        batch_size=args.batch_size,
+        num_proc=args.num_proc,
+        writer_batch_size=args.writer_batch_size,
+        remove_columns=ds.column_names,
+        features=features
+    )
+    elapsed = time.perf_counter() - start
+
+    print("Dataset pronto para treinamento")
+    print(train_dataset)
+    print(json.dumps({
+        "linhas": len(train_dataset),
+        "linhas_por_s": round(len(train_dataset) / elapsed, 2) if elapsed else 0.0,
+        "tempo_s": round(elapsed, 1),
+        "rss_pico_mb": peak_rss_mb()
+    }, ensure_ascii=False))
+
+    train_dataset.save_to_disk(args.output)
+    print(f"Salvo em {args.output}")
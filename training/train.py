@@ -1,8 +1,8 @@
 import torch
 from datasets import load_from_disk
 from transformers import AutoModelForTokenClassification, TrainingArguments, Trainer
-from transformers import DataCollatorForTokenClassification
 from transformers import AutoProcessor
+from collator import LayoutLMv3Collator
 import numpy as np
 import evaluate
 import warnings
@@ -33,7 +33,8 @@ label2id = {label: i for i, label in enumerate(LABELS_LIST)}
 
 print("Carregando dataset...")
 try:
-    full_dataset = load_from_disk(DATASET_PATH)
+    # Torch format hands the collator tensors instead of nested lists (pixel_values alone are 150k floats per row).
+    full_dataset = load_from_disk(DATASET_PATH).with_format("torch")
     
     dataset_split = full_dataset.train_test_split(test_size=0.2, seed=7)
     
@@ -91,15 +92,14 @@ training_args = TrainingArguments(
     save_strategy="epoch",
     save_total_limit=1,       
     eval_strategy="epoch", 
-    remove_unused_columns=False 
+    remove_unused_columns=False,
+    # Batches of pages with similar token counts, so little of each step is spent on padding.
+    group_by_length=True,
+    length_column_name="length"
 )
 
 
-data_collator = DataCollatorForTokenClassification(
-    tokenizer=processor.tokenizer,
-    padding="longest",
-    return_tensors="pt"
-)
+data_collator = LayoutLMv3Collator(processor.tokenizer)
 
 trainer = Trainer(
     model=model,
@@ -112,7 +112,9 @@ trainer = Trainer(
 )
 
 print(f"Iniciando treinamento na GPU: {torch.cuda.get_device_name(0)}")
-trainer.train()
+train_result = trainer.train()
+print(f"Amostras/s no treino: {train_result.metrics['train_samples_per_second']}")
+print(f"Pico de memória na GPU: {torch.cuda.max_memory_allocated() / 2**20:.0f} MB")
 
 trainer.save_model(OUTPUT_DIR)
 processor.save_pretrained(OUTPUT_DIR) 